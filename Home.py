@@ -1,5 +1,6 @@
 # Home.py
-import pathlib, streamlit as st
+import streamlit as st
+import storage
 
 st.set_page_config(page_title="EduApp — AI Translation Lab", layout="wide")
 
@@ -22,6 +23,7 @@ st.subheader("Jump straight in")
 col1, col2, col3 = st.columns(3)
 with col1:
     st.page_link("pages/0_Health_Check.py", label="🩺 Health Check")
+    st.page_link("pages/0_Performance.py", label="⏱️ Performance")
     st.page_link("pages/MT_Lab.py", label="🔁 MT Lab")
 with col2:
     st.page_link("pages/Prompt_Lab.py", label="🧭 Prompt Lab")
@@ -30,4 +32,4 @@ with col3:
     st.page_link("pages/Dashboard.py", label="📊 Dashboard")
     st.page_link("pages/Admin.py", label="🛠️ Admin")
 
-pathlib.Path("data").mkdir(parents=True, exist_ok=True)
+storage.ensure_root()
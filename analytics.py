@@ -0,0 +1,223 @@
+# analytics.py
+"""
+Incrementally maintained class analytics (data/eduapp.db).
+
+Every submission updates running counts and metric sums per student, per item and
+per day; late-arriving scores (background scoring, post-edit metrics) add to the
+same sums. Ticket progress per student (assigned / submitted / points) is refreshed
+from the indexed tickets table whenever one of that student's tickets changes.
+The Dashboard reads these small tables, so its cost does not grow with the number
+of submissions. rebuild_all() recomputes everything from the raw data.
+"""
+
+from __future__ import annotations
+import math, time, logging
+from typing import Any, Dict, Iterable, Optional
+from db import DB_PATH, connect, transaction
+from lazy import lazy_import
+
+pd = lazy_import("pandas")
+log = logging.getLogger(__name__)
+
+SCOPES = ("student", "item", "day")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS agg_count (
+    scope TEXT NOT NULL, key TEXT NOT NULL,
+    submissions INTEGER NOT NULL DEFAULT 0,
+    last_ts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (scope, key)
+);
+CREATE TABLE IF NOT EXISTS agg_metric (
+    scope TEXT NOT NULL, key TEXT NOT NULL, metric TEXT NOT NULL,
+    n INTEGER NOT NULL DEFAULT 0,
+    total REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (scope, key, metric)
+);
+CREATE TABLE IF NOT EXISTS agg_item_student (
+    item TEXT NOT NULL, student TEXT NOT NULL,
+    PRIMARY KEY (item, student)
+);
+CREATE TABLE IF NOT EXISTS agg_submission (
+    submission_id TEXT PRIMARY KEY,
+    student TEXT NOT NULL, item TEXT NOT NULL, day TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS agg_meta (
+    key TEXT PRIMARY KEY, value TEXT
+);
+CREATE TABLE IF NOT EXISTS agg_ticket_student (
+    student TEXT PRIMARY KEY,
+    assigned INTEGER NOT NULL DEFAULT 0,
+    submitted INTEGER NOT NULL DEFAULT 0,
+    points_assigned INTEGER NOT NULL DEFAULT 0,
+    points_earned INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+_ready: set = set()
+
+
+def _conn(path: str = DB_PATH):
+    conn = connect(path)
+    if path not in _ready:
+        conn.executescript(_SCHEMA)
+        _ready.add(path)
+    return conn
+
+
+def _metric_values(row: Dict[str, Any]) -> Dict[str, float]:
+    """Finite numeric metric_* values in a row."""
+    out = {}
+    for k, v in row.items():
+        if not k.startswith("metric_"):
+            continue
+        try:
+            f = float(v)
+        except (TypeError, ValueError):
+            continue
+        if math.isfinite(f):
+            out[k[len("metric_"):]] = f
+    return out
+
+
+def _keys(row: Dict[str, Any]) -> Dict[str, str]:
+    ts = int(float(row.get("timestamp") or time.time()))
+    item_id = row.get("ticket_id") if row.get("mode") == "ticket" else row.get("item_id")
+    return {
+        "student": str(row.get("student") or "") or "(anonymous)",
+        "item": f"{row.get('mode') or 'pairs'}:{'' if item_id is None else item_id}",
+        "day": time.strftime("%Y-%m-%d", time.gmtime(ts)),
+        "ts": ts,
+    }
+
+
+def _add_metrics(c, keys: Dict[str, str], metrics: Dict[str, float]):
+    c.executemany(
+        "INSERT INTO agg_metric(scope, key, metric, n, total) VALUES (?, ?, ?, 1, ?) "
+        "ON CONFLICT(scope, key, metric) DO UPDATE SET n = n + 1, total = total + excluded.total",
+        [(scope, keys[scope], m, v) for scope in SCOPES for m, v in metrics.items()],
+    )
+
+
+def _add_submission(c, row: Dict[str, Any]):
+    keys = _keys(row)
+    c.executemany(
+        "INSERT INTO agg_count(scope, key, submissions, last_ts) VALUES (?, ?, 1, ?) "
+        "ON CONFLICT(scope, key) DO UPDATE SET submissions = submissions + 1, "
+        "last_ts = MAX(last_ts, excluded.last_ts)",
+        [(scope, keys[scope], keys["ts"]) for scope in SCOPES],
+    )
+    c.execute("INSERT OR IGNORE INTO agg_item_student(item, student) VALUES (?, ?)",
+              (keys["item"], keys["student"]))
+    if row.get("submission_id"):
+        c.execute("INSERT OR REPLACE INTO agg_submission(submission_id, student, item, day) VALUES (?, ?, ?, ?)",
+                  (str(row["submission_id"]), keys["student"], keys["item"], keys["day"]))
+    _add_metrics(c, keys, _metric_values(row))
+
+
+# ------------- Incremental updates -------------
+def record_submission(row: Dict[str, Any], path: str = DB_PATH):
+    """Fold one new results row into the aggregates. Never raises."""
+    try:
+        _conn(path)
+        with transaction(path) as c:
+            _add_submission(c, row)
+    except Exception as e:  # analytics must never block a student's submit
+        log.warning("analytics.record_submission failed: %s", e)
+
+
+def record_metrics(submission_id: str, metrics: Dict[str, Any], path: str = DB_PATH):
+    """Add late-arriving metric_* values for an already-recorded submission. Never raises."""
+    try:
+        values = _metric_values(metrics)
+        if not values:
+            return
+        conn = _conn(path)
+        r = conn.execute("SELECT student, item, day FROM agg_submission WHERE submission_id = ?",
+                         (str(submission_id),)).fetchone()
+        if r is None:
+            return
+        with transaction(path) as c:
+            _add_metrics(c, {"student": r["student"], "item": r["item"], "day": r["day"]}, values)
+    except Exception as e:
+        log.warning("analytics.record_metrics failed: %s", e)
+
+
+def refresh_ticket_stats(students: Optional[Iterable[str]] = None, path: str = DB_PATH):
+    """
+    Recompute ticket progress for `students` (or everyone) from the tickets table.
+    Per-student refreshes use the (assigned_to, status) index.
+    """
+    try:
+        import tickets_db
+        tickets_db.init_db(path)
+        _conn(path)
+        sql = ("SELECT assigned_to, COUNT(*), SUM(status = 'submitted'), SUM(points), "
+               "SUM(CASE WHEN status = 'submitted' THEN points ELSE 0 END) FROM tickets "
+               "WHERE assigned_to <> ''")
+        with transaction(path) as c:
+            if students is None:
+                c.execute("DELETE FROM agg_ticket_student")
+                rows = c.execute(sql + " GROUP BY assigned_to").fetchall()
+            else:
+                names = [s for s in set(students) if s]
+                if not names:
+                    return
+                marks = ", ".join("?" for _ in names)
+                c.execute(f"DELETE FROM agg_ticket_student WHERE student IN ({marks})", names)
+                rows = c.execute(sql + f" AND assigned_to IN ({marks}) GROUP BY assigned_to", names).fetchall()
+            c.executemany("INSERT INTO agg_ticket_student VALUES (?, ?, ?, ?, ?)",
+                          [tuple(int(v or 0) if i else v for i, v in enumerate(r)) for r in rows])
+    except Exception as e:
+        log.warning("analytics.refresh_ticket_stats failed: %s", e)
+
+
+def needs_rebuild(path: str = DB_PATH) -> bool:
+    """True until rebuild_all() has run once against this database."""
+    return _conn(path).execute("SELECT 1 FROM agg_meta WHERE key = 'built_at'").fetchone() is None
+
+
+def rebuild_all(results: Any, path: str = DB_PATH):
+    """Recompute every aggregate from a full results DataFrame (first run, or after an import)."""
+    _conn(path)
+    with transaction(path) as c:
+        for t in ("agg_count", "agg_metric", "agg_item_student", "agg_submission"):
+            c.execute(f"DELETE FROM {t}")
+        for row in results.to_dict("records"):
+            _add_submission(c, {k: v for k, v in row.items() if not (isinstance(v, float) and v != v)})
+        c.execute("INSERT OR REPLACE INTO agg_meta(key, value) VALUES ('built_at', ?)", (str(int(time.time())),))
+    refresh_ticket_stats(path=path)
+
+
+# ------------- Reads (constant cost w.r.t. submissions) -------------
+def scope_table(scope: str, path: str = DB_PATH):
+    """Submissions, last activity and mean of every metric for one scope, one row per key."""
+    if scope not in SCOPES:
+        raise ValueError(f"scope must be one of {SCOPES}")
+    conn = _conn(path)
+    counts = pd.DataFrame([dict(r) for r in conn.execute(
+        "SELECT key, submissions, last_ts FROM agg_count WHERE scope = ? ORDER BY key", (scope,))],
+        columns=["key", "submissions", "last_ts"])
+    means = pd.DataFrame([dict(r) for r in conn.execute(
+        "SELECT key, metric, total / n AS mean FROM agg_metric WHERE scope = ? AND n > 0", (scope,))],
+        columns=["key", "metric", "mean"])
+    if not means.empty:
+        wide = means.pivot(index="key", columns="metric", values="mean").round(3)
+        wide.columns = [f"mean_{c}" for c in wide.columns]
+        counts = counts.merge(wide, left_on="key", right_index=True, how="left")
+    if scope == "item":
+        students = pd.DataFrame([dict(r) for r in conn.execute(
+            "SELECT item AS key, COUNT(*) AS students FROM agg_item_student GROUP BY item")],
+            columns=["key", "students"])
+        counts = counts.merge(students, on="key", how="left")
+    counts["last_ts"] = pd.to_datetime(counts["last_ts"], unit="s", utc=True)
+    return counts.rename(columns={"key": scope, "last_ts": "last_activity"})
+
+
+def ticket_progress(path: str = DB_PATH):
+    """Per-student ticket completion rate and points."""
+    conn = _conn(path)
+    df = pd.DataFrame([dict(r) for r in conn.execute("SELECT * FROM agg_ticket_student ORDER BY student")],
+                      columns=["student", "assigned", "submitted", "points_assigned", "points_earned"])
+    df["completion_rate"] = (df["submitted"] / df["assigned"].where(df["assigned"] > 0)).round(3)
+    return df
@@ -0,0 +1,234 @@
+# batch_mt.py
+"""
+Concurrent batch translation on top of the same prompt/caching rules as mt_openai.
+
+One pooled AsyncOpenAI client is shared by every request in a batch. Requests run
+under a concurrency limit and a tokens-per-minute budget, are retried with
+exponential backoff on rate-limit / transient errors, and results are streamed
+back as they complete. Cached translations (data/mt_cache.db) return immediately.
+
+    from batch_mt import translate_many
+    outputs = translate_many(df["source"].tolist(), concurrency=8)
+"""
+
+from __future__ import annotations
+import asyncio, copy, os, random, time
+from typing import Any, AsyncIterator, Callable, List, Optional, Sequence, Tuple
+import mt_cache
+import mt_backends
+import perf
+import utils_mt
+from utils_mt import DEFAULT_SYSTEM_PROMPT, glossary_hint
+
+BATCH_CONCURRENCY = int(os.getenv("MT_BATCH_CONCURRENCY", "8"))
+BATCH_TOKENS_PER_MINUTE = int(os.getenv("MT_BATCH_TPM", "150000"))
+BATCH_MAX_RETRIES = int(os.getenv("MT_BATCH_MAX_RETRIES", "5"))
+
+
+def estimate_tokens(*texts: str) -> int:
+    """Rough request cost: ~4 characters per token, doubled to cover the reply."""
+    return max(1, 2 * sum(len(t or "") for t in texts) // 4)
+
+
+class TokenBucket:
+    """Tokens-per-minute budget shared by all concurrent requests."""
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = float(max(1, tokens_per_minute))
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, n: int):
+        n = min(float(n), self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                await asyncio.sleep((n - self.tokens) / self.rate)
+
+
+def _is_retryable(exc: Exception) -> bool:
+    try:
+        import openai  # type: ignore
+    except Exception:
+        return False
+    if isinstance(exc, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError,
+                        openai.InternalServerError)):
+        return True
+    return isinstance(exc, openai.APIStatusError) and getattr(exc, "status_code", 0) in (409, 429)
+
+
+class BatchTranslator:
+    """Async translator holding one pooled client for the lifetime of a batch."""
+
+    def __init__(
+        self,
+        system_prompt: str = DEFAULT_SYSTEM_PROMPT,
+        terms: str = "",
+        model: str = "gpt-4o-mini",
+        concurrency: int = BATCH_CONCURRENCY,
+        tokens_per_minute: int = BATCH_TOKENS_PER_MINUTE,
+        max_retries: int = BATCH_MAX_RETRIES,
+        use_cache: bool = True,
+        client: Optional[Any] = None,
+    ):
+        self.system_prompt = system_prompt
+        self.terms = terms
+        self.model = model
+        self.max_retries = max_retries
+        self.use_cache = use_cache
+        self._client = client
+        self._owns_client = client is None
+        self._sem = asyncio.Semaphore(max(1, concurrency))
+        self._bucket = TokenBucket(tokens_per_minute)
+
+    def _get_client(self) -> Any:
+        if self._client is None:
+            from openai import AsyncOpenAI  # type: ignore
+            if not utils_mt.OPENAI_API_KEY:
+                raise RuntimeError("OpenAI key missing: add OPENAI_API_KEY in Streamlit Secrets")
+            # Our own backoff handles retries, so the SDK's are disabled
+            self._client = AsyncOpenAI(api_key=utils_mt.OPENAI_API_KEY,
+                                       base_url=utils_mt.OPENAI_BASE_URL or None, max_retries=0)
+        return self._client
+
+    def variant(self, **overrides: Any) -> "BatchTranslator":
+        """
+        Same client, concurrency limit and token budget with a different
+        system_prompt / terms / model, so a grid of prompts shares one set of limits.
+        """
+        try:
+            self._get_client()
+        except Exception:
+            pass  # each translate() reports the init error
+        v = copy.copy(self)
+        for k, val in overrides.items():
+            setattr(v, k, val)
+        v._owns_client = False
+        return v
+
+    async def aclose(self):
+        if self._client is not None and self._owns_client:
+            await self._client.close()
+            self._client = None
+
+    async def translate(self, text: str) -> str:
+        """Translate one text; returns the same "[OpenAI error: ...]" strings as mt_openai."""
+        if not (text or "").strip():
+            return ""
+        system = self.system_prompt + glossary_hint(self.terms, text)
+        key = mt_cache.fingerprint(self.model, system, text)
+        if self.use_cache:
+            cached = mt_cache.get(key)
+            if cached is not None:
+                return cached
+        else:
+            mt_cache.record_bypass()
+
+        try:
+            client = self._get_client()
+        except Exception as e:
+            return f"[OpenAI init error: {e}]"
+
+        attempt = 0
+        while True:
+            await self._bucket.acquire(estimate_tokens(system, text))
+            async with self._sem:
+                t0 = time.perf_counter()
+                try:
+                    resp = await client.chat.completions.create(
+                        model=self.model,
+                        messages=[
+                            {"role": "system", "content": system},
+                            {"role": "user", "content": text},
+                        ],
+                        temperature=0,
+                    )
+                    out = resp.choices[0].message.content.strip()
+                    perf.observe("batch_mt.request", time.perf_counter() - t0)
+                    perf.record_tokens(self.model, getattr(resp, "usage", None))
+                    break
+                except Exception as e:
+                    perf.observe("batch_mt.request", time.perf_counter() - t0, error=True)
+                    if attempt >= self.max_retries or not _is_retryable(e):
+                        return f"[OpenAI error: {e}]"
+            # Back off outside the semaphore so other requests keep flowing
+            await asyncio.sleep(min(30.0, 0.5 * 2 ** attempt) * (0.5 + random.random()))
+            attempt += 1
+
+        if self.use_cache:
+            mt_cache.put(key, self.model, out)
+        return out
+
+    async def stream(self, texts: Sequence[str]) -> AsyncIterator[Tuple[int, str]]:
+        """Yield (index, output) pairs in completion order."""
+        async def _one(i: int, t: str) -> Tuple[int, str]:
+            return i, await self.translate(t)
+
+        tasks = [asyncio.ensure_future(_one(i, t)) for i, t in enumerate(texts)]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                yield await fut
+        finally:
+            for t in tasks:
+                t.cancel()
+
+
+def translate_many(
+    texts: Sequence[str],
+    on_result: Optional[Callable[[int, str], None]] = None,
+    **kwargs: Any,
+) -> List[str]:
+    """
+    Translate `texts` concurrently and return outputs in input order.
+    `on_result(index, output)` is called as each one finishes (e.g. for a progress bar).
+    Keyword arguments are passed to BatchTranslator; `backend="marian"|"echo"` runs the
+    texts through that local backend instead (sequentially, same cache and glossary rules).
+    """
+    backend = (kwargs.pop("backend", None) or mt_backends.DEFAULT_BACKEND).lower()
+    if backend != "openai":
+        return _translate_local(texts, backend, on_result, **kwargs)
+
+    async def _run() -> List[str]:
+        bt = BatchTranslator(**kwargs)
+        out = [""] * len(texts)
+        try:
+            async for i, text in bt.stream(texts):
+                out[i] = text
+                if on_result:
+                    on_result(i, text)
+        finally:
+            await bt.aclose()
+        return out
+
+    return asyncio.run(_run())
+
+
+def _translate_local(texts: Sequence[str], backend: str,
+                     on_result: Optional[Callable[[int, str], None]] = None, **kwargs: Any) -> List[str]:
+    opts = {k: kwargs[k] for k in ("system_prompt", "terms", "model", "use_cache") if k in kwargs}
+    out = []
+    for i, text in enumerate(texts):
+        out.append(utils_mt.mt_openai(text, backend=backend, **opts) if (text or "").strip() else "")
+        if on_result:
+            on_result(i, out[-1])
+    return out
+
+
+def translate_dataframe(
+    df: Any,
+    text_col: str = "source",
+    out_col: str = "mt_output",
+    on_result: Optional[Callable[[int, str], None]] = None,
+    **kwargs: Any,
+) -> Any:
+    """Translate one DataFrame column into `out_col` (in place); returns the frame."""
+    texts = ["" if v is None or v != v else str(v) for v in df[text_col].tolist()]
+    df[out_col] = translate_many(texts, on_result=on_result, **kwargs)
+    return df
@@ -0,0 +1,393 @@
+# bench/load.py
+"""
+Classroom load test for the submission path.
+
+N simulated students hit the code that runs during a live class, all against a
+local OpenAI-compatible stub (mock_openai_server.py) and a throwaway data dir:
+
+  mt        utils_mt.mt_openai (cache bypassed)
+  score     metrics.score_all, fast tier
+  append    utils_mt.append_result           lost writes = rows missing afterwards
+  tickets   load_tickets readers + add_ticket writers   lost writes = tickets missing
+  claim     open_tickets + claim_ticket races           lost writes = double claims
+  submit    claim -> translate -> score -> append_result -> set_ticket_status
+  apptest   pages/MT_Lab.py in headless AppTest, one process per student
+
+Each scenario runs --runs times (default 3) and reports the median p50/p95/p99
+latency and throughput, plus errors and lost writes over all runs. With
+--save-baseline the numbers go to bench/baselines.json; later runs with the same
+settings fail (exit 1) on any lost write, or when p95 or a run's wall time grow by
+more than --tolerance plus --slack-ms. The absolute slack keeps the short,
+fsync-bound scenarios (tens of ms) from failing on scheduler noise. The committed
+baseline covers the defaults (10 students x 5 iterations, 200 ms stub latency) on a
+single-core dev box; re-record it with --save-baseline on different hardware.
+
+    python bench/load.py --students 20 --iterations 5
+    python bench/load.py --scenarios mt,submit --latency-ms 300 --save-baseline
+    python bench/load.py --scenarios apptest --students 4
+"""
+
+from __future__ import annotations
+import argparse, json, logging, os, random, statistics, subprocess, sys, tempfile, threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+SCENARIOS = ["mt", "score", "append", "tickets", "claim", "submit", "apptest"]
+
+SOURCES = [
+    "Please submit your application before the deadline.",
+    "Health authorities recommend drinking water regularly.",
+    "The museum will extend its opening hours during the festival.",
+    "The ministry announced a new policy for public schools.",
+]
+REFERENCE = "يرجى تقديم طلبك قبل الموعد النهائي."
+
+
+# ------------- Measurement -------------
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/max in milliseconds (nearest-rank) from latencies in seconds."""
+    if not samples:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+    s = sorted(samples)
+    def pick(q: float) -> float:
+        return round(1000 * s[min(len(s) - 1, max(0, int(round(q * len(s))) - 1))], 2)
+    return {"p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "max_ms": round(1000 * s[-1], 2)}
+
+
+def run_concurrent(students: int, iterations: int, op: Callable[[str, int], bool]) -> Dict[str, Any]:
+    """Run op(student, i) `iterations` times for each of `students` threads; op returns success."""
+    lat: List[float] = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def _student(k: int):
+        name = f"bench_{k:03d}"
+        for i in range(iterations):
+            t0 = time.perf_counter()
+            try:
+                ok = op(name, i)
+            except Exception:
+                ok = False
+            dt = time.perf_counter() - t0
+            with lock:
+                lat.append(dt)
+                errors[0] += 0 if ok else 1
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=students) as ex:
+        list(ex.map(_student, range(students)))
+    wall = time.perf_counter() - t0
+    return {"ops": len(lat), "errors": errors[0], "seconds": round(wall, 3),
+            "throughput_ops_s": round(len(lat) / wall, 2) if wall else 0.0, **percentiles(lat)}
+
+
+# ------------- In-process scenarios -------------
+def scenario_mt(args) -> Dict[str, Any]:
+    import utils_mt
+    utils_mt.mt_openai("warm up", use_cache=False)  # client construction is not part of the steady state
+    def op(student: str, i: int) -> bool:
+        out = utils_mt.mt_openai(f"{random.choice(SOURCES)} ({student}/{i})", use_cache=False)
+        return not out.startswith("[")
+    return run_concurrent(args.students, args.iterations, op)
+
+
+def scenario_score(args) -> Dict[str, Any]:
+    from metrics import score_all
+    score_all("warm up", "warm up", tiers=("fast",))
+    def op(student: str, i: int) -> bool:
+        return bool(score_all(random.choice(SOURCES), SOURCES[0], tiers=("fast",)))
+    return run_concurrent(args.students, args.iterations, op)
+
+
+def scenario_append(args) -> Dict[str, Any]:
+    import utils_mt
+    run_id = uuid.uuid4().hex
+    def op(student: str, i: int) -> bool:
+        utils_mt.append_result({"student": student, "mode": "bench", "item_id": i, "bench_run": run_id,
+                                "source": SOURCES[0], "mt_output": "x", "post_edit": f"{student} {i}"})
+        return True
+    r = run_concurrent(args.students, args.iterations, op)
+    df = utils_mt.load_results()
+    found = int((df["bench_run"] == run_id).sum()) if "bench_run" in df else 0
+    r["lost_writes"] = r["ops"] - r["errors"] - found
+    return r
+
+
+def scenario_tickets(args) -> Dict[str, Any]:
+    import utils_mt
+    run_id = uuid.uuid4().hex[:8]
+    written: List[str] = []
+    lock = threading.Lock()
+    def op(student: str, i: int) -> bool:
+        if i % 5 == 0:  # one writer call for every four reads
+            tid = f"L{run_id}-{student}-{i}"
+            utils_mt.add_ticket(tid, random.choice(SOURCES), reference=REFERENCE)
+            with lock:
+                written.append(tid)
+            return True
+        return not utils_mt.load_tickets().empty or i == 0
+    r = run_concurrent(args.students, args.iterations, op)
+    ids = set(utils_mt.load_tickets()["ticket_id"].astype(str))
+    r["lost_writes"] = sum(1 for t in written if t not in ids)
+    return r
+
+
+def _make_open_tickets(n: int, prefix: str) -> List[str]:
+    import utils_mt
+    df = utils_mt.pd.DataFrame([{"ticket_id": f"{prefix}{i:05d}", "source": random.choice(SOURCES),
+                                 "reference": REFERENCE, "status": "open", "assigned_to": ""} for i in range(n)])
+    utils_mt.import_tickets(df)
+    return df["ticket_id"].tolist()
+
+
+def scenario_claim(args) -> Dict[str, Any]:
+    import utils_mt, tickets_db
+    prefix = f"C{uuid.uuid4().hex[:6]}-"
+    _make_open_tickets(args.students * args.iterations, prefix)
+    wins: Dict[str, str] = {}
+    lock = threading.Lock()
+    def op(student: str, i: int) -> bool:
+        open_ids = [t for t in utils_mt.open_tickets()["ticket_id"].astype(str) if t.startswith(prefix)]
+        if not open_ids:
+            return True
+        tid = random.choice(open_ids[:max(1, args.students)])  # contend on the same few tickets
+        if utils_mt.claim_ticket(tid, student):
+            with lock:
+                if tid in wins:
+                    wins[tid] += "," + student  # two winners for one ticket = lost write
+                else:
+                    wins[tid] = student
+        return True
+    r = run_concurrent(args.students, args.iterations, op)
+    lost = 0
+    for tid, who in wins.items():
+        row = tickets_db.get_ticket(tid) or {}
+        lost += "," in who or row.get("assigned_to") != who
+    r["claims_won"] = len(wins)
+    r["lost_writes"] = lost
+    return r
+
+
+def scenario_submit(args) -> Dict[str, Any]:
+    import utils_mt
+    from metrics import score_all
+    prefix = f"S{uuid.uuid4().hex[:6]}-"
+    _make_open_tickets(args.students * args.iterations, prefix)
+    utils_mt.mt_openai("warm up", use_cache=False)
+    score_all("warm up", "warm up", tiers=("fast",))
+    run_id = uuid.uuid4().hex
+    done: List[str] = []
+    lock = threading.Lock()
+    def op(student: str, i: int) -> bool:
+        while True:  # like a student in MT Lab: pick an open ticket, try another if someone beat us to it
+            open_ids = [t for t in utils_mt.open_tickets()["ticket_id"].astype(str) if t.startswith(prefix)]
+            if not open_ids:
+                return False
+            tid = random.choice(open_ids[:max(1, args.students)])
+            if utils_mt.claim_ticket(tid, student):
+                break
+        row = utils_mt.get_ticket(tid)
+        mt = utils_mt.mt_openai(row["source"], use_cache=False)
+        scores = score_all(mt, row["reference"], tiers=("fast",))
+        utils_mt.append_result({"student": student, "mode": "ticket", "ticket_id": tid, "bench_run": run_id,
+                                "source": row["source"], "reference": row["reference"], "mt_output": mt,
+                                "post_edit": mt, **{f"metric_{k}": v for k, v in scores.items()}})
+        utils_mt.set_ticket_status(tid, "submitted", student)
+        with lock:
+            done.append(tid)
+        return not mt.startswith("[")
+    r = run_concurrent(args.students, args.iterations, op)
+    df = utils_mt.load_results()
+    rows = int((df["bench_run"] == run_id).sum()) if "bench_run" in df else 0
+    tix = utils_mt.load_tickets()
+    submitted = int(((tix["ticket_id"].astype(str).str.startswith(prefix)) & (tix["status"] == "submitted")).sum())
+    r["lost_writes"] = (len(done) - rows) + (len(set(done)) - submitted)
+    return r
+
+
+# ------------- Headless page scenario -------------
+_APPTEST_PROBE = """
+import sys, time, json, os, multiprocessing
+from streamlit.testing.v1 import AppTest
+student, iterations, out_path = sys.argv[2], int(sys.argv[3]), sys.argv[4]
+lat = []
+def timed(fn):
+    t0 = time.perf_counter(); fn(); lat.append(time.perf_counter() - t0)
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+timed(at.run)
+timed(lambda: at.text_input(key="student").input(student).run())
+errors = 0
+for i in range(iterations):
+    timed(lambda: [b for b in at.button if b.label == "Translate"][0].click().run())
+    timed(lambda: [b for b in at.button if b.label == "Submit & Save"][0].click().run())
+    errors += len(at.exception)
+with open(out_path, "w") as fh:
+    json.dump({"latencies": lat, "errors": errors}, fh)
+# Background scoring workers would keep the process (and its pipes) alive
+for child in multiprocessing.active_children():
+    child.terminate()
+os._exit(0)
+"""
+
+
+def scenario_apptest(args) -> Dict[str, Any]:
+    import utils_mt
+    before = len(utils_mt.load_results())
+    page = os.path.join(REPO_ROOT, "pages", "MT_Lab.py")
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [REPO_ROOT, os.getenv("PYTHONPATH")]))}
+    outs = [os.path.abspath(f"apptest_{k:03d}.json") for k in range(args.students)]
+    t0 = time.perf_counter()
+    procs = [subprocess.Popen([sys.executable, "-c", _APPTEST_PROBE, page, f"bench_{k:03d}", str(args.iterations),
+                               outs[k]], cwd=os.getcwd(), env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+             for k in range(args.students)]
+    lat: List[float] = []
+    errors = 0
+    for p, out in zip(procs, outs):
+        p.wait(timeout=1200)
+        try:
+            with open(out, encoding="utf-8") as fh:
+                res = json.load(fh)
+            lat += res["latencies"]
+            errors += res["errors"]
+        except (OSError, ValueError):
+            errors += 1
+    wall = time.perf_counter() - t0
+    utils_mt.invalidate_cache()
+    saved = len(utils_mt.load_results()) - before
+    return {"ops": len(lat), "errors": errors, "seconds": round(wall, 3),
+            "throughput_ops_s": round(len(lat) / wall, 2) if wall else 0.0, **percentiles(lat),
+            "lost_writes": max(0, args.students * args.iterations - errors - saved)}
+
+
+RUNNERS = {"mt": scenario_mt, "score": scenario_score, "append": scenario_append, "tickets": scenario_tickets,
+           "claim": scenario_claim, "submit": scenario_submit, "apptest": scenario_apptest}
+
+
+# ------------- Baselines -------------
+def _config_key(args) -> str:
+    return f"students={args.students},iterations={args.iterations},latency_ms={args.latency_ms}"
+
+
+def load_baselines(path: str = BASELINE_PATH) -> Dict[str, Any]:
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def median_result(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """One result from repeated runs: median latencies/throughput, summed counts."""
+    out = dict(runs[0])
+    for k, v in runs[0].items():
+        if k.endswith("_ms") or k == "throughput_ops_s":
+            out[k] = round(statistics.median(r[k] for r in runs), 2)
+        elif k in ("ops", "errors", "lost_writes", "claims_won", "seconds"):
+            out[k] = round(sum(r[k] for r in runs), 3) if k == "seconds" else sum(r[k] for r in runs)
+    out["runs"] = len(runs)
+    return out
+
+
+def _limit(base: float, tolerance: float, slack: float) -> float:
+    """Largest acceptable value: base plus the relative tolerance plus an absolute allowance."""
+    return base * (1 + tolerance) + slack
+
+
+def compare(name: str, r: Dict[str, Any], base: Optional[Dict[str, Any]], tolerance: float,
+            errors_expected: bool = False, slack_ms: float = 0.0) -> List[str]:
+    """Regression messages for one scenario (empty list = ok)."""
+    problems = []
+    if r["errors"] and not errors_expected:
+        problems.append(f"{name}: {r['errors']} failed operation(s)")
+    if r.get("lost_writes", 0) > 0:
+        problems.append(f"{name}: {r['lost_writes']} lost write(s)")
+    if base:
+        if r["p95_ms"] > _limit(base["p95_ms"], tolerance, slack_ms):
+            problems.append(f"{name}: p95 {r['p95_ms']} ms vs baseline {base['p95_ms']} ms")
+        # Throughput is compared as the wall time of one run, so the same slack applies
+        ops = r["ops"] / r.get("runs", 1)
+        wall_ms = 1000 * ops / r["throughput_ops_s"] if r["throughput_ops_s"] else float("inf")
+        if wall_ms > _limit(1000 * ops / base["throughput_ops_s"], tolerance, slack_ms):
+            problems.append(f"{name}: throughput {r['throughput_ops_s']} ops/s vs baseline {base['throughput_ops_s']}")
+    return problems
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--students", type=int, default=int(os.getenv("LOAD_STUDENTS", "10")))
+    ap.add_argument("--iterations", type=int, default=int(os.getenv("LOAD_ITERATIONS", "5")))
+    ap.add_argument("--scenarios", default=",".join(s for s in SCENARIOS if s != "apptest"),
+                    help=f"comma-separated subset of {','.join(SCENARIOS)}")
+    ap.add_argument("--latency-ms", type=float, default=200.0, help="stub OpenAI latency")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="stub OpenAI 5xx rate")
+    ap.add_argument("--runs", type=int, default=3, help="runs per scenario; medians are reported")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed p95/throughput regression")
+    ap.add_argument("--slack-ms", type=float, default=50.0,
+                    help="absolute allowance on top of --tolerance (p95, and wall time per run)")
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    ap.add_argument("--json", default=None, help="also write results to this file")
+    args = ap.parse_args(argv)
+    names = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in names if s not in RUNNERS]
+    if unknown:
+        ap.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    # sacrebleu warns on every sentence-level BLEU call, which buries the table
+    logging.getLogger("sacrebleu").setLevel(logging.ERROR)
+    import mock_openai_server
+    # Pages treat "[...]" outputs as errors, so the stub must not use its default "[mock] " prefix
+    server = mock_openai_server.start(latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 4,
+                                      error_rate=args.error_rate, seed=1, prefix="mock: ")
+    # Stores resolve EDUAPP_DATA_ROOT on import: keep them in the throwaway directory below
+    os.environ.update({"OPENAI_API_KEY": "mock", "OPENAI_BASE_URL": server.url, "EDUAPP_MT_BACKEND": "openai",
+                       "EDUAPP_DATA_ROOT": "data"})
+
+    key = _config_key(args)
+    baselines = load_baselines(args.baseline)
+    results: Dict[str, Any] = {}
+    failures: List[str] = []
+    print(f"{args.students} students x {args.iterations} iterations x {args.runs} runs, "
+          f"stub latency {args.latency_ms:.0f} ms\n")
+    print(f"{'scenario':<10}{'ops':>6}{'err':>5}{'ops/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'lost':>6}")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # every store uses paths under the relative data root
+        try:
+            for name in names:
+                r = median_result([RUNNERS[name](args) for _ in range(max(1, args.runs))])
+                results[name] = r
+                print(f"{name:<10}{r['ops']:>6}{r['errors']:>5}{r['throughput_ops_s']:>9}"
+                      f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r.get('lost_writes', 0):>6}")
+                failures += compare(name, r, baselines.get(key, {}).get(name), args.tolerance,
+                                    errors_expected=args.error_rate > 0, slack_ms=args.slack_ms)
+        finally:
+            os.chdir(cwd)
+            server.shutdown()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump({"config": key, "results": results}, fh, indent=2)
+    if args.save_baseline:
+        baselines.setdefault(key, {}).update(
+            {n: {k: r[k] for k in ("p95_ms", "throughput_ops_s")} for n, r in results.items()})
+        with open(args.baseline, "w", encoding="utf-8") as fh:
+            json.dump(baselines, fh, indent=2, sort_keys=True)
+        print(f"\nBaseline saved to {os.path.relpath(args.baseline, REPO_ROOT)} [{key}]")
+    elif key not in baselines:
+        print(f"\nNo baseline for [{key}] yet; run with --save-baseline to record one.")
+
+    if failures:
+        print("\nRegressions:\n  " + "\n  ".join(failures))
+        return 1
+    print("\nNo regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
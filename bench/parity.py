@@ -0,0 +1,114 @@
+# bench/parity.py
+"""
+Score parity with sacrebleu's public API.
+
+metrics.score_batch (BLEU/chrF/TER) and compare.score_matrix do not call
+sacrebleu's corpus_score/sentence_score: they reuse its tokenised reference
+caches through private helpers (_cache_references, _extract_corpus_statistics,
+...) and recompute scores from sufficient statistics (compare._bleu/_chrf/_ter).
+This script checks that every reported number still matches
+sacrebleu.metrics.{BLEU,CHRF,TER}.corpus_score / sentence_score. Run it after
+upgrading sacrebleu; it exits 1 on any difference.
+
+    python bench/parity.py
+"""
+
+from __future__ import annotations
+import logging, os, sys
+from typing import List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# Mixed Arabic/English, exact and partial matches, no overlap and empty outputs
+REFS_A = [
+    "ستصدر الوزارة التقرير السنوي غدًا.",
+    "The museum will extend its opening hours during the festival.",
+    "Please submit your application before the deadline.",
+    "يرجى تقديم طلبك قبل الموعد النهائي.",
+    "Health authorities recommend drinking water regularly.",
+    "cat",
+]
+REFS_B = [
+    "تنشر الوزارة التقرير السنوي غدا.",
+    None,  # this item has a single reference
+    "Submit your application before the deadline, please.",
+    "الرجاء تقديم الطلب قبل الموعد النهائي.",
+    None,
+    "a cat",
+]
+SYSTEMS = {
+    "A": ["ستنشر الوزارة التقرير السنوي غدًا.", "The museum extends opening hours for the festival.",
+          "Please submit your application before the deadline.", "قدم طلبك قبل الموعد.",
+          "", "dog"],
+    "B": ["الوزارة تصدر تقرير غدا", "Museum hours will be longer during the festival.",
+          "Submit the application before the deadline.", "يرجى تقديم طلبك قبل الموعد النهائي.",
+          "Drink water, say health authorities.", "cat"],
+}
+TOLERANCE = 1e-3  # both sides are rounded to 4 decimals
+
+
+def _metric(name: str):
+    from sacrebleu.metrics import BLEU, CHRF, TER
+    return {"bleu": BLEU, "chrf": CHRF, "ter": TER}[name]()
+
+
+def _refs(i: int) -> List[str]:
+    return [r for r in (REFS_A[i], REFS_B[i]) if r is not None]
+
+
+def _check(label: str, ours: float, theirs: float, problems: List[str]):
+    if abs(ours - theirs) > TOLERANCE:
+        problems.append(f"{label}: {ours} vs sacrebleu {theirs}")
+
+
+def check_score_batch(problems: List[str]):
+    """
+    metrics.score_batch, single reference: sentence rows and the corpus score. Rows
+    with an empty candidate get the metric's empty value and stay out of the corpus
+    (as in score_all), so sacrebleu is given the scored rows only.
+    """
+    from metrics import score_batch
+    for system, hyps in SYSTEMS.items():
+        rows, corpus = score_batch(hyps, REFS_A, "en", tiers=("fast",))
+        scored = [i for i, h in enumerate(hyps) if h.strip()]
+        for name in ("bleu", "chrf", "ter"):
+            _check(f"score_batch {system} corpus {name}", corpus["en"][name],
+                   _metric(name).corpus_score([hyps[i] for i in scored], [[REFS_A[i] for i in scored]]).score,
+                   problems)
+            for i in scored:
+                _check(f"score_batch {system} item {i} {name}", rows[i][name],
+                       _metric(name).sentence_score(hyps[i], [REFS_A[i]]).score, problems)
+
+
+def check_score_matrix(problems: List[str]):
+    """compare.score_matrix, variable number of references: item and system scores."""
+    from compare import score_matrix
+    res = score_matrix(SYSTEMS, [_refs(i) for i in range(len(REFS_A))], resamples=0)
+    streams: List[List[Optional[str]]] = [REFS_A, REFS_B]
+    for system, hyps in SYSTEMS.items():
+        row = res.systems.set_index("system").loc[system]
+        items = res.items[res.items["system"] == system].set_index("item")
+        for name in ("bleu", "chrf", "ter"):
+            _check(f"score_matrix {system} corpus {name}", float(row[name]),
+                   _metric(name).corpus_score(hyps, streams).score, problems)
+            for i, h in enumerate(hyps):
+                _check(f"score_matrix {system} item {i} {name}", float(items.loc[i, name]),
+                       _metric(name).sentence_score(h.strip(), _refs(i)).score, problems)
+
+
+def main() -> int:
+    logging.getLogger("sacrebleu").setLevel(logging.ERROR)  # sentence BLEU warns on every call
+    import sacrebleu
+    problems: List[str] = []
+    check_score_batch(problems)
+    check_score_matrix(problems)
+    if problems:
+        print(f"sacrebleu {sacrebleu.__version__}: {len(problems)} mismatch(es)\n  " + "\n  ".join(problems))
+        return 1
+    print(f"sacrebleu {sacrebleu.__version__}: scores match.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+# bench/startup.py
+"""
+Startup regression benchmark.
+
+Measures, each in a fresh interpreter:
+- cold `import` time of the shared modules (utils_mt, metrics), and
+- cold first-run time of every page under Streamlit's headless AppTest harness,
+and exits non-zero if any exceeds its budget.
+
+    python bench/startup.py                      # default budgets
+    python bench/startup.py --import-budget-ms 200 --page-budget-s 2.5
+    STARTUP_PAGE_BUDGET_S=4 python bench/startup.py
+"""
+
+from __future__ import annotations
+import argparse, glob, json, os, subprocess, sys, tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from import_audit import audit_import  # noqa: E402
+
+IMPORT_MODULES = ["utils_mt", "metrics"]
+
+_PAGE_PROBE = """
+import sys, time, json
+from streamlit.testing.v1 import AppTest
+t0 = time.perf_counter()
+at = AppTest.from_file(sys.argv[1], default_timeout=120).run()
+elapsed = time.perf_counter() - t0
+print(json.dumps({"seconds": elapsed, "exceptions": [e.value for e in at.exception]}))
+"""
+
+
+def page_load(path: str, cwd: str) -> dict:
+    """Cold first run of one page (fresh interpreter, empty data dir)."""
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [REPO_ROOT, os.getenv("PYTHONPATH")]))}
+    proc = subprocess.run([sys.executable, "-c", _PAGE_PROBE, path], cwd=cwd, env=env,
+                          capture_output=True, text=True, timeout=600)
+    try:
+        return json.loads(proc.stdout.strip().splitlines()[-1])
+    except (ValueError, IndexError):
+        return {"seconds": float("inf"), "exceptions": [proc.stderr.strip()[-500:]]}
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--import-budget-ms", type=float,
+                    default=float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "250")))
+    ap.add_argument("--page-budget-s", type=float,
+                    default=float(os.getenv("STARTUP_PAGE_BUDGET_S", "3.0")))
+    ap.add_argument("--pages", nargs="*", default=None, help="page files (default: Home.py + pages/*.py)")
+    args = ap.parse_args(argv)
+
+    failures = []
+    print(f"{'module':<28}{'cold import':>14}   budget {args.import_budget_ms:.0f} ms")
+    for mod in IMPORT_MODULES:
+        r = audit_import(mod, top=3)
+        ok = r["ok"] and r["total_ms"] <= args.import_budget_ms
+        heavy = ", ".join(f"{d['module']} {d['cumulative_ms']:.0f}ms" for d in r["top"])
+        print(f"{mod:<28}{r['total_ms']:>11.1f} ms   {'ok' if ok else 'OVER'}  ({heavy or r['error']})")
+        if not ok:
+            failures.append(mod)
+
+    pages = args.pages or [os.path.join(REPO_ROOT, "Home.py")] + sorted(glob.glob(os.path.join(REPO_ROOT, "pages", "*.py")))
+    print(f"\n{'page':<28}{'cold load':>14}   budget {args.page_budget_s:.1f} s")
+    with tempfile.TemporaryDirectory() as tmp:
+        # Health Check reads st.secrets, which raises without a secrets file
+        os.makedirs(os.path.join(tmp, ".streamlit"))
+        with open(os.path.join(tmp, ".streamlit", "secrets.toml"), "w") as fh:
+            fh.write("STARTUP_BENCH = true\n")
+        for page in pages:
+            r = page_load(os.path.abspath(page), tmp)
+            ok = r["seconds"] <= args.page_budget_s and not r["exceptions"]
+            name = os.path.relpath(page, REPO_ROOT)
+            print(f"{name:<28}{r['seconds']:>12.2f} s   {'ok' if ok else 'OVER'}"
+                  + (f"  {r['exceptions']}" if r["exceptions"] else ""))
+            if not ok:
+                failures.append(name)
+
+    if failures:
+        print(f"\nStartup budget exceeded: {', '.join(failures)}")
+        return 1
+    print("\nAll startup budgets met.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+# compare.py
+"""
+Score N systems × M references per item in one pass, with paired bootstrap tests.
+
+    from compare import score_matrix
+    res = score_matrix({"A": outs_a, "B": outs_b}, refs, tiers=("fast", "neural"), lang="ar")
+    res.systems        # corpus-level score per system (multi-reference)
+    res.significance   # every system pair: delta, 95% CI, p-value
+
+- BLEU/chrF/TER: each reference stream is tokenised once and its n-gram cache is
+  reused for every system; multi-reference scores come from sacrebleu's own
+  variable-reference support and corpus scores from pooled sufficient statistics.
+- Other registered metrics (BERTScore, plugins) get every unique candidate/reference
+  pair in a single metrics.score_batch call. bert_score embeds each distinct sentence
+  once per call, so a reference shared by five systems is encoded once. The
+  multi-reference score of an item is the best score over its references.
+- Significance is a paired bootstrap (Koehn, 2004). One resample-count matrix is
+  drawn and shared by all systems and metrics, and every corpus score is
+  recomputed from it with matrix products.
+"""
+
+from __future__ import annotations
+import os
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+from lazy import lazy_import
+import metrics as metric_registry
+
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
+
+BOOTSTRAP_RESAMPLES = int(os.getenv("COMPARE_BOOTSTRAP", "1000"))
+SACREBLEU_METRICS = ("bleu", "chrf", "ter")
+LOWER_IS_BETTER = {"ter"}
+
+
+class Comparison(NamedTuple):
+    pairs: Any         # one row per (item, system, reference)
+    items: Any         # one row per (item, system), multi-reference scores
+    systems: Any       # one row per system, corpus-level scores
+    significance: Any  # one row per (metric, system pair)
+
+
+# ------------- Vectorised corpus scores from sufficient statistics -------------
+def _bleu(stats, max_order: int = 4):
+    """sacrebleu corpus BLEU (exp smoothing) for each row of stats [sys_len, ref_len, correct*4, total*4]."""
+    stats = np.atleast_2d(np.asarray(stats, dtype=float))
+    sys_len, ref_len = stats[:, 0], stats[:, 1]
+    correct, total = stats[:, 2:2 + max_order], stats[:, 2 + max_order:2 + 2 * max_order]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bp = np.where(sys_len < ref_len, np.exp(1 - ref_len / np.where(sys_len > 0, sys_len, 1)), 1.0)
+        bp = np.where((sys_len < ref_len) & (sys_len <= 0), 0.0, bp)
+        # exp smoothing: the k-th zero-match order gets precision 1 / (2^k * total)
+        zero = correct == 0
+        smooth = np.cumprod(np.where(zero, 2.0, 1.0), axis=1)
+        prec = np.where(zero, 100.0 / (smooth * total), 100.0 * correct / total)
+        # orders from the first empty total onwards contribute log(0), as in sacrebleu
+        stop = np.cumsum(total == 0, axis=1) > 0
+        logp = np.where(stop | (prec <= 0), -9999999999.0, np.log(np.where(prec > 0, prec, 1.0)))
+    score = bp * np.exp(logp.sum(axis=1) / max_order)
+    return np.where(correct.sum(axis=1) > 0, score, 0.0)
+
+
+def _chrf(stats, beta: float = 2.0):
+    """sacrebleu chrF (effective-order averaging) for rows of [hyp, ref, match] * order stats."""
+    stats = np.atleast_2d(np.asarray(stats, dtype=float))
+    n_hyp, n_ref, n_match = stats[:, 0::3], stats[:, 1::3], stats[:, 2::3]
+    valid = (n_hyp > 0) & (n_ref > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        prec = np.where(valid, n_match / n_hyp, 0.0)
+        rec = np.where(valid, n_match / n_ref, 0.0)
+        order = valid.sum(axis=1)
+        p = np.where(order > 0, prec.sum(axis=1) / np.maximum(order, 1), 0.0)
+        r = np.where(order > 0, rec.sum(axis=1) / np.maximum(order, 1), 0.0)
+        f = (1 + beta ** 2) * p * r / (beta ** 2 * p + r)
+    return np.where(p + r > 0, 100.0 * f, 0.0)
+
+
+def _ter(stats):
+    stats = np.atleast_2d(np.asarray(stats, dtype=float))
+    edits, ref_len = stats[:, 0], stats[:, 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(ref_len > 0, 100.0 * edits / ref_len, np.where(edits > 0, 100.0, 0.0))
+
+
+_FROM_STATS = {"bleu": _bleu, "chrf": _chrf, "ter": _ter}
+
+
+def _sacrebleu_stats(name: str, hyps_by_system: Dict[str, List[str]], streams: List[List[Optional[str]]]):
+    """{system: (items, k) statistics} with the references tokenised once for all systems."""
+    m = type(metric_registry._sacrebleu(name))()  # private instance: the shared one stays ref-free
+    ref_cache = m._cache_references(streams)
+    return {s: np.array([m._compute_segment_statistics(m._preprocess_segment(h), rk)
+                         for h, rk in zip(hyps, ref_cache)], dtype=float)
+            for s, hyps in hyps_by_system.items()}
+
+
+# ------------- Bootstrap -------------
+def resample_counts(n_items: int, resamples: int = BOOTSTRAP_RESAMPLES, seed: Optional[int] = 0):
+    """(resamples, n_items) matrix: how often each item is drawn in each bootstrap sample."""
+    rng = np.random.default_rng(seed)
+    idx = rng.integers(0, n_items, size=(resamples, n_items))
+    flat = (np.arange(resamples)[:, None] * n_items + idx).ravel()
+    return np.bincount(flat, minlength=resamples * n_items).reshape(resamples, n_items).astype(float)
+
+
+def paired_bootstrap(scores: Dict[str, Any], observed: Dict[str, float], metric: str,
+                     alpha: float = 0.05) -> List[Dict[str, Any]]:
+    """
+    Rows for every system pair given resampled corpus scores (system -> (resamples,))
+    and the full-corpus scores. p is two-sided, from the mean-shifted bootstrap
+    distribution (as in sacrebleu's paired-bs).
+    """
+    names = list(scores)
+    rows = []
+    for i, a in enumerate(names):
+        for b in names[i + 1:]:
+            d = np.asarray(scores[a]) - np.asarray(scores[b])
+            delta = observed[a] - observed[b]
+            p = (np.sum(np.abs(d - d.mean()) >= abs(delta)) + 1) / (len(d) + 1)
+            lo, hi = np.percentile(d, [100 * alpha / 2, 100 * (1 - alpha / 2)])
+            better = a if (delta < 0) == (metric in LOWER_IS_BETTER) else b
+            rows.append({"metric": metric, "system_a": a, "system_b": b, "delta": round(float(delta), 4),
+                         "ci_low": round(float(lo), 4), "ci_high": round(float(hi), 4),
+                         "p_value": round(float(p), 4), "significant": bool(p < alpha),
+                         "better": better if delta else ""})
+    return rows
+
+
+# ------------- Entry point -------------
+def score_matrix(
+    systems: Dict[str, Sequence[str]],
+    references: Sequence[Sequence[str]],
+    lang: str = "en",
+    tiers: Optional[Sequence[str]] = ("fast",),
+    metrics: Optional[Sequence[str]] = None,
+    item_ids: Optional[Sequence[Any]] = None,
+    resamples: int = BOOTSTRAP_RESAMPLES,
+    alpha: float = 0.05,
+    seed: Optional[int] = 0,
+) -> Comparison:
+    """
+    Args:
+        systems: system name -> one output per item (all the same length)
+        references: per item, a list of one or more reference translations
+        lang: target language (BERTScore model choice)
+        tiers / metrics: same selection as metrics.score_all
+        item_ids: labels for the items (default 0..n-1)
+        resamples: bootstrap sample count; 0 skips significance testing
+
+    Items without any non-empty reference are dropped.
+    """
+    names = list(systems)
+    n = len(references)
+    if any(len(systems[s]) != n for s in names):
+        raise ValueError("every system needs exactly one output per item")
+    ids = list(item_ids) if item_ids is not None else list(range(n))
+    refs = [[str(r).strip() for r in (rs or []) if r is not None and str(r).strip()] for rs in references]
+    keep = [i for i in range(n) if refs[i]]
+    refs, ids = [refs[i] for i in keep], [ids[i] for i in keep]
+    hyps = {s: [str(systems[s][i] or "").strip() for i in keep] for s in names}
+    n, n_refs = len(keep), max((len(r) for r in refs), default=0)
+    selected = metric_registry._select(tiers, metrics)
+
+    pair_keys = [(k, i, j) for k in range(len(names)) for i in range(n) for j in range(len(refs[i]))]
+    pair_rows = [{"item": ids[i], "system": names[k], "ref": j, "candidate": hyps[names[k]][i],
+                  "reference": refs[i][j]} for k, i, j in pair_keys]
+    row_of = {key: pos for pos, key in enumerate(pair_keys)}
+    item_scores: Dict[str, Any] = {}   # output key -> (systems, items)
+    corpus: Dict[str, Dict[str, float]] = {}
+    boot: Dict[str, Dict[str, Any]] = {}
+    W = resample_counts(n, resamples, seed) if resamples and n else None
+
+    for name in [m for m in selected if m in SACREBLEU_METRICS]:
+        fn = _FROM_STATS[name]
+        # Single-reference matrix: one stats pass per reference stream
+        for j in range(n_refs):
+            idx = [i for i in range(n) if j < len(refs[i])]
+            per_sys = _sacrebleu_stats(name, {s: [hyps[s][i] for i in idx] for s in names},
+                                       [[refs[i][j] for i in idx]])
+            for k, s in enumerate(names):
+                for i, v in zip(idx, fn(per_sys[s])):
+                    pair_rows[row_of[(k, i, j)]][name] = round(float(v), 4)
+        # Multi-reference: all streams at once (None where an item has fewer references)
+        streams = [[r[j] if j < len(r) else None for r in refs] for j in range(n_refs)]
+        per_sys = _sacrebleu_stats(name, hyps, streams)
+        item_scores[name] = np.vstack([fn(per_sys[s]) for s in names])
+        corpus[name] = {s: float(fn(per_sys[s].sum(axis=0, keepdims=True))[0]) for s in names}
+        if W is not None:
+            boot[name] = {s: fn(W @ per_sys[s]) for s in names}
+
+    other = [m for m in selected if m not in SACREBLEU_METRICS]
+    if other and pair_rows:
+        # Every distinct (candidate, reference) pair once; bert_score shares sentence embeddings within the call
+        uniq = list(dict.fromkeys((r["candidate"], r["reference"]) for r in pair_rows))
+        per_pair, _ = metric_registry.score_batch([c for c, _ in uniq], [r for _, r in uniq], lang, metrics=other)
+        found = dict(zip(uniq, per_pair))
+        for row in pair_rows:
+            row.update(found[(row["candidate"], row["reference"])])
+        for key in (list(per_pair[0]) if per_pair else []):
+            mat = np.full((len(names), n, n_refs), np.nan)
+            for (k, i, j), row in zip(pair_keys, pair_rows):
+                mat[k, i, j] = row[key]
+            best = np.nanmin(mat, axis=2) if key in LOWER_IS_BETTER else np.nanmax(mat, axis=2)
+            item_scores[key] = best
+            corpus[key] = {s: float(best[k].mean()) for k, s in enumerate(names)}
+            if W is not None:
+                means = (best @ W.T) / n  # (systems, resamples)
+                boot[key] = {s: means[k] for k, s in enumerate(names)}
+
+    pairs = pd.DataFrame(pair_rows)
+    items = pd.DataFrame([{"item": ids[i], "system": s, "n_refs": len(refs[i]), "candidate": hyps[s][i],
+                           **{k: round(float(v[names.index(s), i]), 4) for k, v in item_scores.items()}}
+                          for s in names for i in range(n)])
+    sys_table = pd.DataFrame([{"system": s, "items": n, **{k: round(v[s], 4) for k, v in corpus.items()}}
+                              for s in names])
+    sig = []
+    for key, per_sys in boot.items():
+        sig += paired_bootstrap(per_sys, corpus[key], key, alpha)
+    return Comparison(pairs, items, sys_table, pd.DataFrame(
+        sig, columns=["metric", "system_a", "system_b", "delta", "ci_low", "ci_high",
+                      "p_value", "significant", "better"]))
@@ -0,0 +1,48 @@
+# db.py
+"""
+Shared SQLite access for EduApp's embedded stores (tickets, caches, jobs, ...).
+
+One connection per (thread, database file), opened in WAL mode so readers never
+block the single writer and several Streamlit sessions (and worker processes) can
+share the file. Databases live under the data root (see storage.py).
+"""
+
+from __future__ import annotations
+import os, sqlite3, threading
+from contextlib import contextmanager
+from typing import Iterator
+from storage import DB_JOURNAL_MODE, data_path
+
+DB_PATH = data_path("eduapp.db")
+
+_local = threading.local()
+
+
+def connect(path: str = DB_PATH) -> sqlite3.Connection:
+    """Return this thread's connection to `path`, creating it on first use."""
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA journal_mode={DB_JOURNAL_MODE}")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        conns[path] = conn
+    return conn
+
+
+@contextmanager
+def transaction(path: str = DB_PATH) -> Iterator[sqlite3.Connection]:
+    """BEGIN IMMEDIATE ... COMMIT (rollback on error) on this thread's connection."""
+    conn = connect(path)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
@@ -0,0 +1,199 @@
+# doc_mt.py
+"""
+Document translation: split a text into paragraphs and sentences, translate the
+segments concurrently and reassemble the output with alignment metadata.
+
+    from doc_mt import translate_document
+    doc = translate_document(ticket["source"], backend="openai")
+    doc.text       # reassembled translation (paragraph/line breaks preserved)
+    doc.segments   # one dict per segment: source/target text and character offsets
+    doc.failed     # indices of segments that came back as "[... error: ...]" (mt_backends.is_error)
+
+Segments go through batch_mt.translate_many, so they share one client, the
+concurrency limit and the token budget, and are retried with backoff. Every
+successful segment is stored in data/mt_cache.db (unless use_cache=False) and
+errors are never cached. Translating the same document again therefore only
+sends the segments that failed. Repeated sentences are translated once.
+
+Sentence splitting is rule-based and handles Arabic as well as Latin script:
+- terminators are . ! ? … and the Arabic question mark ؟ and full stop ۔
+  (the Arabic comma ، and semicolon ؛ never end a sentence)
+- a boundary needs whitespace after the terminator and any closing quote or
+  bracket (" » ” ) ]), so decimals like 3.5 and ٣٫٥ and URLs stay whole
+- abbreviations (Dr., e.g., No., and the Arabic د. أ. ص.) and Latin initials
+  do not split. A date marker such as 1950م. does end a sentence
+- a lowercase Latin letter after the terminator continues the sentence
+- blank lines separate paragraphs; a single line break separates segments
+  (headings, list items)
+"""
+
+from __future__ import annotations
+import re
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+import batch_mt
+import mt_backends
+import tm
+import utils_mt
+from utils_mt import DEFAULT_SYSTEM_PROMPT
+
+# Added to the system prompt so the model returns just the segment, not a document
+SEGMENT_HINT = " You will receive one sentence of a longer document; return only its translation."
+
+ABBREVIATIONS = {
+    "mr", "mrs", "ms", "dr", "prof", "st", "jr", "sr", "vs", "etc", "e.g", "i.e", "no", "nos",
+    "fig", "figs", "vol", "pp", "p", "ed", "eds", "inc", "ltd", "co", "corp", "dept", "approx",
+    "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+    "u.s", "u.k", "u.n", "a.m", "p.m",
+    "د", "أ", "ص", "ج",  # Arabic: doctor, ustadh, page, part
+}
+
+_PARAGRAPH = re.compile(r"\n[ \t\r\f\v]*\n\s*")
+_TERMINATOR = re.compile(r"[.!?…؟۔]+[\"'»”’)\]]*(?=\s)")
+_WORD_BEFORE = re.compile(r"(\S+)$")
+
+
+class Segment(NamedTuple):
+    index: int
+    paragraph: int
+    sentence: int   # position within the paragraph
+    start: int      # character offsets into the source text
+    end: int
+    text: str
+    sep: str        # whitespace between this segment and the next one
+
+
+class DocTranslation(NamedTuple):
+    text: str
+    segments: List[Dict[str, Any]]
+    failed: List[int]
+
+
+def _is_boundary(chunk: str, m: "re.Match") -> bool:
+    if "." not in m.group(0) or set(m.group(0)) & set("!?…؟۔"):
+        return True  # only a bare full stop can belong to an abbreviation
+    word = _WORD_BEFORE.search(chunk, 0, m.start())
+    token = word.group(1).lower().lstrip("\"'«“‘([") if word else ""
+    if token in ABBREVIATIONS or (len(token) == 1 and token.isascii() and token.isalpha()):
+        return False
+    nxt = chunk[m.end():].lstrip()
+    return not (nxt[:1].isalpha() and nxt[:1].islower())
+
+
+def _sentences(chunk: str) -> List[tuple]:
+    """(start, end) spans of the sentences in one line of text, trimmed of whitespace."""
+    spans, start = [], 0
+    for m in _TERMINATOR.finditer(chunk):
+        if _is_boundary(chunk, m):
+            spans.append((start, m.end()))
+            start = m.end()
+    spans.append((start, len(chunk)))
+    out = []
+    for a, b in spans:
+        seg = chunk[a:b]
+        if seg.strip():
+            a += len(seg) - len(seg.lstrip())
+            b -= len(seg) - len(seg.rstrip())
+            out.append((a, b))
+    return out
+
+
+def split(text: str, line_breaks: bool = True) -> List[Segment]:
+    """Sentence segments of `text` with their character offsets and trailing whitespace."""
+    text = text or ""
+    spans = []  # (paragraph, start, end)
+    para_start = 0
+    bounds = [m.span() for m in _PARAGRAPH.finditer(text)] + [(len(text), len(text))]
+    for p, (p_end, next_start) in enumerate(bounds):
+        para = text[para_start:p_end]
+        lines = para.split("\n") if line_breaks else [para]
+        offset = para_start
+        for line in lines:
+            spans += [(p, offset + a, offset + b) for a, b in _sentences(line)]
+            offset += len(line) + 1
+        para_start = next_start
+    segments, sentence, last_para = [], 0, None
+    for i, (p, a, b) in enumerate(spans):
+        sentence = sentence + 1 if p == last_para else 0
+        last_para = p
+        nxt = spans[i + 1][1] if i + 1 < len(spans) else len(text)
+        segments.append(Segment(i, p, sentence, a, b, text[a:b], text[b:nxt]))
+    # Number paragraphs consecutively (blank-only paragraphs produce no segments)
+    renum = {p: n for n, p in enumerate(dict.fromkeys(s.paragraph for s in segments))}
+    return [s._replace(paragraph=renum[s.paragraph]) for s in segments]
+
+
+def assemble(text: str, segments: List[Segment], outputs: List[str]) -> tuple:
+    """Reassembled translation and the (start, end) of each output in it."""
+    parts = [text[:segments[0].start]] if segments else [text or ""]
+    pos, offsets = len(parts[0]), []
+    for seg, out in zip(segments, outputs):
+        offsets.append((pos, pos + len(out)))
+        parts += [out, seg.sep]
+        pos += len(out) + len(seg.sep)
+    return "".join(parts), offsets
+
+
+def translate_document(
+    text: str,
+    system_prompt: str = DEFAULT_SYSTEM_PROMPT,
+    terms: str = "",
+    model: str = "gpt-4o-mini",
+    backend: Optional[str] = None,
+    use_cache: bool = True,
+    use_tm: bool = False,
+    concurrency: int = batch_mt.BATCH_CONCURRENCY,
+    line_breaks: bool = True,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> DocTranslation:
+    """
+    Translate `text` segment by segment.
+    - terms / glossary hints are added per segment, only for terms occurring in it
+    - use_tm: segments with an exact match of an approved reference in the translation
+      memory are not sent at all (students' post-edits are never served as output)
+    - on_progress(done, total) is called as unique segments finish
+    """
+    segments = split(text, line_breaks)
+    outputs: Dict[str, str] = {}
+    origin: Dict[str, str] = {}
+    if use_tm:
+        utils_mt.ensure_tm()
+        for s in segments:
+            hit = tm.exact(s.text)
+            if hit is not None and hit.origin == "reference":
+                outputs[s.text], origin[s.text] = hit.target, "tm"
+    todo = [t for t in dict.fromkeys(s.text for s in segments) if t not in outputs]
+    done = [len(outputs)]
+    total = len(outputs) + len(todo)
+
+    def _progress(i: int, out: str):
+        done[0] += 1
+        if on_progress:
+            on_progress(done[0], total)
+
+    if todo:
+        results = batch_mt.translate_many(
+            todo, on_result=_progress, backend=backend, system_prompt=system_prompt + SEGMENT_HINT,
+            terms=terms, model=model, use_cache=use_cache, concurrency=concurrency)
+        for t, out in zip(todo, results):
+            outputs[t], origin[t] = out, "mt"
+
+    targets = [outputs[s.text] for s in segments]
+    doc, offsets = assemble(text, segments, targets)
+    rows = [{"segment": s.index, "paragraph": s.paragraph, "sentence": s.sentence,
+             "src_start": s.start, "src_end": s.end, "tgt_start": a, "tgt_end": b,
+             "source": s.text, "target": out, "origin": origin[s.text], "error": mt_backends.is_error(out)}
+            for s, out, (a, b) in zip(segments, targets, offsets)]
+    return DocTranslation(doc, rows, [r["segment"] for r in rows if r["error"]])
+
+
+def align_reference(doc: DocTranslation, reference: str, line_breaks: bool = True) -> Optional[List[str]]:
+    """
+    The reference sentence for each translated segment, if the reference splits into the
+    same number of segments in every paragraph (else None). Used for sentence-level scores.
+    """
+    ref = split(reference, line_breaks)
+    shape = lambda segs, key: [sum(1 for s in segs if s[key] == p) for p in
+                               range(1 + max((s[key] for s in segs), default=-1))]
+    if shape(doc.segments, "paragraph") != shape([s._asdict() for s in ref], "paragraph"):
+        return None
+    return [s.text for s in ref]
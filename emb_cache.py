@@ -0,0 +1,288 @@
+# emb_cache.py
+"""
+Persistent cache of BERTScore reference embeddings.
+
+Every student's candidate for the same item is scored against the same reference,
+so the reference side (contextual token embeddings + IDF weights) is encoded once
+and kept on disk. Only the candidate goes through the transformer per score.
+
+Layout:
+- data/emb_cache.db: (model_key, reference hash) -> row offset / token count
+- data/emb_cache/<model_key>.f32: float32 rows of [embedding..., idf], one per
+  token, append-only and memory-mapped read-only by every process (Streamlit and
+  the scoring workers share it)
+
+model_key is bert_score's scorer hash (model type, layer, idf/baseline flags,
+versions), plus a digest of the IDF table when IDF weighting is on. Greedy
+matching is the same computation as bert_score.utils.greedy_cos_idf, done per
+pair in NumPy on the cached arrays.
+"""
+
+from __future__ import annotations
+import os, re, time, hashlib, threading, weakref
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from db import connect, transaction
+from lazy import lazy_import
+from storage import data_path
+
+np = lazy_import("numpy")
+
+EMB_CACHE_PATH = data_path("emb_cache.db")
+EMB_CACHE_DIR = data_path("emb_cache")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ref_embeddings (
+    model_key  TEXT NOT NULL,
+    ref_hash   TEXT NOT NULL,
+    row_offset INTEGER NOT NULL,
+    n_tokens   INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (model_key, ref_hash)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS emb_files (
+    model_key TEXT PRIMARY KEY,
+    dim       INTEGER NOT NULL,
+    n_rows    INTEGER NOT NULL DEFAULT 0,
+    hits      INTEGER NOT NULL DEFAULT 0,
+    misses    INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+Encoded = Tuple[Any, Any]  # (embeddings (tokens, dim), idf weights (tokens,))
+
+_ready: set = set()
+_lock = threading.Lock()
+_maps: Dict[str, Any] = {}          # array file -> read-only memmap
+_keys: "weakref.WeakKeyDictionary[Any, Optional[str]]" = weakref.WeakKeyDictionary()  # scorer -> model_key
+
+
+def _conn(path: str = EMB_CACHE_PATH):
+    conn = connect(path)
+    if path not in _ready:
+        conn.executescript(_SCHEMA)
+        _ready.add(path)
+    return conn
+
+
+def ref_hash(text: str) -> str:
+    # bert_score strips sentences before tokenising
+    return hashlib.sha256((text or "").strip().encode("utf-8")).hexdigest()
+
+
+def model_key(scorer: Any) -> Optional[str]:
+    """Cache namespace for a BERTScorer, or None if its outputs can't be cached."""
+    try:
+        return _keys[scorer]
+    except (KeyError, TypeError):
+        pass
+    key = None
+    try:
+        if not getattr(scorer, "all_layers", False):
+            key = str(scorer.hash)
+            if scorer.idf:
+                digest = hashlib.sha256(repr(sorted(scorer._idf_dict.items())).encode()).hexdigest()[:12]
+                key += f"_idf={digest}"
+            key = re.sub(r"[^A-Za-z0-9._=-]+", "_", key)
+    except Exception:
+        key = None  # not a bert_score scorer (or an unknown version)
+    try:
+        _keys[scorer] = key
+    except TypeError:
+        pass
+    return key
+
+
+def _array_path(key: str, root: str = EMB_CACHE_DIR) -> str:
+    return os.path.join(root, f"{key}.f32")
+
+
+def _rows(key: str, n_rows: int, dim: int, root: str = EMB_CACHE_DIR):
+    """Read-only memmap covering at least `n_rows` rows (re-mapped after other processes append)."""
+    path = _array_path(key, root)
+    with _lock:
+        m = _maps.get(path)
+        if m is None or m.shape[0] < n_rows:
+            m = _maps[path] = np.memmap(path, dtype=np.float32, mode="r", shape=(n_rows, dim + 1))
+        return m
+
+
+# ------------- Store -------------
+def lookup(key: str, hashes: Iterable[str], path: str = EMB_CACHE_PATH,
+           root: str = EMB_CACHE_DIR) -> Dict[str, Encoded]:
+    """Cached (embeddings, idf) for the given reference hashes; misses are absent."""
+    hashes = list(dict.fromkeys(hashes))
+    conn = _conn(path)
+    meta = conn.execute("SELECT dim, n_rows FROM emb_files WHERE model_key = ?", (key,)).fetchone()
+    if meta is None or not hashes:
+        return {}
+    found = {}
+    for start in range(0, len(hashes), 500):  # stay under SQLite's parameter limit
+        chunk = hashes[start:start + 500]
+        found.update({r["ref_hash"]: (r["row_offset"], r["n_tokens"]) for r in conn.execute(
+            f"SELECT ref_hash, row_offset, n_tokens FROM ref_embeddings WHERE model_key = ? "
+            f"AND ref_hash IN ({','.join('?' * len(chunk))})", (key, *chunk))})
+    if not found:
+        return {}
+    rows = _rows(key, max(off + n for off, n in found.values()), meta["dim"], root)
+    return {h: (rows[off:off + n, :-1], rows[off:off + n, -1]) for h, (off, n) in found.items()}
+
+
+def store(key: str, items: Dict[str, Encoded], path: str = EMB_CACHE_PATH, root: str = EMB_CACHE_DIR) -> int:
+    """Append newly encoded references; returns how many were written (others already had them)."""
+    if not items:
+        return 0
+    _conn(path)
+    os.makedirs(root, exist_ok=True)
+    dim = int(next(iter(items.values()))[0].shape[1])
+    # The write transaction doubles as the cross-process lock on the array file
+    with transaction(path) as c:
+        c.execute("INSERT OR IGNORE INTO emb_files(model_key, dim) VALUES (?, ?)", (key, dim))
+        n_rows = c.execute("SELECT n_rows FROM emb_files WHERE model_key = ?", (key,)).fetchone()[0]
+        have: set = set()
+        hashes = list(items)
+        for start in range(0, len(hashes), 500):
+            chunk = hashes[start:start + 500]
+            have.update(r[0] for r in c.execute(
+                f"SELECT ref_hash FROM ref_embeddings WHERE model_key = ? "
+                f"AND ref_hash IN ({','.join('?' * len(chunk))})", (key, *chunk)))
+        new = [(h, e) for h, e in items.items() if h not in have]
+        if not new:
+            return 0
+        block = np.concatenate([np.hstack([np.asarray(emb, dtype=np.float32),
+                                           np.asarray(idf, dtype=np.float32).reshape(-1, 1)])
+                                for _, (emb, idf) in new])
+        with open(_array_path(key, root), "ab") as f:
+            f.truncate(n_rows * (dim + 1) * 4)  # drop rows a crashed writer never committed
+            f.write(block.tobytes())
+        now, offset, rows = time.time(), n_rows, []
+        for h, (emb, _) in new:
+            rows.append((key, h, offset, len(emb), now))
+            offset += len(emb)
+        c.executemany("INSERT INTO ref_embeddings(model_key, ref_hash, row_offset, n_tokens, created_at) "
+                      "VALUES (?, ?, ?, ?, ?)", rows)
+        c.execute("UPDATE emb_files SET n_rows = ? WHERE model_key = ?", (offset, key))
+    return len(new)
+
+
+def _record(key: str, hits: int, misses: int, path: str = EMB_CACHE_PATH):
+    _conn(path).execute("UPDATE emb_files SET hits = hits + ?, misses = misses + ? WHERE model_key = ?",
+                        (hits, misses, key))
+
+
+def stats(path: str = EMB_CACHE_PATH, root: str = EMB_CACHE_DIR) -> Dict[str, Any]:
+    """Cached references, tokens, MB on disk and hit rate, summed over models and processes."""
+    rows = [dict(r) for r in _conn(path).execute(
+        "SELECT f.model_key, f.n_rows, f.dim, f.hits, f.misses, COUNT(r.ref_hash) AS refs "
+        "FROM emb_files f LEFT JOIN ref_embeddings r USING (model_key) GROUP BY f.model_key")]
+    hits, misses = sum(r["hits"] for r in rows), sum(r["misses"] for r in rows)
+    return {
+        "models": len(rows),
+        "references": sum(r["refs"] for r in rows),
+        "tokens": sum(r["n_rows"] for r in rows),
+        "mb": round(sum(r["n_rows"] * (r["dim"] + 1) * 4 for r in rows) / 2**20, 2),
+        "hits": hits, "misses": misses,
+        "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+    }
+
+
+def clear(path: str = EMB_CACHE_PATH, root: str = EMB_CACHE_DIR):
+    with transaction(path) as c:
+        keys = [r[0] for r in c.execute("SELECT model_key FROM emb_files")]
+        c.execute("DELETE FROM ref_embeddings")
+        c.execute("DELETE FROM emb_files")
+        with _lock:
+            _maps.clear()
+        for k in keys:
+            try:
+                os.remove(_array_path(k, root))
+            except OSError:
+                pass
+
+
+# ------------- Encoding / matching -------------
+def _idf_dict(scorer: Any):
+    """The IDF table BERTScorer.score would use."""
+    if scorer.idf:
+        return scorer._idf_dict
+    from collections import defaultdict
+    idf = defaultdict(lambda: 1.0)
+    idf[scorer._tokenizer.sep_token_id] = 0
+    idf[scorer._tokenizer.cls_token_id] = 0
+    return idf
+
+
+def _encode(scorer: Any, sentences: Sequence[str], batch_size: int = 64) -> List[Encoded]:
+    """Token embeddings + IDF weights per sentence (the only step that runs the transformer)."""
+    from bert_score.utils import get_bert_embedding  # heavy: torch + transformers
+    order = sorted(range(len(sentences)), key=lambda i: len(sentences[i].split(" ")), reverse=True)
+    out: List[Optional[Encoded]] = [None] * len(sentences)
+    idf = _idf_dict(scorer)
+    for start in range(0, len(order), batch_size):
+        idx = order[start:start + batch_size]
+        embs, masks, padded_idf = get_bert_embedding([sentences[i] for i in idx], scorer._model,
+                                                     scorer._tokenizer, idf, device=scorer.device)
+        embs, masks, padded_idf = embs.cpu().numpy(), masks.cpu().numpy(), padded_idf.cpu().numpy()
+        for j, i in enumerate(idx):
+            n = int(masks[j].sum())
+            out[i] = (embs[j, :n].astype(np.float32), padded_idf[j, :n].astype(np.float32))
+    return out  # type: ignore[return-value]
+
+
+def _greedy(hyp: Encoded, ref: Encoded) -> Tuple[float, float, float]:
+    """Greedy cosine matching of one candidate against one reference (bert_score semantics)."""
+    h = hyp[0] / np.linalg.norm(hyp[0], axis=-1, keepdims=True)
+    r = ref[0] / np.linalg.norm(ref[0], axis=-1, keepdims=True)
+    sim = h @ r.T
+    h_idf = hyp[1] / hyp[1].sum()
+    r_idf = ref[1] / ref[1].sum()
+    p = float((sim.max(axis=1) * h_idf).sum())
+    rc = float((sim.max(axis=0) * r_idf).sum())
+    f = 2 * p * rc / (p + rc) if p + rc else 0.0
+    # bert_score zeroes P/R (not F) for empty sentences, i.e. just [CLS] [SEP]
+    if len(h) == 2 or len(r) == 2:
+        p = rc = 0.0
+    return p, rc, (0.0 if f != f else f)
+
+
+def encode_references(scorer: Any, refs: Sequence[str], batch_size: int = 64,
+                      path: str = EMB_CACHE_PATH, root: str = EMB_CACHE_DIR) -> Tuple[Dict[str, Encoded], int]:
+    """({hash: encoding} for `refs`, number newly encoded); encodes and stores only the misses."""
+    key = model_key(scorer)
+    hashes = {ref_hash(r): r for r in refs}
+    cached = lookup(key, hashes, path, root)
+    missing = [h for h in hashes if h not in cached]
+    if missing:
+        fresh = dict(zip(missing, _encode(scorer, [hashes[h] for h in missing], batch_size)))
+        store(key, fresh, path, root)
+        cached.update(fresh)
+    return cached, len(missing)
+
+
+def score(scorer: Any, cands: Sequence[str], refs: Sequence[str], batch_size: int = 64,
+          path: str = EMB_CACHE_PATH, root: str = EMB_CACHE_DIR):
+    """Drop-in for scorer.score(cands, refs) returning NumPy (P, R, F); uncachable scorers pass through."""
+    key = model_key(scorer)
+    if key is None:
+        return scorer.score(list(cands), list(refs), verbose=False, batch_size=batch_size)
+    ref_enc, n_new = encode_references(scorer, refs, batch_size, path, root)
+    uniq = list(dict.fromkeys(cands))
+    cand_enc = dict(zip(uniq, _encode(scorer, uniq, batch_size)))
+    out = np.array([_greedy(cand_enc[c], ref_enc[ref_hash(r)]) for c, r in zip(cands, refs)],
+                   dtype=np.float64).reshape(-1, 3)
+    if scorer.rescale_with_baseline:
+        base = np.asarray(scorer.baseline_vals.cpu().numpy() if hasattr(scorer.baseline_vals, "cpu")
+                          else scorer.baseline_vals, dtype=np.float64)
+        out = (out - base) / (1 - base)
+    _record(key, len({ref_hash(r) for r in refs}) - n_new, n_new, path)
+    return out[:, 0], out[:, 1], out[:, 2]
+
+
+def warm(refs: Iterable[str], lang: str = "en", model_type: Optional[str] = None,
+         batch_size: int = 64) -> int:
+    """Encode and store every reference not cached yet for the (lang, model_type) scorer."""
+    from metrics import get_bertscorer
+    refs = [r for r in dict.fromkeys(str(r) for r in refs if r is not None) if r.strip()]
+    scorer = get_bertscorer(lang, model_type)
+    if model_key(scorer) is None or not refs:
+        return 0
+    return encode_references(scorer, refs, batch_size)[1]
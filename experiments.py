@@ -0,0 +1,305 @@
+# experiments.py
+"""
+Prompt experiments: a grid of system prompts × style constraints × glossaries ×
+models over a set of source items, run as one batch and kept in SQLite.
+
+    from experiments import expand_grid, run_experiment, summary
+    configs = expand_grid(["You are a translator.", "Translate literally."], styles=["", "Formal MSA"])
+    exp_id = run_experiment("formality", items_df, configs)
+    summary(exp_id)   # one row per configuration with mean scores
+
+Identical requests (same backend, model, full system prompt incl. glossary hint and
+user text) are sent once, however many configurations produce them. OpenAI requests
+of every configuration run concurrently under one client, concurrency limit and
+token budget (batch_mt); other backends go through translate_many. Every output is
+then scored in a single metrics.score_batch call.
+
+Tables in data/eduapp.db: experiments, exp_configs, exp_outputs and exp_scores
+(long form: one row per output and metric), so ad-hoc SQL works, e.g.
+    SELECT config_id, AVG(value) FROM exp_scores WHERE exp_id = ? AND metric = 'chrf' GROUP BY config_id
+"""
+
+from __future__ import annotations
+import time, uuid, sqlite3, asyncio, itertools
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from db import DB_PATH, connect, transaction
+from lazy import lazy_import
+import mt_backends
+import perf
+
+pd = lazy_import("pandas")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS experiments (
+    exp_id      TEXT PRIMARY KEY,
+    name        TEXT NOT NULL DEFAULT '',
+    status      TEXT NOT NULL DEFAULT 'running',
+    n_items     INTEGER NOT NULL DEFAULT 0,
+    n_configs   INTEGER NOT NULL DEFAULT 0,
+    n_requests  INTEGER NOT NULL DEFAULT 0,
+    n_unique    INTEGER NOT NULL DEFAULT 0,
+    lang        TEXT NOT NULL DEFAULT 'en',
+    error       TEXT NOT NULL DEFAULT '',
+    created_at  REAL NOT NULL,
+    seconds     REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS exp_configs (
+    exp_id        TEXT NOT NULL,
+    config_id     INTEGER NOT NULL,
+    system_prompt TEXT NOT NULL,
+    style         TEXT NOT NULL DEFAULT '',
+    terms         TEXT NOT NULL DEFAULT '',
+    model         TEXT NOT NULL,
+    backend       TEXT NOT NULL,
+    PRIMARY KEY (exp_id, config_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS exp_outputs (
+    exp_id    TEXT NOT NULL,
+    config_id INTEGER NOT NULL,
+    item_id   TEXT NOT NULL,
+    source    TEXT NOT NULL,
+    reference TEXT NOT NULL DEFAULT '',
+    output    TEXT NOT NULL,
+    is_error  INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (exp_id, config_id, item_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS exp_scores (
+    exp_id    TEXT NOT NULL,
+    config_id INTEGER NOT NULL,
+    item_id   TEXT NOT NULL,
+    metric    TEXT NOT NULL,
+    value     REAL,
+    PRIMARY KEY (exp_id, metric, config_id, item_id)
+) WITHOUT ROWID;
+"""
+
+_ready: set = set()
+
+
+class Config(NamedTuple):
+    system_prompt: str
+    style: str = ""
+    terms: str = ""
+    model: str = "gpt-4o-mini"
+    backend: str = mt_backends.DEFAULT_BACKEND
+
+
+def _conn(path: str = DB_PATH):
+    conn = connect(path)
+    if path not in _ready:
+        conn.executescript(_SCHEMA)
+        _ready.add(path)
+    return conn
+
+
+def expand_grid(system_prompts: Sequence[str], styles: Sequence[str] = ("",), glossaries: Sequence[str] = ("",),
+                models: Sequence[str] = ("gpt-4o-mini",), backends: Sequence[str] = (mt_backends.DEFAULT_BACKEND,)
+                ) -> List[Config]:
+    """Every combination, without duplicates, in a stable order."""
+    grid = itertools.product(system_prompts, styles or ("",), glossaries or ("",), models, backends)
+    return list(dict.fromkeys(Config(p.strip(), s.strip(), g.strip(), m, b) for p, s, g, m, b in grid))
+
+
+def user_text(source: str, style: str = "") -> str:
+    """The user message Prompt Lab sends: the source plus optional constraints."""
+    return f"{source}\n\nConstraints: {style}" if style else source
+
+
+# ------------- Running -------------
+def _translate_unique(requests: List[Tuple[str, str, str, str, str]], concurrency: int,
+                      on_done: Optional[Callable[[int], None]] = None) -> Dict[Tuple[str, ...], str]:
+    """requests: unique (backend, model, system_prompt, terms, text) -> output."""
+    from batch_mt import BatchTranslator, translate_many
+    out: Dict[Tuple[str, ...], str] = {}
+    done = [0]
+
+    def _tick(n: int = 1):
+        done[0] += n
+        if on_done:
+            on_done(done[0])
+
+    remote = [r for r in requests if r[0] == "openai"]
+    if remote:
+        async def _run():
+            base = BatchTranslator(concurrency=concurrency)
+            variants: Dict[Tuple[str, str, str], Any] = {}
+
+            async def _one(req):
+                b, model, system, terms, text = req
+                v = variants.get((model, system, terms))
+                if v is None:
+                    v = variants[(model, system, terms)] = base.variant(model=model, system_prompt=system, terms=terms)
+                return req, await v.translate(text)
+
+            try:
+                for fut in asyncio.as_completed([_one(r) for r in remote]):
+                    req, text = await fut
+                    out[req] = text
+                    _tick()
+            finally:
+                await base.aclose()
+        asyncio.run(_run())
+
+    groups: Dict[Tuple[str, str, str, str], List[str]] = {}
+    for b, model, system, terms, text in requests:
+        if b != "openai":
+            groups.setdefault((b, model, system, terms), []).append(text)
+    for (b, model, system, terms), texts in groups.items():
+        for text, o in zip(texts, translate_many(texts, backend=b, model=model, system_prompt=system, terms=terms,
+                                                 on_result=lambda i, _: _tick())):
+            out[(b, model, system, terms, text)] = o
+    return out
+
+
+@perf.timed("experiments.run_experiment")
+def run_experiment(
+    name: str,
+    items: Any,
+    configs: Sequence[Config],
+    lang: str = "en",
+    tiers: Optional[Sequence[str]] = ("fast",),
+    concurrency: int = 8,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    path: str = DB_PATH,
+) -> str:
+    """
+    Translate and score every (configuration, item) pair and store the results.
+
+    Args:
+        items: DataFrame with `source`, optional `reference` and `id` columns
+            (ids must be unique; without an `id` column items are numbered by position)
+        configs: e.g. from expand_grid()
+        lang: BERTScore language (only used when tiers include "neural")
+        on_progress: called as (unique requests done, unique requests total)
+
+    Returns the experiment id. Raises ValueError if `id` has duplicates.
+    """
+    from utils_mt import glossary_hint
+    from metrics import score_batch
+    t0 = time.perf_counter()
+    exp_id = uuid.uuid4().hex[:12]
+    df = items.reset_index(drop=True)
+    if "id" in df.columns:
+        dupes = df["id"][df["id"].astype(str).duplicated()].astype(str).unique().tolist()
+        if dupes:
+            raise ValueError(f"item ids must be unique; duplicated: {', '.join(dupes[:5])}")
+    ids = [str(v) for v in (df["id"] if "id" in df.columns else df.index)]
+    sources = df["source"].fillna("").astype(str).tolist()
+    refs = (df["reference"].fillna("").astype(str).tolist() if "reference" in df.columns else [""] * len(df))
+    configs = list(dict.fromkeys(configs))
+
+    conn = _conn(path)
+    conn.execute("INSERT INTO experiments(exp_id, name, n_items, n_configs, n_requests, lang, created_at) "
+                 "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                 (exp_id, name, len(df), len(configs), len(df) * len(configs), lang, time.time()))
+    conn.executemany("INSERT INTO exp_configs(exp_id, config_id, system_prompt, style, terms, model, backend) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)", [(exp_id, k, *c) for k, c in enumerate(configs)])
+    try:
+        # Request identity is what reaches the model: the glossary hint, not the raw terms string
+        cells: Dict[Tuple[int, int], Tuple[str, ...]] = {}
+        dispatch: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+        for k, c in enumerate(configs):
+            for i, src in enumerate(sources):
+                text = user_text(src, c.style)
+                ident = (c.backend, c.model, c.system_prompt + glossary_hint(c.terms, text), text)
+                dispatch.setdefault(ident, (c.backend, c.model, c.system_prompt, c.terms, text))
+                cells[(k, i)] = ident
+        total = len(dispatch)
+        translated = _translate_unique(list(dispatch.values()), concurrency,
+                                       (lambda n: on_progress(n, total)) if on_progress else None)
+        outputs = {cell: translated[dispatch[ident]] for cell, ident in cells.items()}
+
+        pairs = list(dict.fromkeys((o, refs[i]) for (k, i), o in outputs.items()
+                                   if refs[i].strip() and not mt_backends.is_error(o)))
+        scored = dict(zip(pairs, score_batch([o for o, _ in pairs], [r for _, r in pairs], lang, tiers=tiers)[0]
+                          if pairs else []))
+        with transaction(path) as c:
+            c.executemany("INSERT INTO exp_outputs(exp_id, config_id, item_id, source, reference, output, is_error) "
+                          "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                          [(exp_id, k, ids[i], sources[i], refs[i], o, int(mt_backends.is_error(o)))
+                           for (k, i), o in outputs.items()])
+            c.executemany("INSERT INTO exp_scores(exp_id, config_id, item_id, metric, value) VALUES (?, ?, ?, ?, ?)",
+                          [(exp_id, k, ids[i], m, v) for (k, i), o in outputs.items()
+                           for m, v in scored.get((o, refs[i]), {}).items()])
+            c.execute("UPDATE experiments SET status = 'done', n_unique = ?, seconds = ? WHERE exp_id = ?",
+                      (total, time.perf_counter() - t0, exp_id))
+    except Exception as e:
+        conn.execute("UPDATE experiments SET status = 'error', error = ?, seconds = ? WHERE exp_id = ?",
+                     (repr(e), time.perf_counter() - t0, exp_id))
+        raise
+    return exp_id
+
+
+# ------------- Queries -------------
+def list_experiments(path: str = DB_PATH):
+    return pd.read_sql_query("SELECT * FROM experiments ORDER BY created_at DESC", _conn(path))
+
+
+def configs(exp_id: str, path: str = DB_PATH):
+    return pd.read_sql_query("SELECT * FROM exp_configs WHERE exp_id = ? ORDER BY config_id",
+                             _conn(path), params=(exp_id,))
+
+
+def summary(exp_id: str, path: str = DB_PATH):
+    """One row per configuration: its settings, output/error counts and mean of every metric."""
+    conn = _conn(path)
+    cfg = configs(exp_id, path).drop(columns=["exp_id"])
+    counts = pd.read_sql_query(
+        "SELECT config_id, COUNT(*) AS outputs, SUM(is_error) AS errors FROM exp_outputs "
+        "WHERE exp_id = ? GROUP BY config_id", conn, params=(exp_id,))
+    means = pd.read_sql_query(
+        "SELECT config_id, metric, AVG(value) AS mean FROM exp_scores WHERE exp_id = ? GROUP BY config_id, metric",
+        conn, params=(exp_id,))
+    out = cfg.merge(counts, on="config_id", how="left")
+    if not means.empty:
+        wide = means.pivot(index="config_id", columns="metric", values="mean").round(4).reset_index()
+        out = out.merge(wide, on="config_id", how="left")
+    return out
+
+
+def outputs(exp_id: str, path: str = DB_PATH):
+    """Every output with its configuration and per-metric scores (wide)."""
+    conn = _conn(path)
+    df = pd.read_sql_query(
+        "SELECT o.config_id, c.system_prompt, c.style, c.terms, c.model, c.backend, o.item_id, o.source, "
+        "o.reference, o.output, o.is_error FROM exp_outputs o JOIN exp_configs c USING (exp_id, config_id) "
+        "WHERE o.exp_id = ? ORDER BY o.config_id, o.item_id", conn, params=(exp_id,))
+    scores = pd.read_sql_query("SELECT config_id, item_id, metric, value FROM exp_scores WHERE exp_id = ?",
+                               conn, params=(exp_id,))
+    if not scores.empty:
+        wide = scores.pivot_table(index=["config_id", "item_id"], columns="metric", values="value").reset_index()
+        df = df.merge(wide, on=["config_id", "item_id"], how="left")
+    return df
+
+
+def compare_configs(exp_id: str, resamples: int = 1000, path: str = DB_PATH):
+    """
+    Paired bootstrap between every pair of configurations (see compare.py). Like summary(),
+    it leaves out failed outputs: items that errored in any configuration are dropped, so
+    every configuration is still compared on the same items.
+    """
+    from compare import score_matrix
+    df = outputs(exp_id, path)
+    df = df[~df["item_id"].isin(df.loc[df["is_error"] == 1, "item_id"])]
+    exp = _conn(path).execute("SELECT lang FROM experiments WHERE exp_id = ?", (exp_id,)).fetchone()
+    first = df[df["config_id"] == df["config_id"].min()]
+    systems = {f"#{k}": g.set_index("item_id").loc[first["item_id"], "output"].tolist()
+               for k, g in df.groupby("config_id")}
+    return score_matrix(systems, [[r] for r in first["reference"]], lang=exp["lang"] if exp else "en",
+                        item_ids=first["item_id"].tolist(), resamples=resamples)
+
+
+def query(sql: str, params: Sequence[Any] = (), path: str = DB_PATH):
+    """Run a read-only SQL query against the experiment tables."""
+    _conn(path)
+    ro = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return pd.read_sql_query(sql, ro, params=tuple(params))
+    finally:
+        ro.close()
+
+
+def delete(exp_id: str, path: str = DB_PATH):
+    with transaction(path) as c:
+        for table in ("exp_scores", "exp_outputs", "exp_configs", "experiments"):
+            c.execute(f"DELETE FROM {table} WHERE exp_id = ?", (exp_id,))
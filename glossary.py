@@ -0,0 +1,275 @@
+# glossary.py
+"""
+Course glossary compiled into an Aho-Corasick matcher.
+
+Entries live in data/eduapp.db and the compiled automaton is cached per process
+until the table changes. Matching is done on normalised text: case-folded, NFC,
+Arabic diacritics and tatweel removed, alef variants (أ إ آ ٱ) folded to ا and
+alef maqsura to ي. Only entries that occur in a segment are injected into the
+prompt, so a glossary of thousands of terms costs nothing for a sentence that uses
+none of them. check() then reports which matched terms the output actually used.
+
+    import glossary
+    entries = glossary.match("The ministry issued a new policy.", terms="policy=سياسة")
+    glossary.hint(entries)      # "\nUse these terminology mappings: ministry=الوزارة; policy=سياسة"
+    glossary.check(output, entries)
+"""
+
+from __future__ import annotations
+import re, time, threading, unicodedata
+from collections import deque
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from db import DB_PATH, connect, transaction
+from lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+Entry = Tuple[str, str]  # (source_term, target_term)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS glossary (
+    term_key    TEXT PRIMARY KEY,
+    source_term TEXT NOT NULL,
+    target_term TEXT NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS glossary_meta (
+    key TEXT PRIMARY KEY, value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO glossary_meta(key, value) VALUES ('version', 0);
+"""
+
+_DIACRITICS = re.compile("[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]")
+_ALEF = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ى": "ي"})
+_SPACE = re.compile(r"\s+")
+# Arabic proclitics that may be glued to the start of a term, in their fixed order:
+# conjunction (wa-, fa-), preposition (bi-, ka-, li-), article (al-; li- + al- is written لل),
+# e.g. و، بال، وبال، فكال، ولل
+_PROCLITICS = re.compile(r"[وف]?(?:[بكل]?ال|لل|[بكل])?")
+
+_ready: set = set()
+_lock = threading.Lock()
+_compiled: Dict[str, Tuple[int, "Matcher"]] = {}
+_counters = {"segments": 0, "matched_entries": 0, "match_seconds": 0.0,
+             "hint_chars": 0, "full_hint_chars": 0, "checks": 0, "expected": 0, "used": 0}
+
+
+def normalize(text: Any) -> str:
+    """Matching form of a term or segment."""
+    if text is None:
+        return ""
+    s = unicodedata.normalize("NFC", str(text)).casefold()
+    s = _DIACRITICS.sub("", s).translate(_ALEF)
+    return _SPACE.sub(" ", s).strip()
+
+
+def _is_word(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+def _is_arabic(s: str) -> bool:
+    return any("\u0600" <= ch <= "\u06FF" for ch in s)
+
+
+class Matcher:
+    """Aho-Corasick automaton over normalised source terms."""
+
+    def __init__(self, entries: Iterable[Entry]):
+        self.entries: Dict[str, Entry] = {}
+        for src, tgt in entries:
+            key = normalize(src)
+            if key and str(tgt).strip():
+                self.entries[key] = (str(src).strip(), str(tgt).strip())
+        self.full_hint_chars = len(hint(list(self.entries.values())))
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[str]] = [[]]
+        for key in self.entries:
+            node = 0
+            for ch in key:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({}); self._fail.append(0); self._out.append([])
+                node = nxt
+            self._out[node].append(key)
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _bounded(self, text: str, start: int, end: int, key: str) -> bool:
+        if end < len(text) and _is_word(text[end]) and not _is_arabic(key):
+            return False  # Latin terms must end at a word boundary; Arabic ones may take suffixes
+        if start == 0 or not _is_word(text[start - 1]):
+            return True
+        if not _is_arabic(key):
+            return False
+        i = start
+        while i > 0 and _is_word(text[i - 1]):
+            i -= 1
+        return i < start and _PROCLITICS.fullmatch(text, i, start) is not None
+
+    def find_normalized(self, text: str) -> List[Entry]:
+        """Entries whose term occurs in already-normalised `text`, in order of first occurrence."""
+        found: Dict[str, Entry] = {}
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for key in self._out[node]:
+                if key not in found and self._bounded(text, i + 1 - len(key), i + 1, key):
+                    found[key] = self.entries[key]
+        return list(found.values())
+
+    def find(self, text: str) -> List[Entry]:
+        return self.find_normalized(normalize(text))
+
+
+# ------------- Store -------------
+def _conn(path: str = DB_PATH):
+    conn = connect(path)
+    if path not in _ready:
+        conn.executescript(_SCHEMA)
+        _ready.add(path)
+    return conn
+
+
+def _version(path: str = DB_PATH) -> int:
+    return _conn(path).execute("SELECT value FROM glossary_meta WHERE key = 'version'").fetchone()[0]
+
+
+def upsert(entries: Iterable[Entry], replace: bool = False, path: str = DB_PATH) -> int:
+    """Add or update (source_term, target_term) entries; `replace` drops the rest. Returns entries written."""
+    _conn(path)
+    now = time.time()
+    rows = [(normalize(s), str(s).strip(), str(t).strip(), now) for s, t in entries
+            if normalize(s) and str(t).strip()]
+    with transaction(path) as c:
+        if replace:
+            c.execute("DELETE FROM glossary")
+        c.executemany("INSERT OR REPLACE INTO glossary(term_key, source_term, target_term, updated_at) "
+                      "VALUES (?, ?, ?, ?)", rows)
+        c.execute("UPDATE glossary_meta SET value = value + 1 WHERE key = 'version'")
+    return len(rows)
+
+
+def import_frame(df: Any, replace: bool = False, path: str = DB_PATH) -> int:
+    """Load a CSV-shaped DataFrame with source_term/target_term columns (or the first two columns)."""
+    cols = ["source_term", "target_term"] if {"source_term", "target_term"} <= set(df.columns) else list(df.columns[:2])
+    sub = df[cols].dropna()
+    return upsert(sub.itertuples(index=False, name=None), replace=replace, path=path)
+
+
+def delete(source_terms: Iterable[str], path: str = DB_PATH) -> int:
+    keys = [(normalize(s),) for s in source_terms]
+    _conn(path)
+    with transaction(path) as c:
+        n = c.executemany("DELETE FROM glossary WHERE term_key = ?", keys).rowcount
+        c.execute("UPDATE glossary_meta SET value = value + 1 WHERE key = 'version'")
+    return n
+
+
+def load_all(path: str = DB_PATH):
+    rows = [dict(r) for r in _conn(path).execute(
+        "SELECT source_term, target_term FROM glossary ORDER BY source_term")]
+    return pd.DataFrame(rows, columns=["source_term", "target_term"])
+
+
+def matcher(path: str = DB_PATH) -> Matcher:
+    """Compiled matcher for the stored glossary, rebuilt only after the table changes."""
+    version = _version(path)
+    cached = _compiled.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    m = Matcher((r["source_term"], r["target_term"]) for r in
+                _conn(path).execute("SELECT source_term, target_term FROM glossary"))
+    _compiled[path] = (version, m)
+    return m
+
+
+# ------------- Ad-hoc "a=b, c=d" terms -------------
+def parse_terms(terms: str) -> List[Entry]:
+    out = []
+    for t in (terms or "").split(","):
+        if "=" in t:
+            src, tgt = t.split("=", 1)
+            if src.strip() and tgt.strip():
+                out.append((src.strip(), tgt.strip()))
+    return out
+
+
+@lru_cache(maxsize=256)
+def _terms_matcher(terms: str) -> Matcher:
+    return Matcher(parse_terms(terms))
+
+
+# ------------- Matching / prompt / compliance -------------
+def match(text: str, terms: str = "", path: str = DB_PATH) -> List[Entry]:
+    """Stored and ad-hoc entries that occur in `text` (ad-hoc wins on conflicts)."""
+    t0 = time.perf_counter()
+    norm = normalize(text)
+    stored = matcher(path)
+    adhoc = _terms_matcher(terms or "")
+    found: Dict[str, Entry] = {normalize(s): (s, t) for s, t in stored.find_normalized(norm)}
+    found.update({normalize(s): (s, t) for s, t in adhoc.find_normalized(norm)})
+    entries = list(found.values())
+    with _lock:
+        _counters["segments"] += 1
+        _counters["matched_entries"] += len(entries)
+        _counters["match_seconds"] += time.perf_counter() - t0
+        _counters["hint_chars"] += len(hint(entries))
+        _counters["full_hint_chars"] += stored.full_hint_chars + adhoc.full_hint_chars
+    return entries
+
+
+def hint(entries: List[Entry]) -> str:
+    """System-prompt suffix for the given entries (same wording as the old terms hint)."""
+    if not entries:
+        return ""
+    return "\nUse these terminology mappings: " + "; ".join(f"{s}={t}" for s, t in entries)
+
+
+def check(output: str, entries: List[Entry]) -> Dict[str, Any]:
+    """Which matched target terms appear in the translation."""
+    norm = normalize(output)
+    missing = [(s, t) for s, t in entries if normalize(t) not in norm]
+    used = len(entries) - len(missing)
+    with _lock:
+        _counters["checks"] += 1
+        _counters["expected"] += len(entries)
+        _counters["used"] += used
+    return {"expected": len(entries), "used": used, "missing": missing,
+            "compliance": round(used / len(entries), 4) if entries else None}
+
+
+def stats(path: str = DB_PATH) -> Dict[str, Any]:
+    """Glossary size, mean match time, prompt characters/tokens saved and compliance so far."""
+    with _lock:
+        c = dict(_counters)
+    saved = c["full_hint_chars"] - c["hint_chars"]
+    try:
+        size: Optional[int] = len(matcher(path))
+    except Exception:
+        size = None
+    return {
+        "entries": size,
+        "segments": c["segments"],
+        "mean_match_ms": round(1000 * c["match_seconds"] / c["segments"], 4) if c["segments"] else 0.0,
+        "mean_matched_entries": round(c["matched_entries"] / c["segments"], 2) if c["segments"] else 0.0,
+        "prompt_chars_saved": saved,
+        "prompt_tokens_saved": saved // 4,  # ~4 characters per token, as in batch_mt.estimate_tokens
+        "compliance": round(c["used"] / c["expected"], 4) if c["expected"] else None,
+    }
@@ -0,0 +1,67 @@
+# import_audit.py
+"""
+Import-time audit: how long does a cold `import <module>` take, and which
+dependencies dominate it? Each module is imported in a fresh interpreter with
+`python -X importtime`, so results reflect a real cold start.
+"""
+
+from __future__ import annotations
+import os, subprocess, sys
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """Rows of {module, self_ms, cumulative_ms, depth} from -X importtime output (children first)."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_s, cum_s, name = line[len("import time:"):].split("|", 2)
+            self_us, cum_us = int(self_s), int(cum_s)
+        except ValueError:
+            continue
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        rows.append({"module": name.strip(), "self_ms": self_us / 1000,
+                     "cumulative_ms": cum_us / 1000, "depth": depth})
+    return rows
+
+
+def audit_import(module: str, top: int = 10, cwd: Optional[str] = None, timeout: float = 300) -> Dict[str, Any]:
+    """
+    Cold-import `module` in a subprocess.
+
+    Returns:
+        {"module", "ok", "error", "total_ms", "top": heaviest direct dependencies}
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd or REPO_ROOT, capture_output=True, text=True, timeout=timeout,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [REPO_ROOT, os.getenv("PYTHONPATH")]))},
+    )
+    rows = _parse_importtime(proc.stderr)
+    total, deps = 0.0, []
+    for i in range(len(rows) - 1, -1, -1):
+        if rows[i]["module"] == module and rows[i]["depth"] == 0:
+            total = rows[i]["cumulative_ms"]
+            # The module's direct imports are the depth-1 rows printed just before it
+            j = i - 1
+            while j >= 0 and rows[j]["depth"] > 0:
+                if rows[j]["depth"] == 1:
+                    deps.append(rows[j])
+                j -= 1
+            break
+    deps.sort(key=lambda r: r["cumulative_ms"], reverse=True)
+    err = ""
+    if proc.returncode != 0:
+        tail = proc.stderr.strip().splitlines()
+        err = tail[-1] if tail else f"exit {proc.returncode}"
+    return {"module": module, "ok": proc.returncode == 0, "error": err,
+            "total_ms": round(total, 1),
+            "top": [{"module": d["module"], "cumulative_ms": round(d["cumulative_ms"], 1)} for d in deps[:top]]}
+
+
+def audit_imports(modules: List[str], top: int = 10) -> List[Dict[str, Any]]:
+    return [audit_import(m, top=top) for m in modules]
@@ -0,0 +1,45 @@
+# lazy.py
+"""
+Deferred imports for heavy dependencies.
+
+    pd = lazy_import("pandas")   # nothing imported yet
+    pd.DataFrame(...)            # pandas is imported on first attribute access
+
+Keeps `import utils_mt` (and every page that imports it) from paying for pandas,
+torch, etc. until an interaction actually needs them.
+"""
+
+from __future__ import annotations
+import importlib, threading
+from types import ModuleType
+from typing import Any, Optional
+
+
+class LazyModule:
+    """Module proxy that imports `name` the first time an attribute is read."""
+
+    def __init__(self, name: str):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+        self.__dict__["_lock"] = threading.Lock()
+
+    def _load(self) -> ModuleType:
+        mod: Optional[ModuleType] = self.__dict__["_module"]
+        if mod is None:
+            with self.__dict__["_lock"]:
+                mod = self.__dict__["_module"]
+                if mod is None:
+                    mod = importlib.import_module(self.__dict__["_name"])
+                    self.__dict__["_module"] = mod
+        return mod
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.__dict__["_module"] is not None else "not loaded"
+        return f"<lazy module {self.__dict__['_name']!r} ({state})>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
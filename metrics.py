@@ -1,52 +1,385 @@
-from typing import Dict, List, Union
-from sacrebleu.metrics import BLEU, TER
-from bert_score import score as bertscore_score
+"""
+Translation quality metrics behind a small registry.
 
+Metrics are grouped into tiers so callers only pay for what they need:
+- "fast":   BLEU, chrF, TER (sacrebleu; milliseconds, safe to run on every keystroke)
+- "neural": BERTScore (torch; seconds on CPU, run on submit / in the background)
 
-bleu_metric = BLEU()
-ter_metric = TER()
+Nothing heavy is imported until a metric from that tier is first used. New metrics
+can be added with register_metric() (or from a module listed in EDUAPP_METRIC_PLUGINS)
+without touching the pages.
+"""
+import os, time, threading, importlib
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+from perf import timed
 
 
-def score_all(candidate: str, reference: str, lang: str = "en") -> Dict[str, Union[float, str]]:
+# ------------- BERTScore model registry -------------
+# Loading a BERTScore model (tokenizer + transformer weights) takes seconds on CPU,
+# so scorers are loaded once per process and kept warm across Streamlit reruns and
+# sessions. Least-recently-used models are evicted once the memory cap is exceeded.
+BERTSCORE_CACHE_MB = float(os.getenv("BERTSCORE_CACHE_MB", "2048"))
+
+
+def _model_size_mb(scorer: Any) -> float:
+    """Approximate in-memory size of a BERTScorer's transformer weights."""
+    try:
+        return sum(p.numel() * p.element_size() for p in scorer._model.parameters()) / 2**20
+    except Exception:
+        return 0.0
+
+
+class ScorerRegistry:
+    """
+    Process-wide LRU cache of BERTScorer instances keyed by (lang, model_type).
+    Thread-safe: concurrent callers asking for the same model wait for one load.
+    """
+
+    def __init__(self, max_mb: float = BERTSCORE_CACHE_MB):
+        self.max_mb = max_mb
+        self._scorers: "OrderedDict[Tuple[str, Optional[str]], Any]" = OrderedDict()
+        self._sizes: Dict[Tuple[str, Optional[str]], float] = {}
+        self._lock = threading.RLock()
+        self._key_locks: Dict[Tuple[str, Optional[str]], threading.Lock] = {}
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def _stat(self, key: Tuple[str, Optional[str]]) -> Dict[str, float]:
+        name = f"{key[0]}:{key[1] or 'default'}"
+        return self._stats.setdefault(name, {
+            "loads": 0, "load_seconds": 0.0, "evictions": 0,
+            "calls": 0, "call_seconds": 0.0, "last_call_seconds": 0.0,
+        })
+
+    def get(self, lang: str = "en", model_type: Optional[str] = None) -> Any:
+        """Return a warm scorer, loading it on first use."""
+        key = (lang, model_type)
+        with self._lock:
+            if key in self._scorers:
+                self._scorers.move_to_end(key)
+                return self._scorers[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                if key in self._scorers:
+                    self._scorers.move_to_end(key)
+                    return self._scorers[key]
+            from bert_score import BERTScorer  # heavy: pulls in torch + transformers
+            t0 = time.perf_counter()
+            scorer = BERTScorer(lang=lang, model_type=model_type)
+            elapsed = time.perf_counter() - t0
+            with self._lock:
+                stat = self._stat(key)
+                stat["loads"] += 1
+                stat["load_seconds"] += elapsed
+                self._scorers[key] = scorer
+                self._sizes[key] = _model_size_mb(scorer)
+                self._evict()
+            return scorer
+
+    def _evict(self):
+        """Drop least-recently-used models until under the memory cap (keep at least one)."""
+        while len(self._scorers) > 1 and sum(self._sizes.values()) > self.max_mb:
+            old, _ = self._scorers.popitem(last=False)
+            self._sizes.pop(old, None)
+            self._stat(old)["evictions"] += 1
+
+    def record_call(self, lang: str, model_type: Optional[str], seconds: float):
+        with self._lock:
+            stat = self._stat((lang, model_type))
+            stat["calls"] += 1
+            stat["call_seconds"] += seconds
+            stat["last_call_seconds"] = seconds
+
+    def stats(self) -> Dict[str, Any]:
+        """Load-time / latency counters plus which models are currently resident."""
+        with self._lock:
+            return {
+                "max_mb": self.max_mb,
+                "resident": {f"{k[0]}:{k[1] or 'default'}": round(v, 1) for k, v in self._sizes.items()},
+                "models": {k: dict(v) for k, v in self._stats.items()},
+            }
+
+    def clear(self):
+        with self._lock:
+            self._scorers.clear()
+            self._sizes.clear()
+
+
+scorer_registry = ScorerRegistry()
+
+
+def get_bertscorer(lang: str = "en", model_type: Optional[str] = None) -> Any:
+    """Shortcut for the process-wide registry."""
+    return scorer_registry.get(lang, model_type)
+
+
+
+# ------------- Lazy sacrebleu metrics -------------
+@lru_cache(maxsize=None)
+def _sacrebleu(name: str) -> Any:
+    from sacrebleu.metrics import BLEU, CHRF, TER
+    return {"bleu": BLEU, "chrf": CHRF, "ter": TER}[name]()
+
+
+def _sacrebleu_sentence(name: str) -> Callable[[str, str, str], Dict[str, float]]:
+    def _fn(candidate: str, reference: str, lang: str) -> Dict[str, float]:
+        # sacrebleu expects: sys_stream, [ref_streams]
+        return {name: round(float(_sacrebleu(name).sentence_score(candidate, [reference]).score), 4)}
+    return _fn
+
+
+def _sacrebleu_batch(name: str):
+    def _fn(cands: List[str], refs: List[str], lang: str,
+            batch_size: Optional[int] = None) -> Tuple[List[Dict[str, float]], Dict[str, float]]:
+        # One statistics pass; sentence and corpus scores both come from it
+        m = _sacrebleu(name)
+        stats = m._extract_corpus_statistics(cands, [refs])
+        rows = [{name: round(float(m._compute_score_from_stats(s).score), 4)} for s in stats]
+        return rows, {name: round(float(m._aggregate_and_compute(stats).score), 4)}
+    return _fn
+
+
+# ------------- BERTScore -------------
+def _bertscore_sentence(candidate: str, reference: str, lang: str) -> Dict[str, float]:
+    rows, _ = _bertscore_batch([candidate], [reference], lang)
+    return rows[0]
+
+
+def _bertscore_batch(cands: List[str], refs: List[str], lang: str,
+                     batch_size: Optional[int] = None) -> Tuple[List[Dict[str, float]], Dict[str, float]]:
+    # BERTScore returns tensors; the scorer stays loaded between calls
+    scorer = get_bertscorer(lang)
+    t0 = time.perf_counter()
+    if BERTSCORE_REF_CACHE:
+        # Reference embeddings come from the on-disk cache; only candidates are encoded
+        import emb_cache
+        P, R, F1 = emb_cache.score(scorer, cands, refs, batch_size=batch_size or BERTSCORE_BATCH_SIZE)
+    else:
+        P, R, F1 = scorer.score(cands, refs, verbose=False, batch_size=batch_size or BERTSCORE_BATCH_SIZE)
+    scorer_registry.record_call(lang, None, time.perf_counter() - t0)
+    rows = [{
+        "bertscore_precision": round(float(P[i]), 4),
+        "bertscore_recall": round(float(R[i]), 4),
+        "bertscore_f1": round(float(F1[i]), 4),
+    } for i in range(len(cands))]
+    corpus = {
+        "bertscore_precision": round(float(P.mean()), 4),
+        "bertscore_recall": round(float(R.mean()), 4),
+        "bertscore_f1": round(float(F1.mean()), 4),
+    }
+    return rows, corpus
+
+
+# ------------- Metric registry -------------
+TIERS = ("fast", "neural")
+BERTSCORE_BATCH_SIZE = int(os.getenv("BERTSCORE_BATCH_SIZE", "64"))
+BERTSCORE_REF_CACHE = os.getenv("BERTSCORE_REF_CACHE", "1").strip().lower() not in ("0", "false", "no")
+
+_METRICS: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_timings: Dict[str, Dict[str, float]] = {}
+_timings_lock = threading.Lock()
+
+
+def register_metric(
+    name: str,
+    fn: Callable[[str, str, str], Dict[str, float]],
+    tier: str = "fast",
+    empty: Optional[Dict[str, float]] = None,
+    batch_fn: Optional[Callable[..., Tuple[List[Dict[str, float]], Dict[str, float]]]] = None,
+):
     """
-    Compute BLEU, TER, and BERTScore for a candidate translation against a reference.
+    Add (or replace) a metric.
+
+    Args:
+        name: Registry key, e.g. 'chrf'
+        fn: fn(candidate, reference, lang) -> {output_key: value}
+        tier: 'fast' or 'neural'
+        empty: Values reported when candidate or reference is blank
+        batch_fn: Optional batch_fn(cands, refs, lang, batch_size) -> (per_row, corpus);
+            defaults to calling fn per row and averaging
+    """
+    if tier not in TIERS:
+        raise ValueError(f"unknown tier {tier!r}; expected one of {TIERS}")
+    _METRICS[name] = {"fn": fn, "tier": tier, "empty": dict(empty or {name: 0.0}), "batch_fn": batch_fn}
+
+
+def available_metrics(tiers: Optional[Sequence[str]] = None) -> List[str]:
+    _load_plugins()
+    return [n for n, m in _METRICS.items() if tiers is None or m["tier"] in tiers]
+
+
+def _record_timing(name: str, seconds: float):
+    with _timings_lock:
+        t = _timings.setdefault(name, {"calls": 0, "total_seconds": 0.0, "last_seconds": 0.0})
+        t["calls"] += 1
+        t["total_seconds"] += seconds
+        t["last_seconds"] = seconds
+
+
+def metric_timings() -> Dict[str, Dict[str, float]]:
+    """Per-metric call counts and wall time in this process."""
+    with _timings_lock:
+        return {k: dict(v) for k, v in _timings.items()}
+
+
+_plugins_loaded = False
+
+def _load_plugins():
+    """Import modules listed in EDUAPP_METRIC_PLUGINS; they call register_metric() on import."""
+    global _plugins_loaded
+    if _plugins_loaded:
+        return
+    _plugins_loaded = True
+    for mod in filter(None, (m.strip() for m in os.getenv("EDUAPP_METRIC_PLUGINS", "").split(","))):
+        importlib.import_module(mod)
+
+
+register_metric("bleu", _sacrebleu_sentence("bleu"), "fast", {"bleu": 0.0}, _sacrebleu_batch("bleu"))
+register_metric("chrf", _sacrebleu_sentence("chrf"), "fast", {"chrf": 0.0}, _sacrebleu_batch("chrf"))
+register_metric("ter", _sacrebleu_sentence("ter"), "fast", {"ter": 100.0}, _sacrebleu_batch("ter"))
+register_metric("bertscore", _bertscore_sentence, "neural",
+                {"bertscore_precision": 0.0, "bertscore_recall": 0.0, "bertscore_f1": 0.0},
+                _bertscore_batch)
+
+
+def _select(tiers: Optional[Sequence[str]], metrics: Optional[Sequence[str]]) -> List[str]:
+    names = available_metrics(tiers)
+    if metrics is not None:
+        unknown = set(metrics) - set(_METRICS)
+        if unknown:
+            raise ValueError(f"unknown metric(s): {sorted(unknown)}")
+        names = [n for n in names if n in metrics]
+    return names
+
+
+@timed("metrics.score_all")
+def score_all(
+    candidate: str,
+    reference: str,
+    lang: str = "en",
+    tiers: Optional[Sequence[str]] = None,
+    metrics: Optional[Sequence[str]] = None,
+) -> Dict[str, Union[float, str]]:
+    """
+    Compute registered metrics for a candidate translation against a reference.
 
     Args:
         candidate: MT output or post-edited text
         reference: Gold/reference translation
         lang: Language code for BERTScore model selection (default: 'en')
+        tiers: Only run metrics from these tiers, e.g. ("fast",) while typing (default: all)
+        metrics: Only run these metric names, e.g. ["bleu", "chrf"] (default: all)
 
     Returns:
         Dict of metric scores.
     """
     candidate = (candidate or "").strip()
     reference = (reference or "").strip()
+    names = _select(tiers, metrics)
 
-    if not candidate or not reference:
-        return {
-            "bleu": 0.0,
-            "ter": 100.0,
-            "bertscore_precision": 0.0,
-            "bertscore_recall": 0.0,
-            "bertscore_f1": 0.0,
-        }
-
-    # sacrebleu expects: sys_stream, [ref_streams]
-    bleu = bleu_metric.sentence_score(candidate, [reference]).score
-    ter = ter_metric.sentence_score(candidate, [reference]).score
-
-    # BERTScore returns tensors
-    P, R, F1 = bertscore_score(
-        [candidate],
-        [reference],
-        lang=lang,
-        verbose=False
-    )
-
-    return {
-        "bleu": round(float(bleu), 4),
-        "ter": round(float(ter), 4),
-        "bertscore_precision": round(float(P[0]), 4),
-        "bertscore_recall": round(float(R[0]), 4),
-        "bertscore_f1": round(float(F1[0]), 4),
-    }
+    out: Dict[str, Union[float, str]] = {}
+    for name in names:
+        m = _METRICS[name]
+        if not candidate or not reference:
+            out.update(m["empty"])
+            continue
+        t0 = time.perf_counter()
+        out.update(m["fn"](candidate, reference, lang))
+        _record_timing(name, time.perf_counter() - t0)
+    return out
+
+
+# ------------- Batched / corpus scoring -------------
+@timed("metrics.score_batch")
+def score_batch(
+    candidates: Sequence[str],
+    references: Sequence[str],
+    lang: Union[str, Sequence[str]] = "en",
+    batch_size: int = BERTSCORE_BATCH_SIZE,
+    tiers: Optional[Sequence[str]] = None,
+    metrics: Optional[Sequence[str]] = None,
+) -> Tuple[List[Dict[str, float]], Dict[str, Dict[str, float]]]:
+    """
+    Score many candidate/reference pairs in one pass.
+
+    Args:
+        candidates: MT outputs or post-edits
+        references: Gold/reference translations (same length as candidates)
+        lang: One language code for all rows, or one code per row
+        batch_size: BERTScore forward-pass batch size
+        tiers / metrics: Same selection as score_all
+
+    Returns:
+        (per_sentence, corpus) where per_sentence has the same keys as score_all for
+        every row, and corpus maps language -> corpus-level scores (BLEU/chrF/TER from
+        pooled statistics, means for the rest) plus the row count.
+    """
+    if len(candidates) != len(references):
+        raise ValueError("candidates and references must have the same length")
+    langs = [lang] * len(candidates) if isinstance(lang, str) else list(lang)
+    if len(langs) != len(candidates):
+        raise ValueError("lang must be a string or one code per row")
+    names = _select(tiers, metrics)
+
+    cands = [(c or "").strip() for c in candidates]
+    refs = [(r or "").strip() for r in references]
+    out: List[Dict[str, float]] = [{} for _ in cands]
+    for name in names:
+        for row in out:
+            row.update(_METRICS[name]["empty"])
+    corpus: Dict[str, Dict[str, float]] = {}
+
+    groups: Dict[str, List[int]] = {}
+    for i, (c, r, lg) in enumerate(zip(cands, refs, langs)):
+        if c and r:
+            groups.setdefault(lg or "en", []).append(i)
+
+    for lg, idx in groups.items():
+        # Sort by length so each BERTScore batch pads to similar sizes
+        idx = sorted(idx, key=lambda i: len(cands[i]) + len(refs[i]))
+        hyps = [cands[i] for i in idx]
+        grp_refs = [refs[i] for i in idx]
+        corpus[lg] = {"n": len(idx)}
+        for name in names:
+            m = _METRICS[name]
+            t0 = time.perf_counter()
+            if m["batch_fn"] is not None:
+                rows, agg = m["batch_fn"](hyps, grp_refs, lg, batch_size)
+            else:
+                rows = [m["fn"](h, r, lg) for h, r in zip(hyps, grp_refs)]
+                agg = {k: round(sum(r[k] for r in rows) / len(rows), 4) for k in rows[0]} if rows else {}
+            _record_timing(name, time.perf_counter() - t0)
+            for j, i in enumerate(idx):
+                out[i].update(rows[j])
+            corpus[lg].update(agg)
+    return out, corpus
+
+
+def score_dataframe(
+    df: Any,
+    candidate_col: str = "post_edit",
+    reference_col: str = "reference",
+    lang: str = "en",
+    lang_col: Optional[str] = None,
+    prefix: str = "metric_",
+    batch_size: int = BERTSCORE_BATCH_SIZE,
+    tiers: Optional[Sequence[str]] = None,
+    metrics: Optional[Sequence[str]] = None,
+) -> Dict[str, Dict[str, float]]:
+    """
+    Score a DataFrame column in place, writing `<prefix><metric>` columns
+    (e.g. metric_bleu) for every row. Returns the corpus-level scores.
+    """
+    def _col(name):
+        return ["" if v is None or v != v else str(v) for v in df[name].tolist()]
+
+    langs = _col(lang_col) if lang_col and lang_col in df.columns else lang
+    per_row, corpus = score_batch(_col(candidate_col), _col(reference_col), langs, batch_size,
+                                  tiers=tiers, metrics=metrics)
+    keys = list(per_row[0]) if per_row else []
+    for key in keys:
+        df[f"{prefix}{key}"] = [r[key] for r in per_row]
+    return corpus
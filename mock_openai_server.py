@@ -0,0 +1,155 @@
+# mock_openai_server.py
+"""
+Local OpenAI-compatible server for load tests, CI and offline demos (stdlib only).
+
+Implements POST /v1/chat/completions and GET /v1/models. The "translation" is the
+last user message with a prefix, so outputs are deterministic. Latency, jitter,
+random 5xx errors and periodic 429 rate limits are configurable.
+
+    python mock_openai_server.py --port 8765 --latency-ms 300 --error-rate 0.02 --rate-limit-every 50
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=mock streamlit run Home.py
+
+From Python (e.g. bench/): server = start(port=0, latency_ms=50); server.url; server.shutdown()
+"""
+
+from __future__ import annotations
+import argparse, json, random, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+
+class MockConfig:
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 rate_limit_every: int = 0, prefix: str = "[mock] ", seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_every = rate_limit_every
+        self.prefix = prefix
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "ok": 0, "errors": 0, "rate_limited": 0}
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "MockOpenAI/1.0"
+    config: MockConfig
+
+    def log_message(self, *args: Any):  # keep load-test output clean
+        pass
+
+    def _send(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send(200, {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model"}]})
+        elif self.path.rstrip("/").endswith("/stats"):
+            with self.config.lock:
+                self._send(200, dict(self.config.stats))
+        else:
+            self._send(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        cfg = self.config
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send(404, {"error": {"message": "not found"}})
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        with cfg.lock:
+            cfg.stats["requests"] += 1
+            n = cfg.stats["requests"]
+            delay = max(0.0, cfg.latency_ms + cfg.rng.uniform(-cfg.jitter_ms, cfg.jitter_ms)) / 1000.0
+            fail = cfg.rng.random() < cfg.error_rate
+        if delay:
+            time.sleep(delay)
+        if cfg.rate_limit_every and n % cfg.rate_limit_every == 0:
+            with cfg.lock:
+                cfg.stats["rate_limited"] += 1
+            self._send(429, {"error": {"message": "Rate limit reached (mock)", "type": "rate_limit"}},
+                       {"retry-after": "0"})
+            return
+        if fail:
+            with cfg.lock:
+                cfg.stats["errors"] += 1
+            self._send(500, {"error": {"message": "Internal error (mock)", "type": "server_error"}})
+            return
+        messages = body.get("messages") or []
+        prompt = "".join(str(m.get("content", "")) for m in messages)
+        user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        content = cfg.prefix + str(user)
+        with cfg.lock:
+            cfg.stats["ok"] += 1
+        self._send(200, {
+            "id": f"chatcmpl-mock-{n}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": _estimate_tokens(prompt), "completion_tokens": _estimate_tokens(content),
+                      "total_tokens": _estimate_tokens(prompt) + _estimate_tokens(content)},
+        })
+
+
+class MockServer:
+    """A running mock server; `url` is the OPENAI_BASE_URL to use."""
+
+    def __init__(self, httpd: ThreadingHTTPServer, config: MockConfig):
+        self.httpd = httpd
+        self.config = config
+        host, port = httpd.server_address[:2]
+        self.url = f"http://{host}:{port}/v1"
+
+    def stats(self) -> Dict[str, int]:
+        with self.config.lock:
+            return dict(self.config.stats)
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def start(host: str = "127.0.0.1", port: int = 0, **config: Any) -> MockServer:
+    """Serve in a daemon thread; port=0 picks a free port. Keyword args go to MockConfig."""
+    cfg = MockConfig(**config)
+    handler = type("Handler", (_Handler,), {"config": cfg})
+    httpd = ThreadingHTTPServer((host, port), handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return MockServer(httpd, cfg)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="OpenAI-compatible mock server for EduApp")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 500")
+    ap.add_argument("--rate-limit-every", type=int, default=0, help="answer every Nth request with HTTP 429")
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args()
+    server = start(args.host, args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                   error_rate=args.error_rate, rate_limit_every=args.rate_limit_every, seed=args.seed)
+    print(f"Mock OpenAI server on {server.url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+# mqm.py
+"""
+MQM error annotations, persisted per student and item (data/eduapp.db).
+
+Each error has a category, a severity and a character-offset span [start, end)
+into the annotated candidate. The segment's penalty total is updated in the same
+transaction as each insert/delete, so scores are read, never recomputed:
+
+    score = 100 * (1 - penalty / words)      (MQM-DQF overall quality score)
+
+with severity weights minor=1, major=5, critical=10 (MQM_WEIGHTS overrides,
+e.g. "minor=1,major=5,critical=25").
+
+Inter-annotator agreement uses the segments that two or more students annotated
+over the same candidate text. Every character of those candidates is one unit,
+and each annotator's label is the error category covering it (or "none").
+Krippendorff's alpha (nominal) is computed from the unit × label count matrix
+with a few NumPy matrix products. It handles a different number of annotators
+per item.
+"""
+
+from __future__ import annotations
+import os, time, hashlib
+from typing import Any, Dict, Optional
+from db import DB_PATH, connect, transaction
+from lazy import lazy_import
+
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
+
+CATEGORIES = ["Accuracy:Mistranslation", "Accuracy:Omission", "Accuracy:Addition",
+              "Fluency:Grammar", "Fluency:Punctuation", "Fluency:Spelling",
+              "Style:Terminology", "Style:Register", "Style:Consistency"]
+SEVERITIES = ["minor", "major", "critical"]
+
+
+def _weights() -> Dict[str, float]:
+    w = {"minor": 1.0, "major": 5.0, "critical": 10.0}
+    for part in os.getenv("MQM_WEIGHTS", "").split(","):
+        if "=" in part:
+            k, v = part.split("=", 1)
+            w[k.strip().lower()] = float(v)
+    return w
+
+
+SEVERITY_WEIGHTS = _weights()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS mqm_segments (
+    student     TEXT NOT NULL,
+    item_id     TEXT NOT NULL,
+    source      TEXT NOT NULL DEFAULT '',
+    candidate   TEXT NOT NULL,
+    cand_hash   TEXT NOT NULL,
+    words       INTEGER NOT NULL,
+    n_errors    INTEGER NOT NULL DEFAULT 0,
+    penalty     REAL NOT NULL DEFAULT 0,
+    updated_at  REAL NOT NULL,
+    PRIMARY KEY (student, item_id)
+);
+CREATE INDEX IF NOT EXISTS idx_mqm_segments_item ON mqm_segments(item_id, cand_hash);
+CREATE TABLE IF NOT EXISTS mqm_errors (
+    error_id   INTEGER PRIMARY KEY AUTOINCREMENT,
+    student    TEXT NOT NULL,
+    item_id    TEXT NOT NULL,
+    category   TEXT NOT NULL,
+    severity   TEXT NOT NULL,
+    weight     REAL NOT NULL,
+    span_start INTEGER NOT NULL,
+    span_end   INTEGER NOT NULL,
+    span_text  TEXT NOT NULL,
+    note       TEXT NOT NULL DEFAULT '',
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_mqm_errors_segment ON mqm_errors(student, item_id, span_start);
+CREATE INDEX IF NOT EXISTS idx_mqm_errors_item ON mqm_errors(item_id);
+"""
+
+_ready: set = set()
+
+
+def _conn(path: str = DB_PATH):
+    conn = connect(path)
+    if path not in _ready:
+        conn.executescript(_SCHEMA)
+        _ready.add(path)
+    return conn
+
+
+def word_count(text: str) -> int:
+    return len((text or "").split())
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()[:16]
+
+
+def quality_score(penalty: float, words: int) -> float:
+    return round(100.0 * (1.0 - penalty / max(1, words)), 2)
+
+
+def find_span(candidate: str, text: str, occurrence: int = 1) -> Optional[tuple]:
+    """(start, end) of the `occurrence`-th (1-based) match of `text` in `candidate`, or None."""
+    if not text:
+        return None
+    start = -1
+    for _ in range(max(1, occurrence)):
+        start = candidate.find(text, start + 1)
+        if start < 0:
+            return None
+    return start, start + len(text)
+
+
+# ------------- Writes -------------
+def set_segment(student: str, item_id: str, candidate: str, source: str = "", path: str = DB_PATH) -> bool:
+    """
+    Register the candidate being annotated. Returns False (and changes nothing) if the
+    student already annotated a different candidate for this item: clear_segment() first.
+    """
+    _conn(path)
+    with transaction(path) as c:
+        row = c.execute("SELECT cand_hash, n_errors FROM mqm_segments WHERE student = ? AND item_id = ?",
+                        (student, item_id)).fetchone()
+        if row is not None and row["cand_hash"] == _hash(candidate):
+            return True
+        if row is not None and row["n_errors"]:
+            return False
+        c.execute("INSERT OR REPLACE INTO mqm_segments(student, item_id, source, candidate, cand_hash, words, "
+                  "updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                  (student, item_id, source, candidate, _hash(candidate), word_count(candidate), time.time()))
+    return True
+
+
+def add_error(student: str, item_id: str, category: str, severity: str, start: int, end: int,
+              note: str = "", path: str = DB_PATH) -> int:
+    """Record one error on the registered candidate; returns its id. Raises ValueError on a bad span."""
+    severity = severity.lower()
+    if severity not in SEVERITY_WEIGHTS:
+        raise ValueError(f"unknown severity {severity!r}; expected one of {sorted(SEVERITY_WEIGHTS)}")
+    weight = SEVERITY_WEIGHTS[severity]
+    _conn(path)
+    with transaction(path) as c:
+        seg = c.execute("SELECT candidate FROM mqm_segments WHERE student = ? AND item_id = ?",
+                        (student, item_id)).fetchone()
+        if seg is None:
+            raise ValueError("call set_segment() before adding errors")
+        cand = seg["candidate"]
+        if not 0 <= start <= end <= len(cand):
+            raise ValueError(f"span [{start}, {end}) is outside the candidate (length {len(cand)})")
+        cur = c.execute("INSERT INTO mqm_errors(student, item_id, category, severity, weight, span_start, span_end, "
+                        "span_text, note, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (student, item_id, category, severity, weight, start, end, cand[start:end], note, time.time()))
+        c.execute("UPDATE mqm_segments SET n_errors = n_errors + 1, penalty = penalty + ?, updated_at = ? "
+                  "WHERE student = ? AND item_id = ?", (weight, time.time(), student, item_id))
+        return cur.lastrowid
+
+
+def delete_error(error_id: int, path: str = DB_PATH) -> bool:
+    _conn(path)
+    with transaction(path) as c:
+        row = c.execute("SELECT student, item_id, weight FROM mqm_errors WHERE error_id = ?", (error_id,)).fetchone()
+        if row is None:
+            return False
+        c.execute("DELETE FROM mqm_errors WHERE error_id = ?", (error_id,))
+        c.execute("UPDATE mqm_segments SET n_errors = n_errors - 1, penalty = MAX(0, penalty - ?), updated_at = ? "
+                  "WHERE student = ? AND item_id = ?", (row["weight"], time.time(), row["student"], row["item_id"]))
+    return True
+
+
+def clear_segment(student: str, item_id: str, path: str = DB_PATH):
+    _conn(path)
+    with transaction(path) as c:
+        c.execute("DELETE FROM mqm_errors WHERE student = ? AND item_id = ?", (student, item_id))
+        c.execute("DELETE FROM mqm_segments WHERE student = ? AND item_id = ?", (student, item_id))
+
+
+# ------------- Reads -------------
+def segment(student: str, item_id: str, path: str = DB_PATH) -> Optional[Dict[str, Any]]:
+    row = _conn(path).execute("SELECT * FROM mqm_segments WHERE student = ? AND item_id = ?",
+                              (student, item_id)).fetchone()
+    if row is None:
+        return None
+    out = dict(row)
+    out["score"] = quality_score(out["penalty"], out["words"])
+    return out
+
+
+def errors(student: Optional[str] = None, item_id: Optional[str] = None, path: str = DB_PATH):
+    where, params = [], []
+    if student is not None:
+        where.append("student = ?"); params.append(student)
+    if item_id is not None:
+        where.append("item_id = ?"); params.append(item_id)
+    sql = "SELECT * FROM mqm_errors" + (" WHERE " + " AND ".join(where) if where else "") + \
+          " ORDER BY student, item_id, span_start"
+    return pd.read_sql_query(sql, _conn(path), params=params)
+
+
+def segment_scores(path: str = DB_PATH):
+    """One row per annotated (student, item) with its MQM score."""
+    df = pd.read_sql_query("SELECT student, item_id, words, n_errors, penalty, updated_at FROM mqm_segments",
+                           _conn(path))
+    df["score"] = (100.0 * (1.0 - df["penalty"] / df["words"].clip(lower=1))).round(2)
+    return df
+
+
+def summary(by: str = "student", path: str = DB_PATH):
+    """Per-student or per-item totals: segments, errors, words, mean and pooled MQM score."""
+    if by not in ("student", "item_id"):
+        raise ValueError("by must be 'student' or 'item_id'")
+    df = pd.read_sql_query(
+        f"SELECT {by}, COUNT(*) AS segments, SUM(n_errors) AS errors, SUM(words) AS words, "
+        f"SUM(penalty) AS penalty, AVG(100.0 * (1.0 - penalty / MAX(words, 1))) AS mean_score "
+        f"FROM mqm_segments GROUP BY {by} ORDER BY {by}", _conn(path))
+    df["pooled_score"] = (100.0 * (1.0 - df["penalty"] / df["words"].clip(lower=1))).round(2)
+    df["mean_score"] = df["mean_score"].round(2)
+    return df
+
+
+def category_breakdown(path: str = DB_PATH):
+    """Error counts by category × severity."""
+    df = pd.read_sql_query("SELECT category, severity, COUNT(*) AS n FROM mqm_errors GROUP BY category, severity",
+                           _conn(path))
+    if df.empty:
+        return df
+    return df.pivot(index="category", columns="severity", values="n").fillna(0).astype(int).reset_index()
+
+
+# ------------- Agreement -------------
+def krippendorff_alpha(counts) -> float:
+    """
+    Nominal Krippendorff's alpha from a (units, labels) matrix of how many annotators
+    gave each label to each unit. Units with fewer than two annotators are ignored.
+    """
+    n_uk = np.asarray(counts, dtype=float)
+    m = n_uk.sum(axis=1)
+    n_uk, m = n_uk[m >= 2], m[m >= 2]
+    if not len(m):
+        return float("nan")
+    scaled = n_uk / (m - 1)[:, None]
+    coincidence = scaled.T @ n_uk - np.diag(scaled.sum(axis=0))
+    n_c = coincidence.sum(axis=0)
+    n = n_c.sum()
+    expected = n * n - (n_c ** 2).sum()
+    if expected <= 0:
+        return 1.0  # everyone used a single label everywhere
+    return float(1.0 - (n - 1) * (n - np.trace(coincidence)) / expected)
+
+
+def _label_counts(path: str = DB_PATH):
+    """(units × labels) counts for characters of candidates annotated by 2+ students; label 0 = no error."""
+    conn = _conn(path)
+    segs = pd.read_sql_query(
+        "SELECT s.student, s.item_id, s.cand_hash, LENGTH(s.candidate) AS n_chars FROM mqm_segments s "
+        "JOIN (SELECT item_id, cand_hash FROM mqm_segments GROUP BY item_id, cand_hash HAVING COUNT(*) >= 2) g "
+        "USING (item_id, cand_hash)", conn)
+    labels = ["none"] + CATEGORIES
+    if segs.empty:
+        return np.zeros((0, len(labels))), np.zeros((0, 2)), 0
+    errs = pd.read_sql_query(
+        "SELECT e.student, e.item_id, e.category, e.weight, e.span_start, e.span_end FROM mqm_errors e "
+        "JOIN mqm_segments s USING (student, item_id) "
+        "WHERE (s.item_id, s.cand_hash) IN (SELECT item_id, cand_hash FROM mqm_segments "
+        "GROUP BY item_id, cand_hash HAVING COUNT(*) >= 2) ORDER BY e.weight", conn)
+    cat_index = {c: i + 1 for i, c in enumerate(CATEGORIES)}
+    # One row of character units per (item, candidate); each annotator adds one label per unit
+    groups = segs.groupby(["item_id", "cand_hash"])
+    offsets, total = {}, 0
+    for key, g in groups:
+        offsets[key] = total
+        total += int(g["n_chars"].iloc[0])
+    seg_offset = {(r.student, r.item_id): offsets[(r.item_id, r.cand_hash)] for r in segs.itertuples()}
+    # Per annotator label array, stacked: unit id = offset + char, label from the heaviest covering error
+    ann_labels = {k: np.zeros(int(n), dtype=np.int64) for k, n in
+                  zip(zip(segs["student"], segs["item_id"]), segs["n_chars"])}
+    for e in errs.itertuples():
+        ann_labels[(e.student, e.item_id)][e.span_start:e.span_end] = cat_index.get(e.category, 0)
+    units = np.concatenate([seg_offset[k] + np.arange(len(v)) for k, v in ann_labels.items()])
+    labs = np.concatenate(list(ann_labels.values()))
+    counts = np.zeros((total, len(labels)))
+    np.add.at(counts, (units, labs), 1)
+    binary = np.stack([counts[:, 0], counts[:, 1:].sum(axis=1)], axis=1)
+    return counts, binary, len(groups)
+
+
+def agreement(path: str = DB_PATH) -> Dict[str, Any]:
+    """Class-wide character-level agreement on error category and on error / no error."""
+    counts, binary, items = _label_counts(path)
+    return {
+        "items": items,
+        "characters": int(len(counts)),
+        "alpha_category": round(krippendorff_alpha(counts), 4) if len(counts) else None,
+        "alpha_error": round(krippendorff_alpha(binary), 4) if len(binary) else None,
+    }
+
+
+def score_spread(path: str = DB_PATH):
+    """Per item with 2+ annotators: how far their MQM scores are apart."""
+    df = segment_scores(path)
+    g = df.groupby("item_id")["score"]
+    out = pd.DataFrame({"annotators": g.size(), "mean_score": g.mean().round(2),
+                        "std": g.std().round(2), "range": (g.max() - g.min()).round(2)}).reset_index()
+    return out[out["annotators"] >= 2]
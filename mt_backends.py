@@ -0,0 +1,252 @@
+# mt_backends.py
+"""
+Pluggable machine-translation backends behind mt_openai.
+
+- "openai": Chat Completions via the shared client in utils_mt (needs the network
+  and OPENAI_API_KEY; OPENAI_BASE_URL may point at mock_openai_server.py)
+- "marian": a local MarianMT checkpoint per direction (en->ar / ar->en), loaded once
+  per process and kept warm; runs on CPU, no network after the first download.
+  System prompts and glossary hints do not apply to it.
+- "echo":   deterministic stub that returns the source text, for CI and load tests
+
+Every backend records segments, characters and busy time so pages can show
+throughput. EDUAPP_MT_BACKEND picks the default and EDUAPP_MT_FALLBACK lists
+backends to try, in order, when the chosen one fails (e.g. "marian,echo").
+"""
+
+from __future__ import annotations
+import os, re, time, threading, importlib.util
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import perf
+
+DEFAULT_BACKEND = os.getenv("EDUAPP_MT_BACKEND", "openai").strip().lower()
+FALLBACK_BACKENDS = [b.strip().lower() for b in os.getenv("EDUAPP_MT_FALLBACK", "").split(",") if b.strip()]
+MARIAN_MODELS = {
+    "en-ar": os.getenv("MARIAN_MODEL_EN_AR", "Helsinki-NLP/opus-mt-en-ar"),
+    "ar-en": os.getenv("MARIAN_MODEL_AR_EN", "Helsinki-NLP/opus-mt-ar-en"),
+}
+MARIAN_BATCH_SIZE = int(os.getenv("MARIAN_BATCH_SIZE", "16"))
+ECHO_LATENCY_MS = float(os.getenv("MT_ECHO_LATENCY_MS", "0"))
+
+
+class BackendUnavailable(RuntimeError):
+    """The backend cannot run here (missing library, key, ...); str(e) is shown to the user as-is."""
+
+
+class MTBackend:
+    """Base class: subclasses implement _translate_batch."""
+
+    name = "base"
+    cacheable = True  # whether mt_cache may store its outputs
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "segments": 0, "chars": 0, "seconds": 0.0, "errors": 0}
+
+    def available(self) -> bool:
+        return True
+
+    def _translate_batch(self, texts: List[str], system_prompt: str, model: str) -> List[str]:
+        raise NotImplementedError
+
+    def translate_batch(self, texts: Sequence[str], system_prompt: str = "", model: str = "") -> List[str]:
+        """Translate several segments; raises on failure."""
+        t0 = time.perf_counter()
+        try:
+            out = self._translate_batch(list(texts), system_prompt, model)
+        except Exception:
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["segments"] += len(texts)
+            self._stats["chars"] += sum(len(t) for t in texts)
+            self._stats["seconds"] += time.perf_counter() - t0
+        return out
+
+    def translate(self, text: str, system_prompt: str = "", model: str = "") -> str:
+        return self.translate_batch([text], system_prompt, model)[0]
+
+    def throughput(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+        busy = s.pop("seconds")
+        s["busy_seconds"] = round(busy, 3)
+        s["segments_per_second"] = round(s["segments"] / busy, 2) if busy else 0.0
+        s["mean_latency_ms"] = round(1000 * busy / s["calls"], 1) if s["calls"] else 0.0
+        return s
+
+
+class OpenAIBackend(MTBackend):
+    name = "openai"
+
+    def available(self) -> bool:
+        return importlib.util.find_spec("openai") is not None
+
+    def _translate_batch(self, texts, system_prompt, model):
+        import utils_mt
+        client, err = utils_mt._get_openai_client()
+        if err:
+            raise BackendUnavailable(err)
+        out = []
+        for text in texts:
+            resp = client.chat.completions.create(
+                model=model or "gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": text},
+                ],
+                temperature=0,
+            )
+            out.append(resp.choices[0].message.content.strip())
+            perf.record_tokens(model or "gpt-4o-mini", getattr(resp, "usage", None))
+        return out
+
+
+def _direction(text: str) -> str:
+    """en-ar unless the text is mostly Arabic script."""
+    letters = [ch for ch in text if ch.isalpha()]
+    arabic = sum("\u0600" <= ch <= "\u06FF" for ch in letters)
+    return "ar-en" if letters and arabic * 2 > len(letters) else "en-ar"
+
+
+class MarianBackend(MTBackend):
+    """Local MarianMT models, one per direction, loaded on first use and kept warm."""
+
+    name = "marian"
+
+    def __init__(self, models: Optional[Dict[str, str]] = None):
+        super().__init__()
+        self.models = dict(models or MARIAN_MODELS)
+        self._loaded: Dict[str, Any] = {}
+        self._load_lock = threading.Lock()
+
+    def available(self) -> bool:
+        return all(importlib.util.find_spec(m) is not None for m in ("transformers", "torch", "sentencepiece"))
+
+    def _get(self, direction: str):
+        pair = self._loaded.get(direction)
+        if pair is not None:
+            return pair
+        with self._load_lock:
+            if direction not in self._loaded:
+                try:
+                    from transformers import MarianMTModel, MarianTokenizer  # type: ignore
+                except Exception as e:
+                    raise BackendUnavailable(f"[Marian unavailable: install transformers, torch and sentencepiece ({e})]")
+                name = self.models[direction]
+                model = MarianMTModel.from_pretrained(name)
+                model.eval()
+                self._loaded[direction] = (MarianTokenizer.from_pretrained(name), model)
+            return self._loaded[direction]
+
+    def warm(self, directions: Sequence[str] = ("en-ar", "ar-en")):
+        for d in directions:
+            self._get(d)
+
+    def _translate_batch(self, texts, system_prompt, model):
+        import torch  # type: ignore
+        out: List[Optional[str]] = [None] * len(texts)
+        by_dir: Dict[str, List[int]] = {}
+        for i, t in enumerate(texts):
+            by_dir.setdefault(_direction(t), []).append(i)
+        for direction, idx in by_dir.items():
+            tok, mdl = self._get(direction)
+            for start in range(0, len(idx), MARIAN_BATCH_SIZE):
+                chunk = idx[start:start + MARIAN_BATCH_SIZE]
+                enc = tok([texts[i] for i in chunk], return_tensors="pt", padding=True, truncation=True)
+                with torch.inference_mode():
+                    gen = mdl.generate(**enc, num_beams=1, max_new_tokens=512)
+                for i, s in zip(chunk, tok.batch_decode(gen, skip_special_tokens=True)):
+                    out[i] = s.strip()
+        return [o or "" for o in out]
+
+
+class EchoBackend(MTBackend):
+    """Returns the source unchanged (after MT_ECHO_LATENCY_MS); never cached."""
+
+    name = "echo"
+    cacheable = False
+
+    def _translate_batch(self, texts, system_prompt, model):
+        if ECHO_LATENCY_MS > 0:
+            time.sleep(ECHO_LATENCY_MS / 1000.0 * len(texts))
+        return list(texts)
+
+
+_BACKENDS: Dict[str, MTBackend] = {}
+_registry_lock = threading.Lock()
+
+
+def register_backend(backend: MTBackend):
+    """Add (or replace) a backend under backend.name."""
+    with _registry_lock:
+        _BACKENDS[backend.name] = backend
+
+
+for _b in (OpenAIBackend(), MarianBackend(), EchoBackend()):
+    register_backend(_b)
+
+
+def get_backend(name: Optional[str] = None) -> MTBackend:
+    name = (name or DEFAULT_BACKEND).lower()
+    if name not in _BACKENDS:
+        raise ValueError(f"unknown MT backend {name!r}; expected one of {sorted(_BACKENDS)}")
+    return _BACKENDS[name]
+
+
+def available_backends() -> List[str]:
+    """Backends whose libraries are installed (echo always is)."""
+    return [n for n, b in _BACKENDS.items() if b.available()]
+
+
+def backend_chain(name: Optional[str] = None) -> List[str]:
+    """The chosen backend followed by the configured fallbacks, without repeats."""
+    chain = [(name or DEFAULT_BACKEND).lower()]
+    for b in FALLBACK_BACKENDS:
+        if b not in chain and b in _BACKENDS:
+            chain.append(b)
+    return chain
+
+
+def throughput() -> Dict[str, Dict[str, Any]]:
+    """Per-backend counters, for the Health Check / Admin pages."""
+    return {n: b.throughput() for n, b in _BACKENDS.items()}
+
+
+def error_text(name: str, exc: Exception) -> str:
+    """The "[... error: ...]" string returned to pages instead of raising."""
+    if isinstance(exc, BackendUnavailable):
+        return str(exc)
+    label = "OpenAI" if name == "openai" else name.capitalize()
+    return f"[{label} error: {exc}]"
+
+
+def translate_with_fallback(texts: Sequence[str], system_prompt: str, model: str,
+                            backend: Optional[str] = None,
+                            on_backend: Optional[Callable[[str], None]] = None) -> List[str]:
+    """
+    Translate with `backend`, then each fallback in turn if it raises. Returns the
+    error string of the first backend for every text if all of them fail.
+    """
+    first_error = None
+    for name in backend_chain(backend):
+        try:
+            out = get_backend(name).translate_batch(texts, system_prompt, model)
+        except Exception as e:
+            first_error = first_error or error_text(name, e)
+            continue
+        if on_backend:
+            on_backend(name)
+        return out
+    return [first_error or "[MT error: no backend]"] * len(texts)
+
+
+# "[OpenAI error: ...]", "[OpenAI key missing: ...]", "[Marian unavailable: ...]", "[MT error: no backend]"
+_ERROR_TEXT = re.compile(r"\[[A-Za-z][\w ]* (?:error|missing|unavailable): .*\]", re.S)
+
+
+def is_error(output: str) -> bool:
+    """Whether `output` is one of the error strings returned instead of a translation."""
+    return bool(_ERROR_TEXT.fullmatch(output or ""))
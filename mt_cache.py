@@ -0,0 +1,118 @@
+# mt_cache.py
+"""
+Content-addressed on-disk cache for deterministic (temperature=0) translations.
+
+Keyed by a SHA-256 fingerprint of (model, full system prompt incl. glossary, text),
+stored in SQLite (data/mt_cache.db). Entries expire after MT_CACHE_TTL_DAYS and the
+least-recently-hit entries are evicted once MT_CACHE_MAX_ENTRIES is exceeded.
+"""
+
+from __future__ import annotations
+import os, json, time, hashlib, threading
+from typing import Any, Dict, Optional
+from db import connect
+from storage import data_path
+
+MT_CACHE_PATH = data_path("mt_cache.db")
+MT_CACHE_TTL_DAYS = float(os.getenv("MT_CACHE_TTL_DAYS", "30"))
+MT_CACHE_MAX_ENTRIES = int(os.getenv("MT_CACHE_MAX_ENTRIES", "50000"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS mt_cache (
+    key        TEXT PRIMARY KEY,
+    model      TEXT NOT NULL,
+    output     TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_hit   REAL NOT NULL,
+    hits       INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_mt_cache_last_hit ON mt_cache(last_hit);
+"""
+
+_lock = threading.Lock()
+_counters = {"hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "evictions": 0}
+_ready: set = set()
+_EVICT_EVERY = 100  # check the size cap once per this many stores
+
+
+def fingerprint(model: str, system_prompt: str, text: str, temperature: float = 0) -> str:
+    """Stable cache key for one Chat Completions request."""
+    payload = json.dumps([model, system_prompt, text, temperature], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _conn(path: str):
+    conn = connect(path)
+    if path not in _ready:
+        conn.executescript(_SCHEMA)
+        _ready.add(path)
+    return conn
+
+
+def _bump(name: str, n: int = 1):
+    with _lock:
+        _counters[name] += n
+
+
+def get(key: str, path: str = MT_CACHE_PATH) -> Optional[str]:
+    """Cached output for `key`, or None on a miss / expired entry."""
+    conn = _conn(path)
+    row = conn.execute("SELECT output, created_at FROM mt_cache WHERE key = ?", (key,)).fetchone()
+    now = time.time()
+    if row is None or (MT_CACHE_TTL_DAYS > 0 and now - row["created_at"] > MT_CACHE_TTL_DAYS * 86400):
+        _bump("misses")
+        return None
+    conn.execute("UPDATE mt_cache SET last_hit = ?, hits = hits + 1 WHERE key = ?", (now, key))
+    _bump("hits")
+    return row["output"]
+
+
+def record_bypass():
+    """Count a lookup that skipped the cache on purpose (use_cache=False)."""
+    _bump("bypassed")
+
+
+def put(key: str, model: str, output: str, path: str = MT_CACHE_PATH):
+    conn = _conn(path)
+    now = time.time()
+    conn.execute(
+        "INSERT OR REPLACE INTO mt_cache(key, model, output, created_at, last_hit, hits) "
+        "VALUES (?, ?, ?, ?, ?, 0)",
+        (key, model, output, now, now),
+    )
+    _bump("stores")
+    if _counters["stores"] % _EVICT_EVERY == 0:
+        evict(path)
+
+
+def evict(path: str = MT_CACHE_PATH) -> int:
+    """Drop expired entries, then the least-recently-hit ones above the size cap."""
+    conn = _conn(path)
+    removed = 0
+    if MT_CACHE_TTL_DAYS > 0:
+        removed += conn.execute("DELETE FROM mt_cache WHERE created_at < ?",
+                                (time.time() - MT_CACHE_TTL_DAYS * 86400,)).rowcount
+    over = conn.execute("SELECT COUNT(*) FROM mt_cache").fetchone()[0] - MT_CACHE_MAX_ENTRIES
+    if over > 0:
+        removed += conn.execute(
+            "DELETE FROM mt_cache WHERE key IN (SELECT key FROM mt_cache ORDER BY last_hit LIMIT ?)",
+            (over,)).rowcount
+    _bump("evictions", removed)
+    return removed
+
+
+def clear(path: str = MT_CACHE_PATH):
+    _conn(path).execute("DELETE FROM mt_cache")
+
+
+def stats(path: str = MT_CACHE_PATH) -> Dict[str, Any]:
+    """In-process hit/miss counters plus the on-disk entry count."""
+    with _lock:
+        out: Dict[str, Any] = dict(_counters)
+    lookups = out["hits"] + out["misses"]
+    out["hit_rate"] = round(out["hits"] / lookups, 4) if lookups else 0.0
+    try:
+        out["entries"] = _conn(path).execute("SELECT COUNT(*) FROM mt_cache").fetchone()[0]
+    except Exception:
+        out["entries"] = None
+    return out
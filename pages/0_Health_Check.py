@@ -15,6 +15,13 @@ st.write("Directories:", dirs)
 st.write("Pages:", sorted(glob.glob("pages/*.py")))
 st.write(".streamlit:", sorted(glob.glob(".streamlit/*")))
 
+st.subheader("Data root")
+import storage
+info = storage.describe()
+st.write("Root:", info["root"], "· journal:", info["journal_mode"],
+         "· writable:", info["writable"], "· free MB:", info["free_mb"])
+st.write("Stores:", info["files"])
+
 st.subheader("Imports")
 def check(mod):
     try:
@@ -31,3 +38,31 @@ ok_openai = "OPENAI_API_KEY" in st.secrets
 st.write("OPENAI_API_KEY:", "✅ set" if ok_openai else "❌ missing")
 ok_google = "GOOGLE_TRANSLATE_API_KEY" in st.secrets
 st.write("GOOGLE_TRANSLATE_API_KEY:", "✅ set" if ok_google else "— (optional)")
+
+st.subheader("Import cost (cold start)")
+st.caption("Each module is imported in a fresh interpreter with `python -X importtime`; "
+           "the table lists its heaviest direct dependencies.")
+if st.button("Run import audit"):
+    from import_audit import audit_imports
+    with st.spinner("Importing modules in fresh interpreters…"):
+        audit = audit_imports(["utils_mt", "metrics", "pandas", "openai", "sacrebleu", "bert_score"], top=5)
+    for r in audit:
+        label = f"{r['module']}: {r['total_ms']:.0f} ms" if r["ok"] else f"{r['module']}: ❌ {r['error']}"
+        with st.expander(label):
+            st.dataframe(r["top"], use_container_width=True)
+
+st.subheader("MT backends")
+import mt_backends
+st.write("Available:", mt_backends.available_backends(),
+         "· default:", mt_backends.DEFAULT_BACKEND,
+         "· fallback:", mt_backends.FALLBACK_BACKENDS or "—")
+n_bench = st.number_input("Benchmark segments", min_value=1, max_value=200, value=10)
+if st.button("Benchmark backends"):
+    from utils_mt import ensure_sample_pairs, load_pairs, mt_openai
+    ensure_sample_pairs()
+    texts = (load_pairs()["source"].astype(str).tolist() * int(n_bench))[:int(n_bench)]
+    with st.spinner("Translating…"):
+        for name in mt_backends.available_backends():
+            for t in texts:
+                mt_openai(t, use_cache=False, backend=name)
+st.dataframe(mt_backends.throughput(), use_container_width=True)
@@ -0,0 +1,68 @@
+# pages/0_Performance.py
+import streamlit as st
+import pandas as pd
+import perf
+import mt_backends
+from scoring_queue import queue_stats
+
+st.title("Performance")
+st.caption("Live timings from this server process (perf.py): every loader/saver in utils_mt, "
+           "mt_openai, the OpenAI client, scoring and page reruns. Counters reset when the app restarts.")
+
+port = perf.serve_metrics()
+if port:
+    st.caption(f"Prometheus endpoint: `http://<host>:{port}/metrics`")
+
+c1, c2, c3 = st.columns(3)
+live = c1.toggle("Live refresh", value=True)
+every = c2.number_input("Refresh every (s)", min_value=1, max_value=60, value=2)
+if c3.button("Reset counters"):
+    perf.reset()
+
+
+@st.fragment(run_every=int(every) if live else None)
+def _live():
+    snap = perf.snapshot()
+    st.write(f"PID {snap['pid']} · up {snap['uptime_s']:.0f} s")
+
+    st.subheader("Hot paths")
+    spans = pd.DataFrame(snap["spans"])
+    if spans.empty:
+        st.info("Nothing timed yet — use MT Lab or the Dashboard and come back.")
+    else:
+        st.dataframe(spans.sort_values("total_s", ascending=False), use_container_width=True, hide_index=True)
+
+    st.subheader("OpenAI token usage")
+    if snap["tokens"]:
+        tok = pd.DataFrame.from_dict(snap["tokens"], orient="index").rename_axis("model").reset_index()
+        tok["tokens_per_request"] = ((tok["prompt_tokens"] + tok["completion_tokens"])
+                                     / tok["requests"].clip(lower=1)).round(1)
+        st.dataframe(tok, use_container_width=True, hide_index=True)
+    else:
+        st.write("No Chat Completions responses yet.")
+
+    st.subheader("Caches")
+    caches = snap["caches"]
+    cols = st.columns(max(1, len(caches)))
+    for col, (name, s) in zip(cols, caches.items()):
+        rate = s.get("hit_rate")
+        col.metric(name, f"{rate:.0%}" if isinstance(rate, (int, float)) else "—")
+    with st.expander("Cache details"):
+        st.json(caches)
+
+    st.subheader("MT backends & scoring queue")
+    st.dataframe(pd.DataFrame.from_dict(mt_backends.throughput(), orient="index"), use_container_width=True)
+    st.write("Scoring jobs:", queue_stats())
+    if snap["counters"]:
+        with st.expander("Event counters"):
+            st.json(snap["counters"])
+
+
+_live()
+
+# Rendering every span is not free, so the export is built on request rather than on each rerun
+if st.button("Prepare Prometheus metrics"):
+    st.session_state["perf_prom"] = perf.prometheus_text()
+if "perf_prom" in st.session_state:
+    st.download_button("⬇️ Prometheus metrics (text format)", st.session_state["perf_prom"],
+                       file_name="eduapp_metrics.prom", mime="text/plain")
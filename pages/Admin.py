@@ -6,14 +6,18 @@ import streamlit as st
 # Robust import with a helpful error if it fails
 try:
     from utils_mt import (
-        ensure_sample_pairs, load_pairs,
-        ensure_tickets_file, load_tickets, save_tickets, add_ticket
+        ensure_sample_pairs, load_pairs, SAMPLE_PAIRS_PATH,
+        ensure_tickets_file, load_tickets, save_tickets, add_ticket, tickets_csv_bytes,
+        import_tickets, auto_assign_tickets,
+        results_download_path, backfill_pe_metrics, rebuild_tm, warm_reference_cache
     )
 except Exception as e:
     st.error("Could not import from utils_mt. Make sure 'utils_mt.py' exists at the repo root and contains the required functions.")
     st.exception(e)
     st.stop()
 
+import perf
+_perf_t0 = perf.page_start("Admin")
 st.title("Admin")
 st.caption("Create data, paste tickets, assign students, and download CSVs for research.")
 
@@ -25,12 +29,28 @@ with colA:
         ensure_sample_pairs()
         st.success("Created data/sample_pairs.csv ✅")
 with colB:
-    if os.path.exists("data/sample_pairs.csv"):
-        buf = io.BytesIO(open("data/sample_pairs.csv","rb").read())
+    if os.path.exists(SAMPLE_PAIRS_PATH):
+        buf = io.BytesIO(open(SAMPLE_PAIRS_PATH,"rb").read())
         st.download_button("⬇️ Download sample_pairs.csv", buf, file_name="sample_pairs.csv", mime="text/csv")
     else:
         st.info("sample_pairs.csv not found yet.")
 
+if st.button("Rebuild translation memory", help="Re-import sample_pairs references and all submitted post-edits."):
+    import tm
+    rebuild_tm()
+    st.success(f"Translation memory rebuilt: {tm.stats()}")
+
+if st.button("Warm BERTScore reference cache",
+             help="Encode every sample-pair and ticket reference once, so scoring only encodes the student's text."):
+    import emb_cache
+    fut, n_refs = warm_reference_cache()
+    with st.spinner(f"Encoding {n_refs} reference(s) in the scoring worker…"):
+        try:
+            added = fut.result()
+            st.success(f"{added} new reference(s) cached · {emb_cache.stats()}")
+        except Exception as e:
+            st.error(f"Could not warm the cache: {e}")
+
 st.divider()
 
 # ---------- Tickets: paste or upload ----------
@@ -68,23 +88,103 @@ with st.form("add_ticket_form", clear_on_submit=True):
 st.markdown("### Upload many tickets (optional)")
 up = st.file_uploader("Upload tickets.csv", type=["csv"])
 if up:
-    os.makedirs("data", exist_ok=True)
-    with open("data/tickets.csv","wb") as w:
-        w.write(up.getvalue())
-    st.success("Uploaded to data/tickets.csv")
+    replace = st.checkbox("Replace all tickets (delete tickets missing from this file)", value=False)
+    st.caption("Otherwise new tickets are added and existing ticket_ids are updated; "
+               "assignments and statuses are kept unless the file sets them.")
+    if st.button("Import tickets"):
+        res = import_tickets(pd.read_csv(io.BytesIO(up.getvalue())), replace=replace)
+        for msg in res["problems"]:
+            st.warning(msg)
+        st.success(f"Imported: {res['inserted']} new, {res['updated']} updated"
+                   + (f", {res['deleted']} removed" if res["deleted"] else ""))
+
+st.markdown("### Auto-assign open tickets")
+roster_txt = st.text_area("Class roster (one username per line)", "", height=100)
+if st.button("Assign unassigned tickets"):
+    roster = [u.strip() for u in roster_txt.splitlines() if u.strip()]
+    if not roster:
+        st.error("Add at least one username.")
+    else:
+        loads = auto_assign_tickets(roster)
+        st.success("Assigned. Points per student (including tickets they already hold):")
+        st.dataframe(pd.DataFrame(sorted(loads.items()), columns=["student", "points"]),
+                     use_container_width=True)
+
+# Download current tickets (a full-table read, so only on request)
+if st.button("Prepare tickets.csv", key="prep_tickets_admin"):
+    st.session_state["tickets_csv_admin"] = tickets_csv_bytes()
+if "tickets_csv_admin" in st.session_state:
+    st.download_button("⬇️ Download tickets.csv", st.session_state["tickets_csv_admin"],
+                       file_name="tickets.csv", mime="text/csv")
+
+st.markdown("### Pre-translate tickets (optional)")
+st.caption("Machine-translates every ticket with the default prompt in one concurrent batch, e.g. to check "
+           "the API and the token budget before class. Results go into the translation cache, but MT Lab only "
+           "reuses them for the same prompt and terminology without translation-memory examples or document mode.")
+if st.button("Pre-translate all tickets"):
+    from batch_mt import translate_many
+    import mt_backends
+    todo = load_tickets()
+    if todo.empty:
+        st.info("No tickets to translate.")
+    else:
+        bar = st.progress(0.0)
+        done = []
+        def _tick(i, out):
+            done.append(out)
+            bar.progress(len(done) / len(todo))
+        outs = translate_many(todo["source"].fillna("").astype(str).tolist(), on_result=_tick)
+        failed = sum(mt_backends.is_error(o) for o in outs)
+        st.success(f"Pre-translated {len(outs) - failed} ticket(s)" + (f", {failed} failed" if failed else ""))
+
+st.divider()
 
-# Download current tickets
-if os.path.exists("data/tickets.csv"):
-    buf = io.BytesIO(open("data/tickets.csv","rb").read())
-    st.download_button("⬇️ Download tickets.csv", buf, file_name="tickets.csv", mime="text/csv")
+# ---------- Course glossary ----------
+import glossary
+st.subheader("Course glossary")
+st.caption("Only the entries that occur in a sentence are sent to the model (see MT Lab for compliance).")
+gup = st.file_uploader("Upload glossary.csv (source_term, target_term)", type=["csv"], key="glossary_up")
+if gup:
+    g_replace = st.checkbox("Replace the whole glossary", value=False)
+    if st.button("Import glossary"):
+        n = glossary.import_frame(pd.read_csv(io.BytesIO(gup.getvalue())), replace=g_replace)
+        st.session_state.pop("glossary_admin", None)
+        st.success(f"Imported {n} glossary entries.")
+st.json(glossary.stats())
+# The full glossary can hold thousands of entries, so it is only loaded on request
+if st.button("Prepare glossary.csv"):
+    gdf = glossary.load_all()
+    st.session_state["glossary_admin"] = (gdf.head(200), gdf.to_csv(index=False).encode("utf-8"), len(gdf))
+if "glossary_admin" in st.session_state:
+    g_preview, g_csv, g_n = st.session_state["glossary_admin"]
+    st.caption(f"{g_n} entries" + (" (first 200 shown)" if g_n > 200 else ""))
+    st.dataframe(g_preview, use_container_width=True, height=200)
+    st.download_button("⬇️ Download glossary.csv", g_csv, file_name="glossary.csv", mime="text/csv")
 
 st.divider()
 
 # ---------- Download research data ----------
 st.subheader("Research Exports")
-if os.path.exists("data/results.csv"):
-    res_buf = io.BytesIO(open("data/results.csv","rb").read())
-    st.download_button("⬇️ Download results.csv (edits, scores, metadata)", res_buf,
+# Folding in pending submissions rewrites/streams the whole file, so it only runs on request
+if st.button("Prepare results.csv", key="prep_results_admin"):
+    res_path = results_download_path()
+    if res_path:
+        with open(res_path, "rb") as fh:
+            st.session_state["results_csv_admin"] = fh.read()
+    else:
+        st.session_state.pop("results_csv_admin", None)
+        st.info("No results yet. Students must submit from MT Lab to generate results.csv.")
+if "results_csv_admin" in st.session_state:
+    st.download_button("⬇️ Download results.csv (edits, scores, metadata)", st.session_state["results_csv_admin"],
                        file_name="results.csv", mime="text/csv")
-else:
-    st.info("No results yet. Students must submit from MT Lab to generate results.csv.")
+
+with st.expander("Post-edit effort metrics"):
+    st.caption("HTER and character/word edit distance between MT output and post-edit (metric_pe_* columns). "
+               "New submissions get them automatically; this fills in older rows.")
+    redo = st.checkbox("Recompute rows that already have them", value=False)
+    if st.button("Compute post-edit metrics for all results"):
+        with st.spinner("Computing…"):
+            n = backfill_pe_metrics(overwrite=redo)
+        st.success(f"Computed post-edit metrics for {n} submission(s).")
+
+perf.page_end("Admin", _perf_t0)
@@ -1,8 +1,13 @@
 # pages/Dashboard.py
 import os, io
-import pandas as pd
 import streamlit as st
+from utils_mt import load_tickets, tickets_csv_bytes, preview_csv, rebuild_aggregates, SAMPLE_PAIRS_PATH, TIX_PATH
+import results_store
+import analytics
+import mqm
 
+import perf
+_perf_t0 = perf.page_start("Dashboard")
 st.title("Dashboard — Class Overview & Exports")
 
 def downloadable(path, label, fname):
@@ -13,14 +18,83 @@ def downloadable(path, label, fname):
         st.info(f"{path} not found yet.")
 
 st.subheader("Datasets")
-downloadable("data/sample_pairs.csv", "Download sample_pairs.csv", "sample_pairs.csv")
-downloadable("data/tickets.csv", "Download tickets.csv", "tickets.csv")
+downloadable(SAMPLE_PAIRS_PATH, "Download sample_pairs.csv", "sample_pairs.csv")
+# Serialising every ticket is a full-table read, so it only runs on request
+if st.button("Prepare tickets.csv", key="prep_tickets_dash"):
+    st.session_state["tickets_csv_dash"] = tickets_csv_bytes()
+if "tickets_csv_dash" in st.session_state:
+    st.download_button("⬇️ Download tickets.csv", st.session_state["tickets_csv_dash"],
+                       file_name="tickets.csv", mime="text/csv")
 
 st.subheader("Research data")
-downloadable("data/results.csv", "Download results.csv (submissions + metrics)", "results.csv")
+# Folding in pending submissions rewrites/streams the whole file, so it only runs on request
+if st.button("Prepare results.csv", key="prep_results_dash"):
+    res_path = results_store.results_download_path()
+    if res_path:
+        with open(res_path, "rb") as fh:
+            st.session_state["results_csv_dash"] = fh.read()
+    else:
+        st.session_state.pop("results_csv_dash", None)
+        st.info("No results yet.")
+if "results_csv_dash" in st.session_state:
+    st.download_button("⬇️ Download results.csv (submissions + metrics)", st.session_state["results_csv_dash"],
+                       file_name="results.csv", mime="text/csv")
+
+st.subheader("Class analytics")
+# Materialized tables, updated on every submission / ticket change (see analytics.py)
+if analytics.needs_rebuild():
+    with st.spinner("Building class aggregates (first run only)…"):
+        rebuild_aggregates()
+tab_student, tab_item, tab_day = st.tabs(["Per student", "Per item", "Per day"])
+with tab_student:
+    st.dataframe(analytics.scope_table("student").merge(
+        analytics.ticket_progress(), on="student", how="outer"), use_container_width=True)
+with tab_item:
+    st.dataframe(analytics.scope_table("item"), use_container_width=True)
+with tab_day:
+    st.dataframe(analytics.scope_table("day"), use_container_width=True)
+if st.button("Rebuild aggregates from raw data"):
+    rebuild_aggregates()
+    st.rerun()
+
+st.subheader("MQM annotations")
+# Scores are kept per segment as errors are added (see mqm.py), so this is a few indexed aggregates
+mqm_students = mqm.summary("student")
+if mqm_students.empty:
+    st.info("No MQM annotations yet.")
+else:
+    agree = mqm.agreement()
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Annotated segments", int(mqm_students["segments"].sum()))
+    c2.metric("Errors", int(mqm_students["errors"].sum()))
+    c3.metric("Agreement α (category)", "—" if agree["alpha_category"] is None else agree["alpha_category"])
+    c4.metric("Agreement α (error / OK)", "—" if agree["alpha_error"] is None else agree["alpha_error"])
+    st.caption(f"Krippendorff's alpha over {agree['characters']} characters of {agree['items']} "
+               "items annotated by two or more students on the same candidate.")
+    tab_ms, tab_mi, tab_mc = st.tabs(["Per student", "Per item", "Categories"])
+    with tab_ms:
+        st.dataframe(mqm_students, use_container_width=True)
+    with tab_mi:
+        st.dataframe(mqm.summary("item_id").merge(mqm.score_spread()[["item_id", "annotators", "std", "range"]],
+                                                  on="item_id", how="left"), use_container_width=True)
+    with tab_mc:
+        st.dataframe(mqm.category_breakdown(), use_container_width=True)
+    if st.button("Prepare MQM errors (CSV)"):
+        st.session_state["mqm_csv_dash"] = mqm.errors().to_csv(index=False).encode("utf-8")
+    if "mqm_csv_dash" in st.session_state:
+        st.download_button("⬇️ Download MQM errors (CSV)", st.session_state["mqm_csv_dash"],
+                           file_name="mqm_errors.csv", mime="text/csv")
 
 # (optional) quick preview
-for p in ["data/results.csv","data/tickets.csv","data/sample_pairs.csv"]:
-    if os.path.exists(p):
+for p in [results_store.RESULTS_PATH, TIX_PATH, SAMPLE_PAIRS_PATH]:
+    if p == results_store.RESULTS_PATH and results_store.parquet_enabled():
+        st.markdown("#### Preview: results")
+        st.dataframe(results_store.head_results(50), use_container_width=True)
+    elif p == TIX_PATH:
+        st.markdown("#### Preview: tickets")
+        st.dataframe(load_tickets().head(50), use_container_width=True)
+    elif os.path.exists(p):
         st.markdown(f"#### Preview: {p}")
-        st.dataframe(pd.read_csv(p).head(50), use_container_width=True)
+        st.dataframe(preview_csv(p, 50), use_container_width=True)
+
+perf.page_end("Dashboard", _perf_t0)
@@ -1,30 +1,86 @@
+import html
 import streamlit as st
 import pandas as pd
+import mqm
+from utils_mt import ensure_sample_pairs, load_pairs
 
 st.title("MQM Annotation — Simplified")
-st.caption("Label errors for a candidate vs reference.")
+st.caption("Label errors for a candidate vs reference. Annotations are saved and scored as you go.")
 
-source = st.text_area("Source", "The ministry will publish the annual report tomorrow.")
-reference = st.text_area("Reference (Human)", "ستصدر الوزارة التقرير السنوي غدًا.")
-candidate = st.text_area("Candidate (Your translation)", "")
+student = st.text_input("Your username (e.g., student_id or email alias)", key="mqm_student")
 
-cats = ["Accuracy:Mistranslation","Accuracy:Omission","Accuracy:Addition",
-        "Fluency:Grammar","Fluency:Punctuation","Fluency:Spelling",
-        "Style:Terminology","Style:Register","Style:Consistency"]
+ensure_sample_pairs()
+pairs = load_pairs()
+items = ["(custom)"] + [str(i) for i in pairs.get("id", pd.Series(dtype=str)).tolist()]
+item = st.selectbox("Item", items)
+row = pairs[pairs["id"].astype(str) == item].iloc[0] if item != "(custom)" else None
+item_id = item if row is not None else st.text_input("Item id", "custom-1")
+
+source = st.text_area("Source", row["source"] if row is not None else "The ministry will publish the annual report tomorrow.")
+reference = st.text_area("Reference (Human)", row["reference"] if row is not None else "ستصدر الوزارة التقرير السنوي غدًا.")
+# A shared MT output (candidate column) lets several students annotate the same text, for agreement
+shared = str(row["candidate"]) if row is not None and "candidate" in row and pd.notna(row["candidate"]) else ""
+seg = mqm.segment(student, item_id) if student else None
+candidate = st.text_area("Candidate (Your translation)", seg["candidate"] if seg else shared)
+
+if not student or not candidate.strip():
+    st.info("Enter your username and a candidate to start annotating.")
+    st.stop()
+
+if not mqm.set_segment(student, item_id, candidate, source):
+    st.warning("You already annotated a different candidate for this item. Its error spans no longer match.")
+    if st.button("Discard my annotations for this item"):
+        mqm.clear_segment(student, item_id)
+        st.rerun()
+    st.stop()
 
 st.markdown("#### Add error")
-col1, col2 = st.columns([2,1])
+col1, col2, col3 = st.columns([2, 1, 2])
 with col1:
-    sel = st.selectbox("Category", cats)
+    sel = st.selectbox("Category", mqm.CATEGORIES)
 with col2:
-    span = st.text_input("Span (optional)", "")
-
-if "errs" not in st.session_state:
-    st.session_state["errs"] = []
+    severity = st.selectbox("Severity", mqm.SEVERITIES)
+with col3:
+    span = st.text_input("Span (text copied from the candidate)", "")
+occurrence = st.number_input("Occurrence of the span", min_value=1, value=1, step=1,
+                             help="Which match to mark if the span appears more than once")
+note = st.text_input("Note (optional)", "")
 
 if st.button("Add"):
-    st.session_state["errs"].append({"category": sel, "span": span})
+    offsets = mqm.find_span(candidate, span, int(occurrence)) if span else (0, 0)
+    if offsets is None:
+        st.error(f"'{span}' (occurrence {int(occurrence)}) was not found in the candidate.")
+    else:
+        mqm.add_error(student, item_id, sel, severity, offsets[0], offsets[1], note)
+
+errs = mqm.errors(student, item_id)
+seg = mqm.segment(student, item_id)
+c1, c2, c3 = st.columns(3)
+c1.metric("MQM score", seg["score"])
+c2.metric("Errors", seg["n_errors"])
+c3.metric("Penalty", seg["penalty"])
+
+if not errs.empty:
+    # Highlight annotated spans (heaviest severity wins where spans overlap)
+    marks = [""] * len(candidate)
+    colours = {"minor": "#fff3b0", "major": "#ffc8a0", "critical": "#ff9b9b"}
+    for e in errs.sort_values("weight").itertuples():
+        for i in range(e.span_start, e.span_end):
+            marks[i] = colours.get(e.severity, "#ddd")
+    out, i = [], 0
+    while i < len(candidate):
+        j = i
+        while j < len(candidate) and marks[j] == marks[i]:
+            j += 1
+        text = html.escape(candidate[i:j])
+        out.append(f'<mark style="background:{marks[i]}">{text}</mark>' if marks[i] else text)
+        i = j
+    st.markdown(f'<div dir="auto">{"".join(out)}</div>', unsafe_allow_html=True)
 
-if st.session_state["errs"]:
     st.markdown("#### Current errors")
-    st.dataframe(pd.DataFrame(st.session_state["errs"]))
+    st.dataframe(errs[["error_id", "category", "severity", "span_start", "span_end", "span_text", "note"]],
+                 use_container_width=True)
+    to_delete = st.selectbox("Delete error", errs["error_id"].tolist())
+    if st.button("Delete"):
+        mqm.delete_error(int(to_delete))
+        st.rerun()
@@ -1,13 +1,19 @@
 # pages/MT_Lab.py
-import os, time
+import os, time, uuid
 import pandas as pd
 import streamlit as st
 from utils_mt import (
-    ensure_sample_pairs, load_pairs, mt_openai,
-    ensure_tickets_file, load_tickets, save_tickets, append_result
+    ensure_sample_pairs, load_pairs, mt_openai, tm_suggestions, glossary_check,
+    ensure_tickets_file, my_tickets, open_tickets, get_ticket,
+    claim_ticket, set_ticket_status, append_result
 )
-from metrics import score_all
+from scoring_queue import submit_job, job_status
+import mt_backends
+from metrics import score_all, score_batch
+from doc_mt import translate_document, align_reference, split as split_segments
 
+import perf
+_perf_t0 = perf.page_start("MT_Lab")
 st.title("MT Lab — OpenAI Translation")
 st.caption("Work on a dataset item or a ticket, translate with OpenAI, post-edit, and save results for research.")
 
@@ -22,6 +28,116 @@ def _s(x):
             return ""
     return str(x)
 
+# Scoring runs in a background process pool (scoring_queue.py); the page only polls.
+_fragment = getattr(st, "fragment", None) or st.experimental_fragment
+
+def _fmt(s):
+    return {k: round(v,3) if isinstance(v,float) else v for k,v in s.items()}
+
+_FINISHED = ("done", "error", "unknown")
+
+def _show_job(key, s, cand):
+    if s["status"] == "done":
+        st.success("Scores"); st.write(_fmt(s["scores"]))
+        if s["error"]:
+            st.warning(f"BERTScore failed, only the fast scores are shown: {s['error']}")
+        st.session_state[key] = s["scores"]
+        st.session_state[f"{key}_cand"] = cand
+    elif s["status"] in _FINISHED:
+        st.error(f"Scoring failed: {s['error'] or 'job not found'}")
+    else:
+        st.info("Scoring in the background — keep editing, results appear here.")
+
+@_fragment(run_every=2)
+def _poll_status(key):
+    """Re-poll a running job without rerunning the page; once it finishes, rerun once without the timer."""
+    job_id, cand = st.session_state[f"job_{key}"]
+    s = job_status(job_id)
+    if s["status"] in _FINISHED:
+        st.session_state[f"finished_{key}"] = (job_id, s)
+        st.rerun()
+    _show_job(key, s, cand)
+
+def _score_status(key):
+    """Show the latest scoring job for `key`; only polls while it is queued or running."""
+    job = st.session_state.get(f"job_{key}")
+    if not job:
+        return
+    finished = st.session_state.get(f"finished_{key}")
+    if finished and finished[0] == job[0]:
+        _show_job(key, finished[1], job[1])
+    else:
+        _poll_status(key)
+
+def _save(record, cand, reference, key):
+    """
+    Save a submission. Scores from the Score button are reused only if they were
+    computed for this exact text; otherwise a background job fills metric_* later.
+    """
+    scores = st.session_state.get(key, {}) if st.session_state.get(f"{key}_cand") == cand else {}
+    record["submission_id"] = uuid.uuid4().hex
+    record.update({f"metric_{k}": v for k,v in scores.items()})
+    queued = not scores and bool(_s(reference).strip())
+    if queued:
+        record["scoring_status"] = "queued"
+    append_result(record)
+    if queued:
+        submit_job(cand, _s(reference), submission_id=record["submission_id"])
+    return queued
+
+def _glossary_report(source, text, terms):
+    """Which glossary terms occurring in the source the text actually uses."""
+    if not text or mt_backends.is_error(text):
+        return
+    chk = glossary_check(source, text, terms)
+    if chk["expected"]:
+        missing = ", ".join(f"{s} → {t}" for s,t in chk["missing"])
+        st.caption(f"Glossary: {chk['used']}/{chk['expected']} terms used" + (f" · missing: {missing}" if missing else " ✅"))
+
+def _translate_doc(ticket_id, source, sys, terms, use_tm, backend):
+    """Document mode: concurrent per-segment translation (cached segments are not re-sent)."""
+    bar = st.progress(0.0, text="Translating segments…")
+    doc = translate_document(source, system_prompt=sys, terms=terms, use_tm=use_tm, backend=backend,
+                             on_progress=lambda done, total: bar.progress(done / max(1, total)))
+    bar.empty()
+    origins = {r["origin"] for r in doc.segments}
+    st.session_state["mt_out_tix"] = doc.text
+    st.session_state["mt_source_tix"] = "tm" if origins == {"tm"} else backend if "tm" not in origins else f"tm+{backend}"
+    st.session_state["doc_tix"] = (ticket_id, doc)
+
+def _doc_segments(ticket_id, reference, retry):
+    """Alignment table for the last document translation, with sentence scores when the reference aligns."""
+    last = st.session_state.get("doc_tix")
+    if not last or last[0] != ticket_id:
+        return
+    doc = last[1]
+    seg_df = pd.DataFrame(doc.segments)
+    refs = align_reference(doc, reference) if _s(reference).strip() else None
+    if refs:
+        ok = [i for i, r in enumerate(doc.segments) if not r["error"]]
+        per, _ = score_batch([doc.segments[i]["target"] for i in ok], [refs[i] for i in ok], tiers=("fast",))
+        seg_df["reference"] = refs
+        for i, s in zip(ok, per):
+            for k, v in s.items():
+                seg_df.loc[i, k] = round(v, 2)
+    with st.expander(f"Segments: {len(doc.segments)}" + (f" · {len(doc.failed)} failed" if doc.failed else "")):
+        st.dataframe(seg_df, use_container_width=True)
+        if _s(reference).strip() and not refs:
+            st.caption("The reference splits into a different number of sentences, so no sentence-level scores.")
+    if doc.failed and st.button(f"Retry {len(doc.failed)} failed segment(s)"):
+        retry()
+        st.rerun()
+
+def _source_setter(key):
+    """on_source callback for mt_openai: remembers where the MT output came from (tm or backend)."""
+    return lambda name: st.session_state.__setitem__(key, name)
+
+def _quick_scores(cand, reference):
+    """Instant lexical scores (fast tier only, no torch) shown while the student edits."""
+    if cand and _s(reference).strip():
+        quick = score_all(cand, _s(reference), tiers=("fast",))
+        st.caption("Quick scores — " + " · ".join(f"{k.upper()} {v:.1f}" for k,v in quick.items()))
+
 # Identity (simple — username only)
 student = st.text_input("Your username (e.g., student_id or email alias)", key="student")
 if not student:
@@ -29,6 +145,14 @@ if not student:
 else:
     st.success(f"Hi {student} — your submissions will be saved.")
 
+# MT engine: OpenAI by default; local MarianMT or the echo stub work offline
+_backends = mt_backends.available_backends()
+backend = st.sidebar.selectbox("MT backend", _backends,
+    index=_backends.index(mt_backends.DEFAULT_BACKEND) if mt_backends.DEFAULT_BACKEND in _backends else 0)
+_tp = mt_backends.get_backend(backend).throughput()
+if _tp["segments"]:
+    st.sidebar.caption(f"{backend}: {_tp['segments_per_second']} segments/s · {_tp['mean_latency_ms']} ms per call")
+
 # Choose mode
 mode = st.radio("Mode", ["Pairs dataset", "My ticket"], horizontal=True)
 
@@ -53,12 +177,15 @@ if mode == "Pairs dataset":
         "You are a professional Arabic↔English translator. Preserve meaning and tone.")
 
     if st.button("Translate"):
-        out = mt_openai(row["source"], system_prompt=sys, terms=terms)
+        out = mt_openai(row["source"], system_prompt=sys, terms=terms, backend=backend,
+                        on_source=_source_setter("mt_source"))
         st.session_state["mt_out"] = out
 
     mt_text = st.text_area("MT Output", value=st.session_state.get("mt_out",""), height=140)
+    _glossary_report(row["source"], mt_text.strip(), terms)
     pe_text = st.text_area("Your Post-edit", value="", height=140,
                            placeholder="Improve the MT output here...")
+    _quick_scores(pe_text.strip() or mt_text.strip(), row["reference"])
 
     colS1, colS2 = st.columns([1,1])
     with colS1:
@@ -67,17 +194,15 @@ if mode == "Pairs dataset":
             if not cand:
                 st.warning("Nothing to score yet — generate MT or paste your text.")
             else:
-                s = score_all(cand, row["reference"])
-                st.success("Scores"); st.write({k: round(v,3) if isinstance(v,float) else v for k,v in s.items()})
-                st.session_state["last_scores"] = s
+                st.session_state["job_last_scores"] = (submit_job(cand, row["reference"]), cand)
+        _score_status("last_scores")
     with colS2:
         if st.button("Submit & Save"):
             cand = pe_text.strip() or mt_text.strip()
             if not cand:
                 st.warning("Nothing to save — translate or paste text first.")
             else:
-                scores = st.session_state.get("last_scores", {})
-                append_result({
+                queued = _save({
                     "timestamp": int(time.time()),
                     "student": student or "",
                     "mode": "pairs",
@@ -85,21 +210,20 @@ if mode == "Pairs dataset":
                     "source": row["source"],
                     "reference": row["reference"],
                     "mt_output": st.session_state.get("mt_out",""),
+                    "mt_source": st.session_state.get("mt_source",""),
                     "post_edit": cand,
                     "terms": terms,
                     "system_prompt": sys,
-                    **{f"metric_{k}": v for k,v in scores.items()}
-                })
-                st.success("Saved to data/results.csv ✅")
+                }, cand, row["reference"], "last_scores")
+                st.success("Saved to data/results.csv ✅" + (" Scores are being added in the background." if queued else ""))
 
 # ---------- Ticket mode ----------
 else:
     ensure_tickets_file()
-    tix = load_tickets()
 
-    # Show my tickets (assigned to me or open to claim)
-    mine = tix[(tix["assigned_to"].fillna("")==student) & (tix["status"].isin(["open","claimed"]))]
-    open_tix = tix[(tix["assigned_to"].isna()) | (tix["assigned_to"]=="")]
+    # Show my tickets (assigned to me or open to claim) — indexed queries, not full-table filters
+    mine = my_tickets(student)
+    open_tix = open_tickets()
 
     st.markdown("### My tickets")
     st.dataframe(mine, use_container_width=True, height=180)
@@ -108,8 +232,12 @@ else:
     if not open_tix.empty:
         to_claim = st.selectbox("Unassigned tickets", open_tix["ticket_id"].tolist())
         if st.button("Claim selected"):
-            tix.loc[tix["ticket_id"]==to_claim, ["assigned_to","status"]] = [student, "claimed"]
-            save_tickets(tix); st.success(f"Claimed {to_claim}. Reload to see it under My tickets.")
+            if not student:
+                st.warning("Enter your username before claiming a ticket.")
+            elif claim_ticket(to_claim, student):
+                st.success(f"Claimed {to_claim}. Reload to see it under My tickets.")
+            else:
+                st.error(f"{to_claim} was just claimed by someone else — pick another one.")
     else:
         st.info("No unassigned tickets.")
 
@@ -117,22 +245,46 @@ else:
     my_ids = mine["ticket_id"].tolist()
     if my_ids:
         choose = st.selectbox("Choose ticket", my_ids)
-        row = tix[tix["ticket_id"]==choose].iloc[0]
+        row = get_ticket(choose)
         source = row["source"]; reference = row.get("reference","")
         c1, c2 = st.columns(2)
         with c1: st.subheader("Source"); st.write(source)
         with c2: st.subheader("Reference (if provided)"); st.write(reference or "—")
 
+        # Translation memory: approved references and earlier post-edits of similar sentences
+        use_tm = st.checkbox("Use translation memory", value=True,
+                             help="Exact matches of approved references skip the API; close matches (including "
+                                  "earlier post-edits) are given to the model as examples.")
+        if use_tm:
+            matches = tm_suggestions(source)
+            if matches:
+                with st.expander(f"Translation memory: {len(matches)} similar segment(s)"):
+                    for m in matches:
+                        st.markdown(f"**{m.score:.0%}** ({m.origin}) — {m.source}  \n→ {m.target}")
+
         terms = st.text_input("Terminology (optional)", "")
         sys = st.text_area("System prompt (optional)",
             "You are a professional Arabic↔English translator. Preserve meaning and tone.")
 
+        doc_mode = st.checkbox("Document mode (translate sentence by sentence)",
+                               value=len(split_segments(source)) > 1,
+                               help="Segments are translated in parallel and cached one by one; a retry only repeats failed segments.")
         if st.button("Translate"):
-            out = mt_openai(source, system_prompt=sys, terms=terms)
-            st.session_state["mt_out_tix"] = out
+            if doc_mode:
+                _translate_doc(row["ticket_id"], source, sys, terms, use_tm, backend)
+            else:
+                out = mt_openai(source, system_prompt=sys, terms=terms, use_tm=use_tm, backend=backend,
+                                on_source=_source_setter("mt_source_tix"))
+                st.session_state["mt_out_tix"] = out
+                st.session_state.pop("doc_tix", None)
+        if doc_mode:
+            _doc_segments(row["ticket_id"], reference,
+                          lambda: _translate_doc(row["ticket_id"], source, sys, terms, use_tm, backend))
 
         mt_text = st.text_area("MT Output", value=st.session_state.get("mt_out_tix",""), height=140)
+        _glossary_report(source, mt_text.strip(), terms)
         pe_text = st.text_area("Your Post-edit", value="", height=140)
+        _quick_scores(pe_text.strip() or mt_text.strip(), reference)
 
         colTS1, colTS2 = st.columns([1,1])
         with colTS1:
@@ -144,17 +296,15 @@ else:
                     if not cand:
                         st.warning("Nothing to score yet.")
                     else:
-                        s = score_all(cand, reference)
-                        st.success("Scores"); st.write({k: round(v,3) if isinstance(v,float) else v for k,v in s.items()})
-                        st.session_state["last_scores_tix"] = s
+                        st.session_state["job_last_scores_tix"] = (submit_job(cand, reference), cand)
+            _score_status("last_scores_tix")
         with colTS2:
             if st.button("Submit & Save ticket"):
                 cand = pe_text.strip() or mt_text.strip()
                 if not cand:
                     st.warning("Nothing to save — translate first.")
                 else:
-                    scores = st.session_state.get("last_scores_tix", {})
-                    append_result({
+                    _save({
                         "timestamp": int(time.time()),
                         "student": student or "",
                         "mode": "ticket",
@@ -162,15 +312,15 @@ else:
                         "source": source,
                         "reference": reference,
                         "mt_output": st.session_state.get("mt_out_tix",""),
+                        "mt_source": st.session_state.get("mt_source_tix",""),
                         "post_edit": cand,
                         "terms": terms,
                         "system_prompt": sys,
-                        **{f"metric_{k}": v for k,v in scores.items()}
-                    })
+                    }, cand, reference, "last_scores_tix")
                     # mark submitted
-                    tix.loc[tix["ticket_id"]==row["ticket_id"], "status"] = "submitted"
-                    save_tickets(tix)
+                    set_ticket_status(row["ticket_id"], "submitted")
                     st.success("Saved to data/results.csv and marked ticket submitted ✅")
     else:
         st.info("No tickets assigned to you yet. Ask instructor to assign or let you claim one.")
 
+perf.page_end("MT_Lab", _perf_t0)
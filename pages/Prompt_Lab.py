@@ -1,14 +1,161 @@
 import streamlit as st
-from utils_mt import mt_openai
+import pandas as pd
+from utils_mt import mt_openai, ensure_sample_pairs, load_pairs
+import mt_backends
+import experiments
 
+import perf
+_perf_t0 = perf.page_start("Prompt_Lab")
 st.title("Prompt Lab — Design & Test Prompts")
 
 text = st.text_area("Enter source text", "The city will launch new community programs next month.")
 terms = st.text_input("Terminology mapping (optional)", "programs=برامج, community=مجتمعية")
 system = st.text_area("System prompt", "You are a professional Arabic↔English translator. Preserve meaning and tone.")
 style = st.text_input("Style/constraints (optional)", "Formal MSA, concise, no ambiguity.")
+_backends = mt_backends.available_backends()
+backend = st.selectbox("MT backend", _backends,
+    index=_backends.index(mt_backends.DEFAULT_BACKEND) if mt_backends.DEFAULT_BACKEND in _backends else 0)
 
-if st.button("Generate with OpenAI"):
-    prompt = f"{text}\n\nConstraints: {style}"
-    out = mt_openai(prompt, system_prompt=system, terms=terms)
+if st.button("Generate with OpenAI" if backend == "openai" else f"Generate with {backend}"):
+    # Same user message as the experiment grid, so single-shot and grid outputs match
+    out = mt_openai(experiments.user_text(text, style), system_prompt=system, terms=terms, backend=backend)
     st.text_area("Model Output", out, height=200)
+    tp = mt_backends.get_backend(backend).throughput()
+    st.caption(f"{backend}: {tp['segments_per_second']} segments/s · {tp['mean_latency_ms']} ms per call")
+
+# ------------- Compare prompts / systems -------------
+st.divider()
+st.subheader("Compare prompts & systems")
+st.caption("Translate the same items with several prompts/models/backends, score every output against "
+           "every reference in one pass, and test the differences with a paired bootstrap.")
+
+up = st.file_uploader("Items CSV (optional): `source` plus one or more `reference*` columns", type=["csv"])
+if up is not None:
+    items_df = pd.read_csv(up)
+else:
+    ensure_sample_pairs()
+    items_df = load_pairs()
+ref_cols = [c for c in items_df.columns if str(c).startswith("reference")]
+n_items = st.slider("Items", 1, max(1, len(items_df)), min(20, max(1, len(items_df))))
+if "source" not in items_df.columns or not ref_cols:
+    st.warning("The items need a `source` column and at least one `reference` column.")
+
+systems_df = st.data_editor(
+    pd.DataFrame([
+        {"name": "A", "system_prompt": system, "model": "gpt-4o-mini", "backend": backend},
+        {"name": "B", "system_prompt": system + " Prefer natural, idiomatic phrasing over literal rendering.",
+         "model": "gpt-4o-mini", "backend": backend},
+    ]),
+    num_rows="dynamic", use_container_width=True, key="cmp_systems",
+    column_config={"backend": st.column_config.SelectboxColumn("backend", options=_backends)},
+)
+c1, c2, c3 = st.columns(3)
+cmp_lang = c1.selectbox("Target language", ["ar", "en"])
+neural = c2.checkbox("Include BERTScore", value=False, help="Slower: loads the BERTScore model in this process")
+n_boot = c3.number_input("Bootstrap resamples", min_value=0, max_value=10000, value=1000, step=100)
+
+if st.button("Run comparison") and "source" in items_df.columns and ref_cols:
+    from batch_mt import translate_many
+    from compare import score_matrix
+    sub = items_df.head(int(n_items))
+    sources = sub["source"].astype(str).tolist()
+    refs = [[r for r in row if isinstance(r, str) and r.strip()] for row in sub[ref_cols].itertuples(index=False)]
+    specs = systems_df.dropna(subset=["name"]).drop_duplicates("name")
+    outputs = {}
+    bar = st.progress(0.0, text="Translating…")
+    for k, spec in enumerate(specs.itertuples(index=False)):
+        outputs[str(spec.name)] = translate_many(
+            sources, system_prompt=spec.system_prompt or system, terms=terms,
+            model=spec.model or "gpt-4o-mini", backend=spec.backend or backend)
+        bar.progress((k + 1) / max(1, len(specs)), text=f"Translated with {spec.name}")
+    with st.spinner("Scoring…"):
+        res = score_matrix(outputs, refs, lang=cmp_lang, tiers=("fast", "neural") if neural else ("fast",),
+                           item_ids=sub["id"].tolist() if "id" in sub.columns else None,
+                           resamples=int(n_boot))
+    st.session_state["cmp_result"] = res
+
+res = st.session_state.get("cmp_result")
+if res is not None:
+    st.markdown("#### Systems (corpus level, all references)")
+    st.dataframe(res.systems, use_container_width=True, hide_index=True)
+    if not res.significance.empty:
+        st.markdown("#### Paired bootstrap")
+        st.dataframe(res.significance, use_container_width=True, hide_index=True)
+    with st.expander("Per item"):
+        st.dataframe(res.items, use_container_width=True, hide_index=True)
+    st.download_button("⬇️ Paired results (CSV)", res.pairs.to_csv(index=False).encode("utf-8"),
+                       file_name="comparison_pairs.csv", mime="text/csv")
+    st.download_button("⬇️ Significance tests (CSV)", res.significance.to_csv(index=False).encode("utf-8"),
+                       file_name="comparison_significance.csv", mime="text/csv")
+
+# ------------- Experiment grid -------------
+st.divider()
+st.subheader("Experiment grid")
+st.caption("Every combination of prompts × constraints × glossaries × models over the items above, "
+           "run as one batch (identical requests are sent once), scored, and saved to data/eduapp.db.")
+exp_name = st.text_input("Experiment name", "prompt sweep")
+g_prompts = st.text_area("System prompts (separate with a line containing only ---)",
+                         system + "\n---\n" + system + " Translate as literally as the target language allows.")
+g1, g2 = st.columns(2)
+g_styles = g1.text_area("Constraints, one per line (empty line = none)", "\n" + style)
+g_terms = g2.text_area("Glossaries, one per line (empty line = none)", "\n" + terms)
+g3, g4 = st.columns(2)
+g_models = g3.multiselect("Models", ["gpt-4o-mini", "gpt-4o", "gpt-4.1-mini", "gpt-4.1"], default=["gpt-4o-mini"])
+g_conc = g4.number_input("Concurrent requests", min_value=1, max_value=64, value=8)
+
+grid = experiments.expand_grid(
+    [p for p in g_prompts.split("\n---\n") if p.strip()],
+    styles=g_styles.split("\n"), glossaries=g_terms.split("\n"),
+    models=g_models or ["gpt-4o-mini"], backends=[backend])
+n_grid_items = min(int(n_items), len(items_df))
+st.write(f"{len(grid)} configuration(s) × {n_grid_items} item(s) = {len(grid) * n_grid_items} outputs")
+
+if st.button("Run experiment") and "source" in items_df.columns:
+    sub = items_df.head(n_grid_items).copy()
+    if ref_cols:
+        sub["reference"] = sub[ref_cols[0]]
+    bar = st.progress(0.0, text="Translating…")
+    try:
+        exp_id = experiments.run_experiment(
+            exp_name, sub, grid, lang=cmp_lang, tiers=("fast", "neural") if neural else ("fast",),
+            concurrency=int(g_conc),
+            on_progress=lambda done, total: bar.progress(done / max(1, total), text=f"{done}/{total} unique requests"))
+    except ValueError as e:
+        bar.empty()
+        st.error(str(e))
+    else:
+        st.session_state["exp_selected"] = exp_id
+        st.success(f"Experiment {exp_id} saved.")
+
+runs = experiments.list_experiments()
+if not runs.empty:
+    labels = {r.exp_id: f"{r.name} · {r.exp_id} · {r.n_configs}×{r.n_items} · {r.status} · {r.seconds:.1f}s"
+              for r in runs.itertuples()}
+    ids = list(labels)
+    chosen = st.selectbox("Saved experiments", ids, format_func=labels.get,
+                          index=ids.index(st.session_state["exp_selected"])
+                          if st.session_state.get("exp_selected") in ids else 0)
+    st.dataframe(experiments.summary(chosen), use_container_width=True, hide_index=True)
+    e1, e2, e3 = st.columns(3)
+    # Joining, pivoting and serialising every output is built on request, not on each rerun
+    if e1.button("Prepare outputs CSV"):
+        st.session_state["exp_csv"] = (chosen, experiments.outputs(chosen).to_csv(index=False).encode("utf-8"))
+    if st.session_state.get("exp_csv", (None,))[0] == chosen:
+        e1.download_button("⬇️ All outputs (CSV)", st.session_state["exp_csv"][1],
+                           file_name=f"experiment_{chosen}.csv", mime="text/csv")
+    if e2.button("Significance between configurations"):
+        st.dataframe(experiments.compare_configs(chosen, resamples=int(n_boot) or 1000).significance,
+                     use_container_width=True, hide_index=True)
+    if e3.button("Delete experiment"):
+        experiments.delete(chosen)
+        st.rerun()
+    with st.expander("Query experiments (read-only SQL)"):
+        sql = st.text_area("SQL", "SELECT config_id, metric, AVG(value) AS mean FROM exp_scores "
+                                  f"WHERE exp_id = '{chosen}' GROUP BY config_id, metric")
+        if st.button("Run query"):
+            try:
+                st.dataframe(experiments.query(sql), use_container_width=True)
+            except Exception as e:
+                st.error(str(e))
+
+perf.page_end("Prompt_Lab", _perf_t0)
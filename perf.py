@@ -0,0 +1,267 @@
+# perf.py
+"""
+In-process timing, token and cache instrumentation for the hot paths.
+
+    from perf import timed, span
+    @timed("utils_mt.load_tickets")
+    def load_tickets(): ...
+    with span("dashboard.aggregates"): ...
+
+Every span keeps a cumulative histogram (Prometheus-style buckets) plus the most
+recent samples for percentiles. Chat Completions token usage is counted per model.
+snapshot() feeds pages/0_Performance.py and prometheus_text() renders everything
+in the Prometheus text exposition format; EDUAPP_METRICS_PORT additionally serves
+it at http://127.0.0.1:<port>/metrics (EDUAPP_METRICS_HOST=0.0.0.0 exposes it to
+other hosts; there is no authentication). EDUAPP_PERF=0 turns the decorators into no-ops.
+"""
+
+from __future__ import annotations
+import os, sys, time, bisect, functools, threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+PERF_ENABLED = os.getenv("EDUAPP_PERF", "1").strip().lower() not in ("0", "false", "no")
+METRICS_PORT = int(os.getenv("EDUAPP_METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("EDUAPP_METRICS_HOST", "").strip() or "127.0.0.1"
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_RECENT = 512  # samples kept per span for percentiles
+
+_lock = threading.Lock()
+_started = time.time()
+
+
+class _Histogram:
+    __slots__ = ("counts", "count", "total", "max", "errors", "recent")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = 0
+        self.recent: deque = deque(maxlen=_RECENT)
+
+    def observe(self, seconds: float, error: bool = False):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.errors += error
+        self.recent.append(seconds)
+
+
+_spans: Dict[str, _Histogram] = {}
+_tokens: Dict[str, Dict[str, int]] = {}
+_counters: Dict[str, int] = {}
+
+
+def observe(name: str, seconds: float, error: bool = False):
+    with _lock:
+        h = _spans.get(name)
+        if h is None:
+            h = _spans[name] = _Histogram()
+        h.observe(seconds, error)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time a block under `name` (exceptions are counted as errors and re-raised)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        # st.stop()/st.rerun() raise control-flow exceptions; they are not failures
+        observe(name, time.perf_counter() - t0, error=not type(e).__name__.endswith(("StopException", "RerunException")))
+        raise
+    observe(name, time.perf_counter() - t0)
+
+
+def timed(name: Optional[str] = None) -> Callable[[Callable], Callable]:
+    """Decorator form of span(); the name defaults to module.function."""
+    def deco(fn: Callable) -> Callable:
+        if not PERF_ENABLED:
+            return fn
+        label = name or f"{fn.__module__}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def count(name: str, n: int = 1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def record_tokens(model: str, usage: Any):
+    """Add a Chat Completions `usage` object (or dict) to the per-model token totals."""
+    if usage is None:
+        return
+    get = usage.get if isinstance(usage, dict) else (lambda k, d=0: getattr(usage, k, d))
+    with _lock:
+        t = _tokens.setdefault(model or "unknown", {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0})
+        t["requests"] += 1
+        t["prompt_tokens"] += int(get("prompt_tokens", 0) or 0)
+        t["completion_tokens"] += int(get("completion_tokens", 0) or 0)
+
+
+# ------------- Page reruns -------------
+def page_start(page: str) -> float:
+    """Call first thing in a page; pass the result to page_end() at the bottom."""
+    count(f"rerun:{page}")
+    return time.perf_counter()
+
+
+def page_end(page: str, t0: float):
+    observe(f"page:{page}", time.perf_counter() - t0)
+
+
+# ------------- Reporting -------------
+def _quantile(sorted_samples: List[float], q: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    return sorted_samples[min(len(sorted_samples) - 1, int(q * len(sorted_samples)))]
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Hit rates of every cache in the app (imports are local so perf stays dependency-free)."""
+    out: Dict[str, Dict[str, Any]] = {}
+    with _lock:
+        hits, misses = _counters.get("frame_cache_hit", 0), _counters.get("frame_cache_miss", 0)
+    out["frames"] = {"hits": hits, "misses": misses,
+                     "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0}
+    try:
+        import mt_cache
+        out["mt_cache"] = mt_cache.stats()
+    except Exception:
+        pass
+    try:
+        import tm
+        s = tm.stats()
+        looked = s["lookups"] or 0
+        s["hit_rate"] = round((s["exact_hits"] + s["fuzzy_hits"]) / looked, 4) if looked else 0.0
+        out["translation_memory"] = s
+    except Exception:
+        pass
+    try:
+        import glossary
+        out["glossary"] = glossary.stats()
+    except Exception:
+        pass
+    try:
+        import emb_cache
+        out["bertscore_refs"] = emb_cache.stats()
+    except Exception:
+        pass
+    metrics = sys.modules.get("metrics")  # don't import the metric stack just to report on it
+    if metrics is not None:
+        models = metrics.scorer_registry.stats()["models"]
+        loads = sum(m["loads"] for m in models.values())
+        calls = sum(m["calls"] for m in models.values())
+        out["bertscore_models"] = {"resident": len(metrics.scorer_registry.stats()["resident"]),
+                                   "loads": loads, "calls": calls,
+                                   "hit_rate": round(max(0, calls - loads) / calls, 4) if calls else 0.0}
+    return out
+
+
+def snapshot() -> Dict[str, Any]:
+    """Spans (count/mean/p50/p95/p99/max ms), token usage, counters and cache stats."""
+    with _lock:
+        spans = {n: (h.count, h.total, h.max, h.errors, sorted(h.recent)) for n, h in _spans.items()}
+        tokens = {m: dict(t) for m, t in _tokens.items()}
+        counters = dict(_counters)
+    rows = []
+    for n, (c, total, mx, err, recent) in sorted(spans.items()):
+        rows.append({"span": n, "count": c, "errors": err,
+                     "mean_ms": round(1000 * total / c, 2) if c else 0.0,
+                     "p50_ms": round(1000 * _quantile(recent, 0.50), 2),
+                     "p95_ms": round(1000 * _quantile(recent, 0.95), 2),
+                     "p99_ms": round(1000 * _quantile(recent, 0.99), 2),
+                     "max_ms": round(1000 * mx, 2), "total_s": round(total, 3)})
+    return {"uptime_s": round(time.time() - _started, 1), "pid": os.getpid(), "spans": rows,
+            "tokens": tokens, "counters": counters, "caches": cache_stats()}
+
+
+def _label(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def prometheus_text() -> str:
+    """Everything in snapshot() as Prometheus text exposition format (0.0.4)."""
+    with _lock:
+        spans = {n: (list(h.counts), h.count, h.total, h.errors) for n, h in _spans.items()}
+        tokens = {m: dict(t) for m, t in _tokens.items()}
+        counters = dict(_counters)
+    lines = ["# HELP eduapp_span_seconds Time spent in instrumented code paths.",
+             "# TYPE eduapp_span_seconds histogram"]
+    for n, (counts, c, total, _) in sorted(spans.items()):
+        cum = 0
+        for le, k in zip(list(BUCKETS) + ["+Inf"], counts):
+            cum += k
+            lines.append(f'eduapp_span_seconds_bucket{{span="{_label(n)}",le="{le}"}} {cum}')
+        lines.append(f'eduapp_span_seconds_sum{{span="{_label(n)}"}} {total:.6f}')
+        lines.append(f'eduapp_span_seconds_count{{span="{_label(n)}"}} {c}')
+    lines += ["# HELP eduapp_span_errors_total Instrumented calls that raised.", "# TYPE eduapp_span_errors_total counter"]
+    lines += [f'eduapp_span_errors_total{{span="{_label(n)}"}} {v[3]}' for n, v in sorted(spans.items())]
+    lines += ["# HELP eduapp_openai_tokens_total Chat Completions tokens by model and kind.",
+              "# TYPE eduapp_openai_tokens_total counter"]
+    for m, t in sorted(tokens.items()):
+        lines.append(f'eduapp_openai_tokens_total{{model="{_label(m)}",kind="prompt"}} {t["prompt_tokens"]}')
+        lines.append(f'eduapp_openai_tokens_total{{model="{_label(m)}",kind="completion"}} {t["completion_tokens"]}')
+    lines += ["# HELP eduapp_openai_requests_total Chat Completions responses by model.",
+              "# TYPE eduapp_openai_requests_total counter"]
+    lines += [f'eduapp_openai_requests_total{{model="{_label(m)}"}} {t["requests"]}' for m, t in sorted(tokens.items())]
+    lines += ["# HELP eduapp_events_total Event counters (cache hits, page reruns, ...).", "# TYPE eduapp_events_total counter"]
+    lines += [f'eduapp_events_total{{event="{_label(k)}"}} {v}' for k, v in sorted(counters.items())]
+    lines += ["# HELP eduapp_cache_hit_ratio Hit rate per cache since process start.", "# TYPE eduapp_cache_hit_ratio gauge"]
+    for name, s in sorted(cache_stats().items()):
+        if isinstance(s.get("hit_rate"), (int, float)):
+            lines.append(f'eduapp_cache_hit_ratio{{cache="{_label(name)}"}} {s["hit_rate"]}')
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+        _tokens.clear()
+        _counters.clear()
+
+
+# ------------- Optional /metrics endpoint -------------
+_server: Optional[Any] = None
+
+
+def serve_metrics(port: int = METRICS_PORT, host: str = METRICS_HOST) -> Optional[int]:
+    """Start a background /metrics HTTP endpoint once per process; returns the port or None."""
+    global _server
+    if not port:
+        return None
+    with _lock:
+        if _server is not None:
+            return _server.server_address[1]
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class _Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args: Any):
+                pass
+
+            def do_GET(self):
+                found = self.path.startswith("/metrics")
+                body = prometheus_text().encode("utf-8") if found else b""
+                self.send_response(200 if found else 404)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        try:
+            _server = ThreadingHTTPServer((host, port), _Handler)
+        except OSError:
+            return None  # another process (e.g. a second worker) already serves this port
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+        return port
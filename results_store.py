@@ -0,0 +1,442 @@
+# results_store.py
+"""
+Append-only results log for research exports.
+
+Each submission is written as one JSON line to data/results.jsonl under an
+exclusive file lock, so a submit never reads what is already stored and two
+students submitting at once cannot clobber each other. New metric_* keys are
+simply new keys in the record; nothing already written is rewritten.
+
+compact_results() folds the pending log into data/results.csv (the file the
+Admin and Dashboard pages download) on demand.
+
+Scores computed after a submission (see scoring_queue.py) are appended as patch
+records ({"_patch_for": submission_id, "metric_...": ...}) and merged into their
+row when the log is read or compacted.
+"""
+
+from __future__ import annotations
+import os, json, time, hashlib, threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+import analytics
+from storage import atomic_write, data_path
+
+try:
+    import fcntl  # POSIX
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+RESULTS_PATH = data_path("results.csv")
+RESULTS_LOG_PATH = data_path("results.jsonl")
+_LOCK_PATH = data_path(".results.lock")
+PATCH_KEY = "_patch_for"
+# Rows still waiting for background scores stay in the log this long before a
+# Parquet flush writes them without metrics (CSV compaction can patch old rows).
+SCORING_HOLD_SECONDS = int(os.getenv("SCORING_HOLD_SECONDS", "600"))
+
+# In-process lock as well: flock is per open file description, and it is the only
+# guard on platforms without fcntl.
+_thread_lock = threading.Lock()
+
+
+@contextmanager
+def file_lock(path: str = _LOCK_PATH) -> Iterator[None]:
+    """Exclusive cross-process lock held for the duration of the block."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with _thread_lock:
+        with open(path, "a") as fh:
+            if fcntl is not None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+def _jsonable(v: Any) -> Any:
+    """Coerce numpy/pandas scalars and NaN into plain JSON values."""
+    if hasattr(v, "item") and callable(v.item):
+        try:
+            v = v.item()
+        except Exception:
+            pass
+    if isinstance(v, float) and v != v:
+        return None
+    if isinstance(v, (str, int, float, bool)) or v is None:
+        return v
+    return str(v)
+
+
+def append_record(row: Dict[str, Any], log_path: str = RESULTS_LOG_PATH):
+    """Append one submission record; O(1) regardless of how many rows exist."""
+    line = json.dumps({k: _jsonable(v) for k, v in row.items()}, ensure_ascii=False) + "\n"
+    with file_lock():
+        with open(log_path, "a", encoding="utf-8") as fh:
+            fh.write(line)
+            fh.flush()
+            os.fsync(fh.fileno())
+            size = os.fstat(fh.fileno()).st_size
+    if size >= RESULTS_FLUSH_BYTES and parquet_enabled():
+        flush_to_parquet(log_path)
+
+
+def append_metrics(submission_id: str, metrics: Dict[str, Any], log_path: str = RESULTS_LOG_PATH):
+    """Attach late-arriving metric_* values to an already-logged submission."""
+    append_record({PATCH_KEY: submission_id, **metrics}, log_path)
+    analytics.record_metrics(submission_id, metrics)
+
+
+def _split_patches(records: List[Dict[str, Any]]):
+    """
+    Merge patch records into the rows they refer to.
+    Returns (rows, unmatched_patches) where unmatched patches target rows that
+    were compacted earlier.
+    """
+    rows: List[Dict[str, Any]] = []
+    by_id: Dict[str, Dict[str, Any]] = {}
+    patches: List[Dict[str, Any]] = []
+    for rec in records:
+        if PATCH_KEY in rec:
+            patches.append(rec)
+        else:
+            rows.append(rec)
+            if rec.get("submission_id"):
+                by_id[str(rec["submission_id"])] = rec
+    leftover = []
+    for p in patches:
+        target = by_id.get(str(p[PATCH_KEY]))
+        values = {k: v for k, v in p.items() if k != PATCH_KEY}
+        if target is None:
+            leftover.append(p)
+        else:
+            target.update(values)
+    return rows, leftover
+
+
+def _apply_patches_to_frame(df, patches: List[Dict[str, Any]]):
+    """Apply patches for rows that already live in the compacted frame."""
+    if not patches or df.empty or "submission_id" not in df.columns:
+        return df
+    ids = df["submission_id"].astype(str)
+    for p in patches:
+        mask = ids == str(p[PATCH_KEY])
+        for k, v in p.items():
+            if k == PATCH_KEY:
+                continue
+            if k not in df.columns:
+                df[k] = None
+            df.loc[mask, k] = v
+    return df
+
+
+def _read_log(log_path: str) -> List[Dict[str, Any]]:
+    records = []
+    if not os.path.exists(log_path):
+        return records
+    with open(log_path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # A torn final line from a crash mid-write; skip it rather than fail the export
+                continue
+    return records
+
+
+def _merged_frame(csv_path: str, pending: List[Dict[str, Any]]):
+    import pandas as pd
+    try:
+        base = pd.read_csv(csv_path)
+    except Exception:
+        base = pd.DataFrame()
+    rows, leftover = _split_patches(pending)
+    base = _apply_patches_to_frame(base, leftover)
+    if not rows:
+        return base
+    return pd.concat([base, pd.DataFrame(rows)], ignore_index=True)
+
+
+def read_results(csv_path: str = RESULTS_PATH, log_path: str = RESULTS_LOG_PATH):
+    """All results (compacted CSV or Parquet + pending log) as a DataFrame, without writing anything."""
+    if parquet_enabled():
+        import pandas as pd
+        with file_lock():
+            rows, _ = _split_patches(_read_log(log_path))
+        base = scan_results().to_pandas()
+        return pd.concat([base, pd.DataFrame(rows)], ignore_index=True) if rows else base
+    with file_lock():
+        return _merged_frame(csv_path, _read_log(log_path))
+
+
+def pending_count(log_path: str = RESULTS_LOG_PATH) -> int:
+    """Number of submissions waiting to be compacted into the CSV."""
+    if not os.path.exists(log_path):
+        return 0
+    with open(log_path, "rb") as fh:
+        return sum(1 for line in fh if line.strip() and PATCH_KEY.encode() not in line)
+
+
+def compact_results(csv_path: str = RESULTS_PATH, log_path: str = RESULTS_LOG_PATH) -> int:
+    """
+    Fold pending log records into results.csv (new metric_* columns are added,
+    older rows get blanks) and truncate the log. Returns the number of rows folded in.
+    With the Parquet backend, pending records are flushed into the dataset instead.
+    """
+    if parquet_enabled():
+        return flush_to_parquet(log_path, csv_path=csv_path)
+    with file_lock():
+        pending = _read_log(log_path)
+        if not pending:
+            return 0
+        df = _merged_frame(csv_path, pending)
+        atomic_write(csv_path, lambda tmp: df.to_csv(tmp, index=False))
+        open(log_path, "w").close()
+        return sum(1 for r in pending if PATCH_KEY not in r)
+
+
+def rewrite_results(transform, csv_path: str = RESULTS_PATH, log_path: str = RESULTS_LOG_PATH) -> int:
+    """
+    Apply `transform(df) -> df` to every stored result (e.g. to backfill a new metric
+    column) and persist it. Pending records are folded in first. The transform must
+    keep rows and may only add or update columns. Returns the number of rows seen.
+    """
+    if parquet_enabled():
+        return _rewrite_parquet(transform, log_path=log_path, csv_path=csv_path)
+    with file_lock():
+        df = transform(_merged_frame(csv_path, _read_log(log_path)))
+        if df.empty:
+            return 0
+        atomic_write(csv_path, lambda tmp: df.to_csv(tmp, index=False))
+        open(log_path, "w").close()
+        return len(df)
+
+
+# ------------- Optional columnar backend (Parquet) -------------
+# EDUAPP_RESULTS_BACKEND=parquet keeps results in a hive-partitioned Parquet dataset
+# (date=/mode=/student=) instead of one ever-growing CSV. The JSON log above stays the
+# write-ahead buffer; it is flushed into Parquet once it reaches RESULTS_FLUSH_BYTES.
+# Dashboard reads become projected, predicate-pushed scans and the CSV export is
+# streamed batch by batch, so memory stays flat as results grow.
+RESULTS_BACKEND = os.getenv("EDUAPP_RESULTS_BACKEND", "csv").strip().lower()
+RESULTS_PARQUET_DIR = data_path("results_parquet")
+RESULTS_EXPORT_PATH = data_path("results_export.csv")
+RESULTS_FLUSH_BYTES = int(os.getenv("RESULTS_FLUSH_BYTES", str(256 * 1024)))
+PARTITION_COLUMNS = ["date", "mode", "student"]
+
+
+def parquet_enabled() -> bool:
+    """True when the Parquet backend is selected and pyarrow is importable."""
+    if RESULTS_BACKEND != "parquet":
+        return False
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _normalize_frame(df):
+    """
+    Stable column types across files so schemas unify: metric_* -> float64,
+    timestamp -> int64, everything else -> string. Adds the `date` partition key.
+    """
+    import pandas as pd
+    df = df.copy()
+    ts = pd.to_numeric(df.get("timestamp"), errors="coerce") if "timestamp" in df else None
+    if ts is None:
+        ts = pd.Series([0] * len(df), index=df.index)
+    df["timestamp"] = ts.fillna(0).astype("int64")
+    df["date"] = pd.to_datetime(df["timestamp"], unit="s", utc=True).dt.strftime("%Y-%m-%d")
+    for c in df.columns:
+        if c.startswith("metric_"):
+            df[c] = pd.to_numeric(df[c], errors="coerce").astype("float64")
+        elif c != "timestamp":
+            df[c] = df[c].map(lambda v: "" if v is None or (isinstance(v, float) and v != v) else str(v))
+    for c in ("mode", "student"):
+        if c not in df:
+            df[c] = ""
+        df[c] = df[c].replace("", "_")  # empty hive partition values are not allowed
+    return df
+
+
+def _write_parquet(df, base_dir: str = RESULTS_PARQUET_DIR):
+    import uuid
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    if df.empty:
+        return
+    table = pa.Table.from_pandas(_normalize_frame(df), preserve_index=False)
+    part_schema = pa.schema([(c, pa.string()) for c in PARTITION_COLUMNS])
+    ds.write_dataset(
+        table, base_dir, format="parquet",
+        partitioning=ds.partitioning(part_schema, flavor="hive"),
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+def _migrate_csv(csv_path: str, base_dir: str):
+    """One-time import of an existing results.csv into the Parquet dataset (chunked)."""
+    import pandas as pd
+    if os.path.isdir(base_dir) or not os.path.exists(csv_path):
+        return
+    os.makedirs(base_dir, exist_ok=True)
+    for chunk in pd.read_csv(csv_path, chunksize=50_000):
+        _write_parquet(chunk, base_dir)
+
+
+def flush_to_parquet(log_path: str = RESULTS_LOG_PATH, base_dir: str = RESULTS_PARQUET_DIR,
+                     csv_path: str = RESULTS_PATH) -> int:
+    """
+    Move pending log records into the Parquet dataset. Returns rows flushed.
+    Rows whose background scoring is still queued are kept in the log (up to
+    SCORING_HOLD_SECONDS) so their metrics land in the same Parquet row.
+    """
+    import pandas as pd
+    with file_lock():
+        _migrate_csv(csv_path, base_dir)
+        rows, leftover = _split_patches(_read_log(log_path))
+        now = time.time()
+        ready, held = [], []
+        for r in rows:
+            waiting = r.get("scoring_status") == "queued"
+            age = now - float(r.get("timestamp") or 0)
+            (held if waiting and age < SCORING_HOLD_SECONDS else ready).append(r)
+        held_ids = {str(r.get("submission_id")) for r in held}
+        # Patches for rows that were already flushed cannot be applied to immutable files
+        keep = held + [p for p in leftover if str(p[PATCH_KEY]) in held_ids]
+        if ready:
+            _write_parquet(pd.DataFrame(ready), base_dir)
+        if ready or len(keep) != len(rows) + len(leftover):
+            with open(log_path, "w", encoding="utf-8") as fh:
+                for rec in keep:
+                    fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        return len(ready)
+
+
+def _rewrite_parquet(transform, base_dir: str = RESULTS_PARQUET_DIR, log_path: str = RESULTS_LOG_PATH,
+                     csv_path: str = RESULTS_PATH) -> int:
+    """rewrite_results() for the Parquet backend: one data file at a time, replaced atomically."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    flush_to_parquet(log_path, base_dir, csv_path)
+    if not os.path.isdir(base_dir):
+        return 0
+    seen = 0
+    with file_lock():
+        for root, _, files in os.walk(base_dir):
+            for name in files:
+                if not name.endswith(".parquet"):
+                    continue
+                path = os.path.join(root, name)
+                df = transform(pq.read_table(path).to_pandas())
+                for c in df.columns:
+                    if c.startswith("metric_"):
+                        df[c] = df[c].astype("float64")
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                atomic_write(path, lambda tmp: pq.write_table(table, tmp))
+                seen += len(df)
+    return seen
+
+
+def _dataset(base_dir: str = RESULTS_PARQUET_DIR):
+    """pyarrow Dataset over all partitions with the per-file schemas unified."""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    part = ds.partitioning(pa.schema([(c, pa.string()) for c in PARTITION_COLUMNS]), flavor="hive")
+    probe = ds.dataset(base_dir, format="parquet", partitioning=part)
+    schemas = [f.physical_schema for f in probe.get_fragments()]
+    if not schemas:
+        return probe
+    schema = pa.unify_schemas(schemas + [probe.schema])
+    return ds.dataset(base_dir, format="parquet", partitioning=part, schema=schema)
+
+
+def scan_results(columns: Optional[List[str]] = None, filter: Any = None,
+                 base_dir: str = RESULTS_PARQUET_DIR):
+    """
+    Projected, predicate-pushed scan of the Parquet results as a pyarrow Table.
+    `filter` is a pyarrow.dataset expression, e.g. ds.field("mode") == "ticket".
+    Columns that don't exist yet (e.g. a metric nobody has produced) are skipped.
+    """
+    import pyarrow as pa
+    if not os.path.isdir(base_dir):
+        return pa.table({c: pa.array([], pa.string()) for c in (columns or [])})
+    dset = _dataset(base_dir)
+    if columns is not None:
+        columns = [c for c in columns if c in dset.schema.names]
+    return dset.to_table(columns=columns, filter=filter)
+
+
+def aggregate_results(group_by: List[str], metrics: List[str],
+                      base_dir: str = RESULTS_PARQUET_DIR):
+    """Submission counts and metric means per group, reading only the needed columns."""
+    table = scan_results(group_by + metrics, base_dir=base_dir)
+    metrics = [m for m in metrics if m in table.column_names]
+    group_by = [g for g in group_by if g in table.column_names]
+    if not group_by or table.num_rows == 0:
+        return table.to_pandas()
+    aggs = [(group_by[0], "count")] + [(m, "mean") for m in metrics]
+    return table.group_by(group_by).aggregate(aggs).to_pandas()
+
+
+def head_results(n: int = 50, base_dir: str = RESULTS_PARQUET_DIR):
+    """First `n` Parquet rows as a DataFrame, reading as few row groups as possible."""
+    import pandas as pd
+    if not os.path.isdir(base_dir):
+        return pd.DataFrame()
+    return _dataset(base_dir).head(n).to_pandas()
+
+
+def _dataset_version(base_dir: str) -> str:
+    """Digest of every data file's path, size and mtime: changes with each flush or rewrite."""
+    h = hashlib.sha256()
+    for root, _, files in sorted(os.walk(base_dir)):
+        for f in sorted(files):
+            st = os.stat(os.path.join(root, f))
+            h.update(f"{root}/{f}:{st.st_size}:{st.st_mtime_ns}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def export_results_csv(out_path: str = RESULTS_EXPORT_PATH, base_dir: str = RESULTS_PARQUET_DIR) -> str:
+    """
+    Stream the Parquet dataset into a CSV file batch by batch; returns its path.
+    The export is reused as is while the dataset has not changed since it was built.
+    """
+    import pyarrow.csv as pacsv
+    flush_to_parquet(base_dir=base_dir)
+    version = _dataset_version(base_dir)
+    try:
+        with open(out_path + ".version", encoding="utf-8") as fh:
+            if fh.read() == version and os.path.exists(out_path):
+                return out_path
+    except OSError:
+        pass
+
+    def _write(tmp: str):
+        # Not under the results lock: a unique temp file keeps concurrent exports apart
+        if not os.path.isdir(base_dir):
+            open(tmp, "w").close()
+            return
+        dset = _dataset(base_dir)
+        with pacsv.CSVWriter(tmp, dset.schema) as writer:
+            for batch in dset.to_batches():
+                writer.write_batch(batch)
+
+    atomic_write(out_path, _write)
+    with open(out_path + ".version", "w", encoding="utf-8") as fh:
+        fh.write(version)
+    return out_path
+
+
+def results_download_path() -> Optional[str]:
+    """CSV path for the download buttons, refreshed from whichever backend is active."""
+    if parquet_enabled():
+        return export_results_csv()
+    compact_results()
+    return RESULTS_PATH if os.path.exists(RESULTS_PATH) else None
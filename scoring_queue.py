@@ -0,0 +1,234 @@
+# scoring_queue.py
+"""
+Background scoring so MT Lab never blocks on BERTScore.
+
+Jobs are recorded in SQLite (data/eduapp.db, table scoring_jobs) and executed in a
+process pool; the worker processes import metrics/torch once and keep the BERTScore
+model warm. When a job finishes its scores are written to the job row (for the
+page to poll) and, if it belongs to a saved submission, appended to the results
+log as metric_* values for that submission. If BERTScore fails, the fast-tier
+scores are still saved and the submission is marked scoring_status=partial.
+
+The table is one queue shared by every Streamlit process using the same data root.
+Only the process holding the leader lock (an flock next to the database) runs
+the pool, so N web workers still load BERTScore once. That process claims queued
+jobs (queued -> running) and dispatches them, immediately for its own
+submissions and by polling every SCORING_POLL_SECONDS for the others. If it
+exits, the lock is released, another process takes over, and jobs left running
+by the dead process are queued again.
+"""
+
+from __future__ import annotations
+import os, json, time, uuid, threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+from db import DB_PATH, connect, transaction
+import perf
+import results_store
+
+try:
+    import fcntl  # POSIX
+except ImportError:  # pragma: no cover - Windows: every process runs its own pool
+    fcntl = None
+
+SCORING_WORKERS = int(os.getenv("SCORING_WORKERS", "1"))
+SCORING_POLL_SECONDS = float(os.getenv("SCORING_POLL_SECONDS", "0.5"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scoring_jobs (
+    job_id        TEXT PRIMARY KEY,
+    submission_id TEXT NOT NULL DEFAULT '',
+    candidate     TEXT NOT NULL,
+    reference     TEXT NOT NULL,
+    lang          TEXT NOT NULL DEFAULT 'en',
+    status        TEXT NOT NULL DEFAULT 'queued',
+    scores        TEXT NOT NULL DEFAULT '',
+    error         TEXT NOT NULL DEFAULT '',
+    owner_pid     INTEGER NOT NULL DEFAULT 0,
+    created_at    REAL NOT NULL,
+    finished_at   REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_scoring_jobs_status ON scoring_jobs(status);
+"""
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_ready: set = set()
+_leaders: Dict[str, Any] = {}  # db path -> (pid, open lock file) while this process leads
+_leader_lock = threading.Lock()
+
+
+def _conn(path: str = DB_PATH):
+    conn = connect(path)
+    if path not in _ready:
+        conn.executescript(_SCHEMA)
+        _ready.add(path)
+        threading.Thread(target=_dispatcher, args=(path,), daemon=True,
+                         name="scoring-dispatcher").start()
+    return conn
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            import multiprocessing as mp
+            # spawn, not fork: the Streamlit parent is multi-threaded and torch is not fork-safe
+            _pool = ProcessPoolExecutor(max_workers=max(1, SCORING_WORKERS),
+                                        mp_context=mp.get_context("spawn"))
+        return _pool
+
+
+def _score(candidate: str, reference: str, lang: str) -> Dict[str, Any]:
+    """Runs in a worker process. If the neural tier fails, the fast scores are still returned."""
+    from metrics import score_all
+    scores = score_all(candidate, reference, lang=lang, tiers=("fast",))
+    try:
+        scores.update(score_all(candidate, reference, lang=lang, tiers=("neural",)))
+    except Exception as e:
+        scores["neural_error"] = repr(e)
+    return scores
+
+
+def _warm(references: List[str], lang: str) -> int:
+    """Runs in a worker process: fill the BERTScore reference-embedding cache."""
+    import emb_cache
+    return emb_cache.warm(references, lang=lang)
+
+
+def _on_done(job_id: str, submission_id: str, path: str, fut: Future):
+    conn = connect(path)
+    try:
+        scores = fut.result()
+    except Exception as e:
+        conn.execute("UPDATE scoring_jobs SET status='error', error=?, finished_at=? WHERE job_id=?",
+                     (repr(e), time.time(), job_id))
+        if submission_id:
+            results_store.append_metrics(submission_id, {"scoring_status": "error"})
+        return
+    neural_error = scores.pop("neural_error", "")
+    conn.execute("UPDATE scoring_jobs SET status='done', scores=?, error=?, finished_at=? WHERE job_id=?",
+                 (json.dumps(scores), neural_error, time.time(), job_id))
+    if submission_id:
+        results_store.append_metrics(submission_id, {
+            "scoring_status": "partial" if neural_error else "done",
+            **{f"metric_{k}": v for k, v in scores.items()}})
+
+
+def _dispatch(job_id: str, submission_id: str, candidate: str, reference: str, lang: str, path: str):
+    global _pool
+    t0 = time.perf_counter()
+    try:
+        fut = _get_pool().submit(_score, candidate, reference, lang)
+    except Exception:
+        # A crashed worker leaves the pool broken; start a fresh one once
+        with _pool_lock:
+            _pool = None
+        fut = _get_pool().submit(_score, candidate, reference, lang)
+    # Worker-side spans stay in the worker; time queue wait + scoring from here
+    fut.add_done_callback(lambda f: perf.observe("scoring_queue.job", time.perf_counter() - t0,
+                                                 error=f.exception() is not None))
+    fut.add_done_callback(lambda f: _on_done(job_id, submission_id, path, f))
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError:
+        return False
+
+
+def _is_leader(path: str) -> bool:
+    """Whether this process runs the scoring pool for `path`, taking the lock if it is free."""
+    with _leader_lock:
+        held = _leaders.get(path)
+        if held is not None and held[0] == os.getpid():  # a forked child does not inherit leadership
+            return True
+        if fcntl is None:
+            _leaders[path] = (os.getpid(), None)
+            return True
+        fh = open(path + ".scoring-leader", "a")
+        try:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fh.close()
+            return False
+        _leaders[path] = (os.getpid(), fh)
+    _requeue_orphans(path)
+    return True
+
+
+def _requeue_orphans(path: str):
+    """Queue again the jobs a process that has since exited claimed but never finished."""
+    rows = connect(path).execute(
+        "SELECT job_id, owner_pid FROM scoring_jobs WHERE status = 'running'").fetchall()
+    dead = [(r["job_id"],) for r in rows if r["owner_pid"] != os.getpid() and not _pid_alive(r["owner_pid"])]
+    if dead:
+        with transaction(path) as c:
+            c.executemany("UPDATE scoring_jobs SET status='queued', owner_pid=0 "
+                          "WHERE job_id=? AND status='running'", dead)
+
+
+def _claim(path: str, job_id: Optional[str] = None, limit: int = 64) -> int:
+    """Mark queued jobs (or just `job_id`) as running in this process and dispatch them."""
+    sql = ("SELECT job_id, submission_id, candidate, reference, lang FROM scoring_jobs "
+           "WHERE status = 'queued'" + (" AND job_id = ?" if job_id else " ORDER BY created_at LIMIT ?"))
+    with transaction(path) as c:
+        rows = c.execute(sql, (job_id,) if job_id else (limit,)).fetchall()
+        c.executemany("UPDATE scoring_jobs SET status='running', owner_pid=? WHERE job_id=?",
+                      [(os.getpid(), r["job_id"]) for r in rows])
+    for r in rows:
+        _dispatch(r["job_id"], r["submission_id"], r["candidate"], r["reference"], r["lang"], path)
+    return len(rows)
+
+
+def _dispatcher(path: str):
+    """Background loop: the leader drains the shared queue; other processes wait to take over."""
+    while True:
+        try:
+            if _is_leader(path):
+                if _claim(path):
+                    continue
+                time.sleep(SCORING_POLL_SECONDS)
+            else:
+                time.sleep(max(1.0, 4 * SCORING_POLL_SECONDS))
+        except Exception:
+            time.sleep(max(1.0, 4 * SCORING_POLL_SECONDS))  # e.g. database busy; try again
+
+
+def submit_job(candidate: str, reference: str, lang: str = "en",
+               submission_id: str = "", path: str = DB_PATH) -> str:
+    """Queue a scoring job and return its id immediately (any process; the leader scores it)."""
+    job_id = uuid.uuid4().hex
+    _conn(path).execute(
+        "INSERT INTO scoring_jobs(job_id, submission_id, candidate, reference, lang, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (job_id, submission_id, candidate, reference, lang, time.time()))
+    if _is_leader(path):
+        _claim(path, job_id)
+    return job_id
+
+
+def warm_references(references: List[str], lang: str = "en") -> Future:
+    """Encode references into the embedding cache in a scoring worker; the future yields the count added."""
+    return _get_pool().submit(_warm, list(references), lang)
+
+
+def job_status(job_id: str, path: str = DB_PATH) -> Dict[str, Any]:
+    """
+    {"status": queued|running|done|error|unknown, "scores": {...}, "error": str}
+    A "done" job with an error only lost its neural scores (BERTScore); the fast ones are kept.
+    """
+    row = _conn(path).execute("SELECT status, scores, error FROM scoring_jobs WHERE job_id=?",
+                              (job_id,)).fetchone()
+    if row is None:
+        return {"status": "unknown", "scores": {}, "error": ""}
+    return {"status": row["status"], "scores": json.loads(row["scores"]) if row["scores"] else {},
+            "error": row["error"]}
+
+
+def queue_stats(path: str = DB_PATH) -> Dict[str, int]:
+    """Job counts by status."""
+    rows = _conn(path).execute("SELECT status, COUNT(*) AS n FROM scoring_jobs GROUP BY status").fetchall()
+    return {r["status"]: r["n"] for r in rows}
@@ -0,0 +1,74 @@
+# storage.py
+"""
+Where EduApp keeps shared state, so several Streamlit worker processes can serve
+one class.
+
+Every store (SQLite databases, the results log, caches, sample data) lives under
+one data root. It defaults to ./data, and EDUAPP_DATA_ROOT points all workers at
+the same directory, e.g. a volume shared by the containers on one host:
+
+    EDUAPP_DATA_ROOT=/srv/eduapp streamlit run Home.py --server.port 8501
+    EDUAPP_DATA_ROOT=/srv/eduapp streamlit run Home.py --server.port 8502
+
+Concurrent writers are already safe under the root. Tickets, the translation
+cache, the scoring queue and analytics are SQLite (WAL, BEGIN IMMEDIATE). Results
+are appended under an exclusive file lock. CSV snapshots are replaced atomically.
+WAL needs shared memory between the processes, so they must run on one host.
+For a root on a network filesystem set EDUAPP_DB_JOURNAL=delete, which uses the
+rollback journal and relies on the filesystem's POSIX locks.
+"""
+
+from __future__ import annotations
+import os, shutil, tempfile
+from typing import Any, Callable, Dict
+
+DATA_ROOT = os.getenv("EDUAPP_DATA_ROOT", "").strip() or "data"
+DB_JOURNAL_MODE = os.getenv("EDUAPP_DB_JOURNAL", "wal").strip().upper() or "WAL"
+
+
+def data_path(*parts: str) -> str:
+    """Path of `parts` under the data root."""
+    return os.path.join(DATA_ROOT, *parts)
+
+
+def ensure_root() -> str:
+    os.makedirs(DATA_ROOT, exist_ok=True)
+    return DATA_ROOT
+
+
+def atomic_write(path: str, write: Callable[[str], Any]):
+    """
+    Call write(tmp_path), then move the file into place. Readers in other processes
+    see the old or the new file, never a partial one. The temporary file is unique
+    (mkstemp in the same directory), so concurrent writers in any process or thread
+    cannot interleave. Its name starts with a dot, so dataset scans skip it.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def describe() -> Dict[str, Any]:
+    """Data root, journal mode, free space and the size of each top-level store."""
+    root = os.path.abspath(DATA_ROOT)
+    files = {}
+    if os.path.isdir(root):
+        for name in sorted(os.listdir(root)):
+            p = os.path.join(root, name)
+            if os.path.isfile(p):
+                files[name] = os.path.getsize(p)
+    usage = shutil.disk_usage(root) if os.path.isdir(root) else None
+    return {
+        "root": root,
+        "journal_mode": DB_JOURNAL_MODE.lower(),
+        "writable": os.access(root, os.W_OK),
+        "free_mb": round(usage.free / 2 ** 20) if usage else None,
+        "files": files,
+    }
@@ -0,0 +1,300 @@
+# tickets_db.py
+"""
+SQLite-backed ticket store (data/eduapp.db, WAL mode).
+
+Tickets used to live only in data/tickets.csv, rewritten in full on every claim
+and submit. They now live in an indexed table so claims are a single atomic
+conditional UPDATE and "my tickets" / "open tickets" are indexed queries.
+data/tickets.csv is imported once on first use and can still be exported.
+"""
+
+from __future__ import annotations
+import io, os, time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from db import DB_PATH, connect, transaction
+from storage import data_path
+from lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+TIX_PATH = data_path("tickets.csv")
+TICKET_COLUMNS = [
+    "ticket_id", "source", "reference", "src_lang", "tgt_lang",
+    "assigned_to", "due_date", "status", "points",
+]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    ticket_id   TEXT PRIMARY KEY,
+    source      TEXT NOT NULL DEFAULT '',
+    reference   TEXT NOT NULL DEFAULT '',
+    src_lang    TEXT NOT NULL DEFAULT 'en',
+    tgt_lang    TEXT NOT NULL DEFAULT 'ar',
+    assigned_to TEXT NOT NULL DEFAULT '',
+    due_date    TEXT NOT NULL DEFAULT '',
+    status      TEXT NOT NULL DEFAULT 'open',
+    points      INTEGER NOT NULL DEFAULT 5,
+    updated_at  INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_tickets_assigned_status ON tickets(assigned_to, status);
+CREATE INDEX IF NOT EXISTS idx_tickets_status ON tickets(status);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+_ready: set = set()
+
+
+def init_db(path: str = DB_PATH, csv_path: str = TIX_PATH):
+    """Create the schema and import an existing tickets.csv the first time."""
+    if path in _ready:
+        return
+    conn = connect(path)
+    conn.executescript(_SCHEMA)
+    with transaction(path) as c:
+        done = c.execute("SELECT value FROM meta WHERE key='tickets_csv_imported'").fetchone()
+        if not done:
+            if os.path.exists(csv_path):
+                try:
+                    df = pd.read_csv(csv_path)
+                except Exception:
+                    df = pd.DataFrame(columns=TICKET_COLUMNS)
+                _insert_rows(c, _records(df), replace=True)
+            c.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('tickets_csv_imported', '1')")
+    _ready.add(path)
+
+
+def _clean(v: Any, default: Any = "") -> Any:
+    if v is None or (isinstance(v, float) and v != v):
+        return default
+    return v
+
+
+def _records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Normalize a tickets frame into insertable dicts (NaN -> defaults)."""
+    out = []
+    for r in df.to_dict("records"):
+        tid = str(_clean(r.get("ticket_id"), "")).strip()
+        if not tid:
+            continue
+        try:
+            points = int(_clean(r.get("points"), 5))
+        except (TypeError, ValueError):
+            points = 5
+        out.append({
+            "ticket_id": tid,
+            "source": str(_clean(r.get("source"))),
+            "reference": str(_clean(r.get("reference"))),
+            "src_lang": str(_clean(r.get("src_lang"), "en")),
+            "tgt_lang": str(_clean(r.get("tgt_lang"), "ar")),
+            "assigned_to": str(_clean(r.get("assigned_to"))).strip(),
+            "due_date": str(_clean(r.get("due_date"))),
+            "status": str(_clean(r.get("status"), "open")) or "open",
+            "points": points,
+        })
+    return out
+
+
+def _insert_rows(conn, rows: Sequence[Dict[str, Any]], replace: bool = True):
+    verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+    now = int(time.time())
+    conn.executemany(
+        f"{verb} INTO tickets ({', '.join(TICKET_COLUMNS)}, updated_at) "
+        f"VALUES ({', '.join(':' + c for c in TICKET_COLUMNS)}, {now})",
+        rows,
+    )
+
+
+def _frame(sql: str, params: Sequence[Any] = (), path: str = DB_PATH) -> pd.DataFrame:
+    init_db(path)
+    rows = connect(path).execute(sql, params).fetchall()
+    return pd.DataFrame([dict(r) for r in rows], columns=TICKET_COLUMNS)
+
+
+_SELECT = f"SELECT {', '.join(TICKET_COLUMNS)} FROM tickets"
+
+# ------------- Whole-table access (keeps the old CSV-era API) -------------
+def load_all(path: str = DB_PATH) -> pd.DataFrame:
+    return _frame(_SELECT + " ORDER BY rowid", path=path)
+
+
+def replace_all(df: pd.DataFrame, path: str = DB_PATH):
+    """Replace every ticket with the contents of `df` in one transaction."""
+    init_db(path)
+    with transaction(path) as c:
+        c.execute("DELETE FROM tickets")
+        _insert_rows(c, _records(df), replace=True)
+
+
+def insert_ticket(row: Dict[str, Any], path: str = DB_PATH):
+    """Insert (or overwrite, if the ticket_id exists) a single ticket."""
+    init_db(path)
+    with transaction(path) as c:
+        _insert_rows(c, _records(pd.DataFrame([row])), replace=True)
+
+
+def export_csv(path: str = DB_PATH) -> bytes:
+    """Current tickets as CSV bytes (for download buttons)."""
+    buf = io.StringIO()
+    load_all(path).to_csv(buf, index=False)
+    return buf.getvalue().encode("utf-8")
+
+# ------------- Row-level operations -------------
+def get_ticket(ticket_id: str, path: str = DB_PATH) -> Optional[Dict[str, Any]]:
+    init_db(path)
+    row = connect(path).execute(_SELECT + " WHERE ticket_id = ?", (ticket_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def my_tickets(student: str, statuses: Sequence[str] = ("open", "claimed"), path: str = DB_PATH) -> pd.DataFrame:
+    """Tickets assigned to `student` in one of `statuses` (index: assigned_to, status)."""
+    marks = ", ".join("?" for _ in statuses)
+    return _frame(_SELECT + f" WHERE assigned_to = ? AND status IN ({marks}) ORDER BY rowid",
+                  (student, *statuses), path)
+
+
+def open_tickets(path: str = DB_PATH) -> pd.DataFrame:
+    """Unassigned tickets that can be claimed."""
+    return _frame(_SELECT + " WHERE assigned_to = '' ORDER BY rowid", path=path)
+
+
+def claim_ticket(ticket_id: str, student: str, path: str = DB_PATH) -> bool:
+    """
+    Atomically assign an unassigned ticket to `student`.
+    Returns False if someone else claimed it first (or it doesn't exist).
+    """
+    init_db(path)
+    cur = connect(path).execute(
+        "UPDATE tickets SET assigned_to = ?, status = 'claimed', updated_at = ? "
+        "WHERE ticket_id = ? AND assigned_to = ''",
+        (student, int(time.time()), ticket_id),
+    )
+    return cur.rowcount == 1
+
+
+def set_status(ticket_id: str, status: str, student: Optional[str] = None, path: str = DB_PATH) -> bool:
+    """Update one ticket's status (optionally only if it is assigned to `student`)."""
+    init_db(path)
+    sql = "UPDATE tickets SET status = ?, updated_at = ? WHERE ticket_id = ?"
+    params: List[Any] = [status, int(time.time()), ticket_id]
+    if student is not None:
+        sql += " AND assigned_to = ?"
+        params.append(student)
+    return connect(path).execute(sql, params).rowcount == 1
+
+
+# ------------- Bulk import & assignment -------------
+def validate_tickets(df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str]]:
+    """
+    Vectorized clean-up of an uploaded tickets frame.
+
+    Fills missing optional columns, strips text, coerces points, drops rows without
+    ticket_id/source, and de-duplicates ticket_ids (last occurrence wins).
+    Returns (clean_frame, problems) where problems are human-readable messages.
+    """
+    problems: List[str] = []
+    df = df.copy()
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    missing = [c for c in ("ticket_id", "source") if c not in df.columns]
+    if missing:
+        return pd.DataFrame(columns=TICKET_COLUMNS), [f"Missing required column(s): {', '.join(missing)}"]
+
+    defaults = {"reference": "", "src_lang": "en", "tgt_lang": "ar", "assigned_to": "",
+                "due_date": "", "status": ""}
+    for col, default in defaults.items():
+        if col not in df.columns:
+            df[col] = default
+    text_cols = ["ticket_id", "source", *defaults]
+    df[text_cols] = df[text_cols].fillna("").astype(str).apply(lambda s: s.str.strip())
+    df.loc[df["src_lang"] == "", "src_lang"] = "en"
+    df.loc[df["tgt_lang"] == "", "tgt_lang"] = "ar"
+
+    if "points" not in df.columns:
+        df["points"] = 5
+    pts = pd.to_numeric(df["points"], errors="coerce")
+    bad_pts = pts.isna() & df["points"].notna() & (df["points"].astype(str).str.strip() != "")
+    if bad_pts.any():
+        problems.append(f"{int(bad_pts.sum())} row(s) had non-numeric points; used 5")
+    df["points"] = pts.fillna(5).astype(int)
+
+    blank = (df["ticket_id"] == "") | (df["source"] == "")
+    if blank.any():
+        problems.append(f"Dropped {int(blank.sum())} row(s) without ticket_id or source")
+    df = df[~blank]
+
+    dup = df["ticket_id"].duplicated(keep="last")
+    if dup.any():
+        ids = sorted(set(df.loc[dup, "ticket_id"]))
+        shown = ", ".join(ids[:10]) + (" …" if len(ids) > 10 else "")
+        problems.append(f"{int(dup.sum())} duplicate ticket_id row(s) (kept the last): {shown}")
+    df = df[~dup]
+    return df[TICKET_COLUMNS].reset_index(drop=True), problems
+
+
+def upsert_tickets(df: pd.DataFrame, replace: bool = False, path: str = DB_PATH) -> Dict[str, Any]:
+    """
+    Merge a validated frame into the ticket table in a single transaction.
+
+    New ticket_ids are inserted. Existing ones get the content columns present in the
+    upload (source, reference, languages, due date, points) updated; assigned_to/status
+    are only changed when the upload provides a non-empty value, so re-uploading never
+    resets progress.
+    With replace=True, tickets not present in the upload are deleted.
+    """
+    init_db(path)
+    clean, problems = validate_tickets(df)
+    provided = {str(c).strip().lower() for c in df.columns}
+    content = [c for c in ("source", "reference", "src_lang", "tgt_lang", "due_date", "points") if c in provided]
+    now = int(time.time())
+    with transaction(path) as c:
+        existing = pd.Series([r[0] for r in c.execute("SELECT ticket_id FROM tickets")], dtype=object)
+        exists = clean["ticket_id"].isin(existing)
+        new, upd = clean[~exists].copy(), clean[exists]
+        new.loc[new["status"] == "", "status"] = "open"
+        _insert_rows(c, new.to_dict("records"), replace=False)
+        c.executemany(
+            "UPDATE tickets SET " + "".join(f"{col} = :{col}, " for col in content) +
+            "assigned_to = CASE WHEN :assigned_to <> '' THEN :assigned_to ELSE assigned_to END, "
+            f"status = CASE WHEN :status <> '' THEN :status ELSE status END, updated_at = {now} "
+            "WHERE ticket_id = :ticket_id",
+            upd.to_dict("records"),
+        )
+        deleted = 0
+        if replace:
+            c.execute("CREATE TEMP TABLE IF NOT EXISTS _keep (ticket_id TEXT PRIMARY KEY)")
+            c.execute("DELETE FROM _keep")
+            c.executemany("INSERT OR IGNORE INTO _keep VALUES (?)", ((t,) for t in clean["ticket_id"]))
+            deleted = c.execute("DELETE FROM tickets WHERE ticket_id NOT IN (SELECT ticket_id FROM _keep)").rowcount
+    return {"inserted": len(new), "updated": len(upd), "deleted": deleted, "problems": problems}
+
+
+def auto_assign(roster: Sequence[str], path: str = DB_PATH) -> Dict[str, int]:
+    """
+    Assign every unassigned open ticket across `roster`, balancing total points.
+
+    Greedy longest-processing-time: tickets are taken from most to fewest points and
+    each goes to the student with the lowest current load (counting tickets they
+    already hold in open/claimed status). Returns the resulting points per student.
+    """
+    import heapq
+    students = [s.strip() for s in dict.fromkeys(roster) if s and s.strip()]
+    if not students:
+        return {}
+    init_db(path)
+    with transaction(path) as c:
+        load = {s: 0 for s in students}
+        marks = ", ".join("?" for _ in students)
+        for r in c.execute(f"SELECT assigned_to, SUM(points) FROM tickets WHERE assigned_to IN ({marks}) "
+                           "AND status IN ('open', 'claimed') GROUP BY assigned_to", students):
+            load[r[0]] = int(r[1] or 0)
+        todo = c.execute("SELECT ticket_id, points FROM tickets WHERE assigned_to = '' AND status = 'open' "
+                         "ORDER BY points DESC, rowid").fetchall()
+        heap = [(pts, i, s) for i, (s, pts) in enumerate(load.items())]
+        heapq.heapify(heap)
+        updates = []
+        for tid, pts in todo:
+            cur, i, s = heapq.heappop(heap)
+            updates.append((s, tid))
+            heapq.heappush(heap, (cur + int(pts or 0), i, s))
+        c.executemany(f"UPDATE tickets SET assigned_to = ?, updated_at = {int(time.time())} "
+                      "WHERE ticket_id = ? AND assigned_to = ''", updates)
+    return {s: pts for pts, _, s in sorted(heap, key=lambda t: t[1])}
@@ -5,14 +5,35 @@ Utility layer for EduApp:
 - Sample pairs dataset helpers
 - Ticket (assignment) helpers
 - Results logging for research exports
+- mtime-aware loader cache so Streamlit reruns don't re-read unchanged files
+- Every loader/saver and the MT path are timed by perf.timed (see pages/0_Performance.py)
 
 Place this file at the REPO ROOT (same level as Home.py).
 """
 
 from __future__ import annotations
-import os, time
-from typing import Tuple, Optional, Dict, Any
-import pandas as pd
+import os, time, logging, threading
+from typing import Tuple, Optional, Dict, Any, Callable
+from lazy import lazy_import
+from results_store import (
+    RESULTS_PATH, RESULTS_LOG_PATH, append_record, compact_results, read_results,
+    results_download_path, rewrite_results,
+)
+import tickets_db
+import mt_cache
+import analytics
+import edit_distance
+import tm
+import glossary
+import mt_backends
+import perf
+import storage
+from perf import timed
+from tickets_db import TIX_PATH, get_ticket, my_tickets, open_tickets
+
+pd = lazy_import("pandas")  # imported on first use, not at page load
+log = logging.getLogger(__name__)
+perf.serve_metrics()  # no-op unless EDUAPP_METRICS_PORT is set
 
 # ------------- Config / Secrets -------------
 def _get_secret(name: str, default: str = "") -> str:
@@ -29,14 +50,45 @@ def _get_secret(name: str, default: str = "") -> str:
         pass
     return os.getenv(name, default).strip()
 
-OPENAI_API_KEY = _get_secret("OPENAI_API_KEY", "")
+# Secrets are resolved on first access (reading st.secrets imports streamlit and
+# parses secrets.toml), then cached as ordinary module attributes.
+_LAZY_SECRETS = {
+    "OPENAI_API_KEY": "",
+    "OPENAI_BASE_URL": "",  # optional: OpenAI-compatible server
+}
+
+def __getattr__(name: str) -> str:
+    if name in _LAZY_SECRETS:
+        val = _get_secret(name, _LAZY_SECRETS[name])
+        globals()[name] = val
+        return val
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _setting(name: str) -> str:
+    """Lazily resolved secret (see __getattr__)."""
+    return globals()[name] if name in globals() else __getattr__(name)
+
+DEFAULT_SYSTEM_PROMPT = "You are a professional Arabic↔English translator. Preserve meaning and tone."
 
 # ------------- OpenAI (lazy import) -------------
+# One client per process, shared by every session (the SDK client is thread-safe) and
+# keyed by (pid, api key, base url). A forked worker builds its own instead of using
+# the parent's sockets, and a changed key or endpoint gets a fresh client.
+_openai_client: Optional[Tuple[Tuple[int, str, str], Any]] = None
+_openai_client_lock = threading.Lock()
+
+@timed("utils_mt._get_openai_client")
 def _get_openai_client() -> Tuple[Optional[Any], Optional[str]]:
     """
     Lazy-import OpenAI so pages like Admin can load even if the lib isn't installed yet.
-    Returns (client, error_message).
+    The client and its keep-alive HTTP connection pool are built once per process and
+    reused by every call. Returns (client, error_message).
     """
+    global _openai_client
+    ident = (os.getpid(), _setting("OPENAI_API_KEY"), _setting("OPENAI_BASE_URL"))
+    cached = _openai_client
+    if cached is not None and cached[0] == ident:
+        return cached[1], None
     try:
         from openai import OpenAI  # type: ignore
     except Exception as e:
@@ -45,53 +97,145 @@ def _get_openai_client() -> Tuple[Optional[Any], Optional[str]]:
             "and reboot the app. Details: %s]" % e
         )
     try:
-        if not OPENAI_API_KEY:
+        if not ident[1]:
             return None, "[OpenAI key missing: add OPENAI_API_KEY in Streamlit Secrets]"
-        client = OpenAI(api_key=OPENAI_API_KEY)
-        return client, None
+        with _openai_client_lock:
+            cached = _openai_client
+            if cached is None or cached[0] != ident:
+                # The old client is dropped, not closed: another session may still be using it
+                _openai_client = cached = (ident, OpenAI(api_key=ident[1], base_url=ident[2] or None))
+        return cached[1], None
     except Exception as e:
         return None, f"[OpenAI init error: {e}]"
 
+def glossary_hint(terms: str, text: Optional[str] = None) -> str:
+    """
+    System-prompt suffix for comma-separated "source=target" terminology hints.
+    With `text`, only the course glossary and `terms` entries that occur in it are included.
+    """
+    if text is not None:
+        return glossary.hint(glossary.match(text, terms))
+    if terms:
+        kv = [t.strip() for t in terms.split(",") if "=" in t]
+        if kv:
+            return "\nUse these terminology mappings: " + "; ".join(kv)
+    return ""
+
+def glossary_check(text: str, output: str, terms: str = "") -> Dict[str, Any]:
+    """Glossary compliance of `output`: expected/used counts, missing entries and the used ratio."""
+    return glossary.check(output, glossary.match(text, terms))
+
+@timed("utils_mt.mt_openai")
 def mt_openai(
     text: str,
-    system_prompt: str = "You are a professional Arabic↔English translator. Preserve meaning and tone.",
+    system_prompt: str = DEFAULT_SYSTEM_PROMPT,
     terms: str = "",
     model: str = "gpt-4o-mini",
+    use_cache: bool = True,
+    use_tm: bool = False,
+    backend: Optional[str] = None,
+    on_source: Optional[Callable[[str], None]] = None,
 ) -> str:
     """
-    Deterministic translation via OpenAI Chat Completions.
-    - terms: comma-separated "source=target" glossary hints (optional)
+    Deterministic translation via OpenAI Chat Completions (or another MT backend).
+    - terms: comma-separated "source=target" glossary hints (optional); these and the course
+      glossary (glossary.py) are injected only for entries that occur in `text`
+    - use_cache: serve identical (model, prompt, glossary, text) requests from data/mt_cache.db
+      and store new outputs there; False neither reads nor writes the cache
+    - use_tm: return an exact translation-memory match of an approved reference without
+      calling the API, and add close matches (>= TM_FUZZY_MIN similarity) to the prompt as
+      examples. Students' post-edits are only ever used as examples, never served as the output.
+    - backend: "openai", "marian", "echo" (see mt_backends.py); default EDUAPP_MT_BACKEND.
+      If it fails, the EDUAPP_MT_FALLBACK backends are tried in order.
+    - on_source(name) is called with where the output came from: "tm" or the backend name
     """
-    # Build glossary hint
-    gloss = ""
-    if terms:
-        kv = [t.strip() for t in terms.split(",") if "=" in t]
-        if kv:
-            gloss = "\nUse these terminology mappings: " + "; ".join(kv)
+    report = on_source or (lambda _: None)
+    gloss = glossary_hint(terms, text)
+    if use_tm:
+        ensure_tm()
+        hit = tm.exact(text)
+        if hit is not None and hit.origin == "reference":
+            report("tm")
+            return hit.target
+        gloss += tm.examples_hint(tm.lookup(text))
 
-    client, err = _get_openai_client()
-    if err:
-        return err
+    name = (backend or mt_backends.DEFAULT_BACKEND).lower()
+    cacheable = mt_backends.get_backend(name).cacheable
+    # OpenAI keeps the bare model name so existing cache entries stay valid
+    cache_model = model if name == "openai" else f"{name}:{model}"
+    key = mt_cache.fingerprint(cache_model, system_prompt + gloss, text)
+    if use_cache and cacheable:
+        cached = mt_cache.get(key)
+        if cached is not None:
+            report(name)
+            return cached
+    elif not use_cache:
+        mt_cache.record_bypass()
 
-    try:
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt + gloss},
-                {"role": "user", "content": text},
-            ],
-            temperature=0,
-        )
-        return resp.choices[0].message.content.strip()
-    except Exception as e:
-        return f"[OpenAI error: {e}]"
+    used = []
+    out = mt_backends.translate_with_fallback([text], system_prompt + gloss, model, name, used.append)[0]
+    # Errors and fallback outputs are never cached under this backend's key
+    if use_cache and used == [name] and cacheable:
+        mt_cache.put(key, cache_model, out)
+    report(used[-1] if used else name)
+    return out
+
+# ------------- Loader cache -------------
+# Streamlit re-executes every page on each widget interaction. Loaders below return
+# a cached DataFrame until the underlying file's (mtime, size) signature changes;
+# writers in this module also invalidate explicitly.
+_frame_cache: Dict[Tuple[Any, ...], Tuple[Any, pd.DataFrame]] = {}
+_frame_cache_lock = threading.Lock()
+
+def _file_sig(*paths: str) -> Tuple[Any, ...]:
+    """(mtime_ns, size) for each path; None for missing files."""
+    sig = []
+    for p in paths:
+        try:
+            s = os.stat(p)
+            sig.append((s.st_mtime_ns, s.st_size))
+        except OSError:
+            sig.append(None)
+    return tuple(sig)
+
+def _cached_frame(key: Tuple[Any, ...], sig: Tuple[Any, ...], load) -> pd.DataFrame:
+    """Return a copy of the cached frame for `key`, reloading only when `sig` changed."""
+    with _frame_cache_lock:
+        hit = _frame_cache.get(key)
+    if hit is None or hit[0] != sig:
+        perf.count("frame_cache_miss")
+        df = load()
+        with _frame_cache_lock:
+            _frame_cache[key] = (sig, df)
+    else:
+        perf.count("frame_cache_hit")
+        df = hit[1]
+    return df.copy()
+
+def invalidate_cache(path: Optional[str] = None):
+    """Drop cached frames for `path` (or everything)."""
+    with _frame_cache_lock:
+        for k in [k for k in _frame_cache if path is None or k[1] == path]:
+            del _frame_cache[k]
+
+@timed("utils_mt.preview_csv")
+def preview_csv(path: str, n: int = 50) -> pd.DataFrame:
+    """First `n` rows of a CSV without parsing the rest of the file."""
+    def _load():
+        try:
+            return pd.read_csv(path, nrows=n)
+        except Exception:
+            return pd.DataFrame()
+    return _cached_frame(("head", path, n), _file_sig(path), _load)
 
 # ------------- Pairs dataset (for MT Lab) -------------
-SAMPLE_PAIRS_PATH = "data/sample_pairs.csv"
+SAMPLE_PAIRS_PATH = storage.data_path("sample_pairs.csv")
 
 def ensure_sample_pairs():
     """Create a small demo dataset if it doesn't exist."""
-    os.makedirs("data", exist_ok=True)
+    if os.path.exists(SAMPLE_PAIRS_PATH):
+        return
+    storage.ensure_root()
     if not os.path.exists(SAMPLE_PAIRS_PATH):
         df = pd.DataFrame([
             {"id":1,"source":"Please submit your application before the deadline.",
@@ -101,43 +245,90 @@ def ensure_sample_pairs():
             {"id":3,"source":"The museum will extend its opening hours during the festival.",
              "reference":"سيُمدد المتحف ساعات عمله خلال المهرجان.","src_lang":"en","tgt_lang":"ar"},
         ])
-        df.to_csv(SAMPLE_PAIRS_PATH, index=False)
+        # Atomic, so a worker reading the file while another creates it never sees half of it
+        storage.atomic_write(SAMPLE_PAIRS_PATH, lambda tmp: df.to_csv(tmp, index=False))
+        invalidate_cache(SAMPLE_PAIRS_PATH)
 
+@timed("utils_mt.load_pairs")
 def load_pairs(csv_path: str = SAMPLE_PAIRS_PATH) -> pd.DataFrame:
-    """Load pairs CSV with safe fallback columns."""
-    try:
-        return pd.read_csv(csv_path)
-    except Exception:
-        return pd.DataFrame(columns=["id","source","reference","src_lang","tgt_lang"])
+    """Load pairs CSV with safe fallback columns (cached until the file changes)."""
+    def _load():
+        try:
+            return pd.read_csv(csv_path)
+        except Exception:
+            return pd.DataFrame(columns=["id","source","reference","src_lang","tgt_lang"])
+    return _cached_frame(("csv", csv_path), _file_sig(csv_path), _load)
 
 # ------------- Tickets (assignments) -------------
-TIX_PATH = "data/tickets.csv"
-
+# Stored in SQLite (see tickets_db.py); data/tickets.csv is imported on first use.
 def ensure_tickets_file():
-    """Ensure tickets.csv exists with proper header."""
-    os.makedirs("data", exist_ok=True)
-    if not os.path.exists(TIX_PATH):
-        pd.DataFrame(columns=[
-            "ticket_id","source","reference","src_lang","tgt_lang",
-            "assigned_to","due_date","status","points"
-        ]).to_csv(TIX_PATH, index=False)
+    """Ensure the tickets table exists (importing tickets.csv the first time)."""
+    storage.ensure_root()
+    tickets_db.init_db()
 
+@timed("utils_mt.load_tickets")
 def load_tickets() -> pd.DataFrame:
-    """Load tickets with safe fallback."""
-    ensure_tickets_file()
-    try:
-        return pd.read_csv(TIX_PATH)
-    except Exception:
-        return pd.DataFrame(columns=[
-            "ticket_id","source","reference","src_lang","tgt_lang",
-            "assigned_to","due_date","status","points"
-        ])
+    """Load tickets with safe fallback (cached until the database changes)."""
+    def _load():
+        try:
+            return tickets_db.load_all()
+        except Exception:
+            return pd.DataFrame(columns=tickets_db.TICKET_COLUMNS)
+    # WAL mode: commits land in the -wal file first, so both files make up the signature
+    db = tickets_db.DB_PATH
+    return _cached_frame(("db", db), _file_sig(db, db + "-wal"), _load)
 
+@timed("utils_mt.save_tickets")
 def save_tickets(df: pd.DataFrame):
-    """Persist current tickets table."""
-    os.makedirs("data", exist_ok=True)
-    df.to_csv(TIX_PATH, index=False)
+    """Persist current tickets table (replaces all rows in one transaction)."""
+    tickets_db.replace_all(df)
+    invalidate_cache(tickets_db.DB_PATH)
+    analytics.refresh_ticket_stats()
+
+@timed("utils_mt.claim_ticket")
+def claim_ticket(ticket_id: str, student: str) -> bool:
+    """Atomically claim an unassigned ticket; False if someone else got it first."""
+    ok = tickets_db.claim_ticket(ticket_id, student)
+    invalidate_cache(tickets_db.DB_PATH)
+    if ok:
+        analytics.refresh_ticket_stats([student])
+    return ok
+
+@timed("utils_mt.set_ticket_status")
+def set_ticket_status(ticket_id: str, status: str, student: Optional[str] = None) -> bool:
+    """Row-level status update, e.g. 'submitted' after a student saves."""
+    ok = tickets_db.set_status(ticket_id, status, student)
+    invalidate_cache(tickets_db.DB_PATH)
+    if ok:
+        owner = student or (get_ticket(ticket_id) or {}).get("assigned_to")
+        analytics.refresh_ticket_stats([owner] if owner else [])
+    return ok
+
+@timed("utils_mt.import_tickets")
+def import_tickets(df: pd.DataFrame, replace: bool = False) -> Dict[str, Any]:
+    """
+    Validate, de-duplicate and merge many tickets in one transaction (see tickets_db.upsert_tickets).
+    Returns counts of inserted/updated/deleted rows and any validation problems.
+    """
+    result = tickets_db.upsert_tickets(df, replace=replace)
+    invalidate_cache(tickets_db.DB_PATH)
+    analytics.refresh_ticket_stats()
+    return result
+
+@timed("utils_mt.auto_assign_tickets")
+def auto_assign_tickets(roster) -> Dict[str, int]:
+    """Spread unassigned open tickets across `roster`, balancing point totals."""
+    loads = tickets_db.auto_assign(roster)
+    invalidate_cache(tickets_db.DB_PATH)
+    analytics.refresh_ticket_stats(loads.keys())
+    return loads
+
+@timed("utils_mt.tickets_csv_bytes")
+def tickets_csv_bytes() -> bytes:
+    """Current tickets as CSV for download buttons."""
+    return tickets_db.export_csv()
 
+@timed("utils_mt.add_ticket")
 def add_ticket(
     ticket_id: str,
     source: str,
@@ -151,9 +342,9 @@ def add_ticket(
 ):
     """
     Append a single ticket (used by Admin 'paste ticket' form).
+    An existing ticket with the same ID is overwritten.
     """
-    df = load_tickets()
-    new = {
+    tickets_db.insert_ticket({
         "ticket_id": ticket_id,
         "source": source,
         "reference": reference,
@@ -163,25 +354,86 @@ def add_ticket(
         "due_date": due_date,
         "status": status,
         "points": points,
-    }
-    df = pd.concat([df, pd.DataFrame([new])], ignore_index=True)
-    save_tickets(df)
+    })
+    invalidate_cache(tickets_db.DB_PATH)
+    analytics.refresh_ticket_stats()  # an overwrite may have changed the assignee
 
 # ------------- Results logging (research exports) -------------
-RESULTS_PATH = "data/results.csv"
-
+@timed("utils_mt.append_result")
 def append_result(row: Dict[str, Any]):
     """
-    Append a submission row to results.csv.
+    Append a submission row to the results log (compacted into results.csv on demand).
     Expected keys (flexible): timestamp, student, mode, item_id/ticket_id, source, reference,
-    mt_output, post_edit, terms, system_prompt, metric_*.
+    mt_output, mt_source ("tm" or the MT backend), post_edit, terms, system_prompt, metric_*.
+    Post-edit effort (metric_pe_*) is added when both mt_output and post_edit are present.
     """
-    os.makedirs("data", exist_ok=True)
+    storage.ensure_root()
     r = dict(row)
     r.setdefault("timestamp", int(time.time()))
-    try:
-        df = pd.read_csv(RESULTS_PATH)
-    except Exception:
-        df = pd.DataFrame()
-    df = pd.concat([df, pd.DataFrame([r])], ignore_index=True)
-    df.to_csv(RESULTS_PATH, index=False)
+    if r.get("mt_output") is not None and r.get("post_edit") is not None:
+        for k, v in edit_distance.pe_columns(r["mt_output"], r["post_edit"]).items():
+            r.setdefault(k, v)
+    append_record(r)
+    invalidate_cache(RESULTS_PATH)
+    analytics.record_submission(r)
+    if r.get("source") and r.get("post_edit"):
+        try:
+            tm.add(str(r["source"]), str(r["post_edit"]), origin="post_edit")
+        except Exception as e:  # the row is already saved; a busy tm.db must not fail the submit
+            perf.count("tm_add_error")
+            log.warning("tm.add failed: %s", e)
+
+@timed("utils_mt.load_results")
+def load_results() -> pd.DataFrame:
+    """All results (compacted CSV + pending log), cached until either file changes."""
+    return _cached_frame(("csv", RESULTS_PATH), _file_sig(RESULTS_PATH, RESULTS_LOG_PATH), read_results)
+
+def backfill_pe_metrics(overwrite: bool = False) -> int:
+    """Compute metric_pe_* for every stored submission that lacks them; returns rows computed."""
+    done = [0]
+    def _fill(df):
+        done[0] += edit_distance.add_pe_columns(df, overwrite=overwrite)
+        return df
+    rewrite_results(_fill)
+    invalidate_cache(RESULTS_PATH)
+    if done[0]:
+        rebuild_aggregates()
+    return done[0]
+
+def rebuild_aggregates():
+    """Recompute the Dashboard's materialized aggregates from all results and tickets."""
+    analytics.rebuild_all(load_results())
+
+def warm_reference_cache(lang: str = "en"):
+    """
+    Queue every reference in the pairs file and the tickets table for BERTScore
+    reference-embedding caching (emb_cache.py). Returns (future, reference count);
+    the future resolves to the number of newly encoded references.
+    """
+    from scoring_queue import warm_references
+    refs = load_pairs().get("reference", pd.Series(dtype=str)).dropna().astype(str).tolist()
+    refs += load_tickets().get("reference", pd.Series(dtype=str)).dropna().astype(str).tolist()
+    refs = [r for r in dict.fromkeys(refs) if r.strip()]
+    return warm_references(refs, lang), len(refs)
+
+# ------------- Translation memory -------------
+# data/tm.db, seeded from sample_pairs references and every submitted post-edit (see tm.py).
+def ensure_tm():
+    """Build the translation memory the first time it is needed."""
+    if tm.is_built():
+        return
+    tm.import_frame(load_pairs(), "source", "reference", origin="reference")
+    results = load_results()
+    if not results.empty:
+        tm.import_frame(results, "source", "post_edit", origin="post_edit")
+    tm.mark_built()
+
+def rebuild_tm():
+    """Re-import the translation memory from the current pairs and results."""
+    tm.clear()
+    ensure_tm()
+
+def tm_suggestions(text: str, k: int = 3):
+    """Close translation-memory matches for `text` (list of tm.Match)."""
+    ensure_tm()
+    return tm.lookup(text, k=k)